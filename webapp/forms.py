@@ -1,4 +1,5 @@
 from django import forms
+from django.core.validators import FileExtensionValidator
 from .models import Document
 
 class DocumentUploadForm(forms.ModelForm):
@@ -20,3 +21,40 @@ class DocumentUploadForm(forms.ModelForm):
                 "class": "form-control"
             }),
         }
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput(attrs={"class": "form-control", "accept": ".pdf"}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)] if data else []
+
+
+class BulkUploadForm(forms.Form):
+    files = MultipleFileField(required=False, label="PDF files")
+    archive = forms.FileField(
+        required=False,
+        label="or a ZIP archive of PDFs",
+        validators=[FileExtensionValidator(["zip"])],
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".zip"}),
+    )
+    shared = forms.BooleanField(
+        required=False,
+        label="Make these documents public",
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"})
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        if not cleaned.get("files") and not cleaned.get("archive"):
+            raise forms.ValidationError("Choose PDF files or a ZIP archive.")
+        return cleaned
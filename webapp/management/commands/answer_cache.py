@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from webapp.models import AnswerCacheEntry
+from webapp.services.answer_cache import answer_cache
+
+
+class Command(BaseCommand):
+    help = "Report on the semantic answer cache, purge expired answers, or clear it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["stats", "purge", "clear"])
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        if action == "stats":
+            totals = AnswerCacheEntry.objects.aggregate(entries=Count("id"), hits=Sum("hits"))
+            entries, hits = totals["entries"], totals["hits"] or 0
+            # Each entry was created by one miss, so served/(served + entries) is the hit rate.
+            rate = hits / (hits + entries) if entries else 0.0
+            self.stdout.write(f"Entries: {entries}")
+            self.stdout.write(f"Answers served from cache: {hits}")
+            self.stdout.write(f"Hit rate over cached questions: {rate:.2%}")
+            return
+
+        if action == "purge":
+            deleted = answer_cache.purge_expired()
+            self.stdout.write(f"Deleted {deleted} answers older than {answer_cache.ttl}s.")
+            return
+
+        deleted, _ = AnswerCacheEntry.objects.all().delete()
+        self.stdout.write(f"Deleted {deleted} cached answers.")
@@ -0,0 +1,57 @@
+import asyncio
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from webapp.services.chat_service import ChatService
+from webapp.services.fakes import CannedChatModel, StaticRetriever, sample_chunks
+
+
+class BenchChatService(ChatService):
+    async def alog_query(self, email, question, sources):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve many concurrent chats from one event loop through "
+        "ChatService.aget_response, with a fake LLM and retriever that await "
+        "simulated network latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 50, 200, 500])
+        parser.add_argument("--llm-latency", type=float, default=0.5)
+        parser.add_argument("--retrieval-latency", type=float, default=0.05)
+
+    def handle(self, *args, **options):
+        service = BenchChatService(
+            llm=CannedChatModel(latency=options["llm_latency"]),
+            retriever=StaticRetriever(documents=sample_chunks(), latency=options["retrieval_latency"]),
+        )
+        history = [
+            {"role": "user", "content": "Who are the parties?"},
+            {"role": "assistant", "content": "Apex Corporation and GreenTech."},
+        ]
+
+        self.stdout.write(f"{'chats':>6} {'wall s':>8} {'mean s':>8} {'p95 s':>8} {'chats/s':>8} {'threads':>8}")
+        for concurrency in options["concurrency"]:
+            wall, latencies, threads = asyncio.run(self._run(service, concurrency, history))
+            p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+            self.stdout.write(
+                f"{concurrency:>6} {wall:>8.2f} {statistics.mean(latencies):>8.2f} {p95:>8.2f} "
+                f"{concurrency / wall:>8.1f} {threads:>8}"
+            )
+
+    async def _run(self, service, concurrency, history):
+        async def one(i):
+            start = time.perf_counter()
+            answer, _, _ = await service.aget_response(f"user{i}@example.com", "What is the notice period?", history)
+            assert not answer.startswith("Sorry"), answer
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        return time.perf_counter() - start, latencies, threading.active_count()
@@ -0,0 +1,110 @@
+import asyncio
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from webapp.models import Conversation
+from webapp.services import conversations
+from webapp.services.chat_service import ChatService
+from webapp.services.fakes import CannedChatModel, StaticRetriever, sample_chunks
+
+CONVERSATION = [
+    "Who are the parties to the Acme supply agreement?",
+    "What is the termination notice period in the Acme supply agreement?",
+    "Can it be shortened?",
+    "What does the confidentiality clause of the Acme supply agreement cover?",
+    "How long does that obligation last after termination?",
+    "Which law governs the Acme supply agreement?",
+    "And the jurisdiction?",
+    "What are the payment terms in the Acme supply agreement?",
+    "What happens if they are late?",
+    "Is liability for indirect loss excluded in the Acme supply agreement?",
+    "Summarize the indemnity clause of the Acme supply agreement.",
+    "Does it cover third party claims?",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-turn latency, LLM calls and prompt tokens of a scripted multi-turn chat, "
+        "condensing every follow-up ('always') versus condensing only when needed in "
+        "parallel with retrieval over a rolling summary ('auto'). History is loaded, stored and "
+        "compacted in the conversation tables as the chat views do. Uses a fake LLM and retriever; "
+        "the benchmark conversations are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--llm-latency", type=float, default=0.4)
+        parser.add_argument("--token-latency", type=float, default=0.0)
+        parser.add_argument("--retrieval-latency", type=float, default=0.15)
+        parser.add_argument("--turns", type=int, default=len(CONVERSATION))
+
+    def handle(self, *args, **options):
+        turns = (CONVERSATION * (options["turns"] // len(CONVERSATION) + 1))[:options["turns"]]
+        self.stdout.write(
+            f"{len(turns)} turns, LLM latency {options['llm_latency']}s, "
+            f"retrieval latency {options['retrieval_latency']}s (tokens ~ chars / 4)"
+        )
+        self.stdout.write(
+            f"{'mode':>7} {'mean s':>7} {'p95 s':>7} {'calls/turn':>11} "
+            f"{'prompt tok/turn':>16} {'summary calls':>14} {'summary s':>10}"
+        )
+        for mode in ("always", "auto"):
+            row = asyncio.run(self._run(mode, turns, options))
+            self.stdout.write(
+                f"{mode:>7} {row['mean']:>7.3f} {row['p95']:>7.3f} {row['calls']:>11.2f} "
+                f"{row['tokens']:>16.0f} {row['summary_calls']:>14} {row['summary_s']:>10.2f}"
+            )
+
+    async def _run(self, mode, turns, options):
+        llm = CannedChatModel(
+            latency=options["llm_latency"],
+            token_latency=options["token_latency"],
+            response="Either party may terminate the Acme supply agreement with 30 days written notice, "
+                     "subject to the cure period in clause 12.",
+        )
+        service = ChatService(
+            llm=llm,
+            retriever=StaticRetriever(documents=sample_chunks(), latency=options["retrieval_latency"]),
+            condense_mode=mode,
+        )
+
+        user, _ = await User.objects.aget_or_create(
+            username="bench_chat_condense", defaults={"email": "bench@example.com"}
+        )
+        conversation = await Conversation.objects.acreate(user=user)
+        latencies, answer_calls = [], 0
+        summary_calls, summary_seconds = 0, 0.0
+        try:
+            for question in turns:
+                calls_before = llm.calls
+                start = time.perf_counter()
+                summary, history = await conversations.aload_history(conversation)
+                answer, _, sources = await service.aget_response(
+                    user.email, question, history, summary=summary
+                )
+                latencies.append(time.perf_counter() - start)
+                answer_calls += llm.calls - calls_before
+                assert not answer.startswith("Sorry"), answer
+
+                # What the views' remember_turn does once the answer is sent.
+                await conversations.aappend_turn(conversation, question, answer, sources)
+                if mode != "always":
+                    calls_before = llm.calls
+                    start = time.perf_counter()
+                    await conversations.acompact(conversation, service.asummarize)
+                    summary_seconds += time.perf_counter() - start
+                    summary_calls += llm.calls - calls_before
+        finally:
+            await Conversation.objects.filter(pk=conversation.pk).adelete()
+
+        return {
+            "mean": statistics.mean(latencies),
+            "p95": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+            "calls": answer_calls / len(turns),
+            "tokens": llm.prompt_chars / 4 / len(turns),
+            "summary_calls": summary_calls,
+            "summary_s": summary_seconds,
+        }
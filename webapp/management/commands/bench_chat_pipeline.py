@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from langchain.chains import ConversationalRetrievalChain
+from langchain.memory import ConversationBufferMemory
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from webapp.services.chat_service import ChatService
+from webapp.services.fakes import StaticRetriever, sample_chunks
+from webapp.services.retrieval import retrieval_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-request overhead of building the retrieval chain for every message "
+        "versus reusing one shared chain, with a stubbed LLM and retriever."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--history", type=int, default=10, help="Prior messages per request.")
+
+    def handle(self, *args, **options):
+        llm = FakeListChatModel(responses=["Standalone question?", "Thirty days notice is required."])
+        retriever = StaticRetriever(documents=sample_chunks())
+        service = ChatService(llm=llm, retriever=retriever)
+        history = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i}"}
+            for i in range(options["history"])
+        ]
+
+        def per_request():
+            memory = ConversationBufferMemory(
+                memory_key="chat_history", return_messages=True, output_key="answer"
+            )
+            memory.chat_memory.add_messages([
+                HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+                for m in history
+            ])
+            chain = ConversationalRetrievalChain.from_llm(
+                llm=llm,
+                retriever=retriever,
+                memory=memory,
+                return_source_documents=True,
+                combine_docs_chain_kwargs={"prompt": service.PROMPT},
+            )
+            return chain.invoke({"question": "What is the termination notice?"})
+
+        def shared():
+            with retrieval_user("bench@example.com"):
+                return service.qa_chain.invoke({
+                    "question": "What is the termination notice?",
+                    "chat_history": service._to_messages(history),
+                })
+
+        before = self._time(per_request, options["requests"])
+        after = self._time(shared, options["requests"])
+        self.stdout.write(f"{'pipeline':>12} {'mean ms':>9} {'p95 ms':>9}")
+        for label, samples in (("per-request", before), ("shared", after)):
+            p95 = sorted(samples)[int(0.95 * (len(samples) - 1))]
+            self.stdout.write(f"{label:>12} {statistics.mean(samples):>9.3f} {p95:>9.3f}")
+        self.stdout.write(f"Saved {statistics.mean(before) - statistics.mean(after):.3f} ms per request.")
+
+    @staticmethod
+    def _time(run, count):
+        run()  # warm up
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
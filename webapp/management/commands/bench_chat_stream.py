@@ -0,0 +1,55 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from webapp.services.chat_service import ChatService
+from webapp.services.fakes import StaticRetriever, sample_chunks
+
+ANSWER = (
+    "Either party may terminate the agreement by giving thirty days written notice, "
+    "as set out in Section 12.1 of the master services agreement."
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time to first byte of the streamed chat answer versus waiting for the "
+        "full answer, with a fake LLM that emits one character every --token-delay seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--token-delay", type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        llm = FakeListChatModel(responses=[ANSWER], sleep=options["token_delay"])
+        service = ChatService(llm=llm, retriever=StaticRetriever(documents=sample_chunks()))
+        results = asyncio.run(self._run(service, options["runs"]))
+
+        self.stdout.write(f"{'mode':>10} {'first byte ms':>14} {'complete ms':>12}")
+        for mode, (first, complete) in results.items():
+            self.stdout.write(f"{mode:>10} {statistics.mean(first):>14.1f} {statistics.mean(complete):>12.1f}")
+
+    async def _run(self, service, runs):
+        results = {"blocking": ([], []), "streaming": ([], [])}
+        for _ in range(runs):
+            start = time.perf_counter()
+            answer = ""
+            async for event in service.astream_answer("bench@example.com", "What is the notice period?", []):
+                if event["type"] == "token" and not answer:
+                    results["streaming"][0].append((time.perf_counter() - start) * 1000)
+                if event["type"] == "token":
+                    answer += event["text"]
+            results["streaming"][1].append((time.perf_counter() - start) * 1000)
+
+            # Blocking: nothing can be sent until the whole answer exists.
+            start = time.perf_counter()
+            async for _event in service.astream_answer("bench@example.com", "What is the notice period?", []):
+                pass
+            elapsed = (time.perf_counter() - start) * 1000
+            results["blocking"][0].append(elapsed)
+            results["blocking"][1].append(elapsed)
+        return results
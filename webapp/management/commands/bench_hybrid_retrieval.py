@@ -0,0 +1,140 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from webapp.services.retrieval import TEXT_SEARCH_CONFIG, hybrid_search_sql, vector_literal
+from webapp.services.vector_index import apply_search_params, build_index_sql
+
+TABLE = "bench_hybrid_retrieval"
+
+TOPICS = {
+    "termination": "may terminate this agreement on ninety days written notice",
+    "confidentiality": "must keep all confidential information secret and not disclose it",
+    "indemnity": "shall indemnify and hold harmless the other party against all claims",
+    "payment": "shall pay every invoice within thirty days of receipt",
+    "liability": "is not liable for indirect or consequential loss",
+    "governing law": "agrees the agreement is governed by the laws of England",
+}
+PARTIES = [
+    "Acme Holdings", "Borealis Capital", "Cobalt Logistics", "Dunmore Estates", "Everline Media",
+    "Foxglove Pharma", "Granite Works", "Harbour Freight", "Ivory Systems", "Juniper Energy",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Hit rate, MRR and latency of vector-only, full-text-only and hybrid (RRF) "
+        "retrieval on a synthetic contract corpus, in a scratch table dropped afterwards. "
+        "Chunk vectors only encode the clause topic, like an embedding that cannot "
+        "tell section numbers or party names apart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--dimensions", type=int, default=256)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=4)
+        parser.add_argument("--candidates", type=int, default=20)
+        parser.add_argument("--rrf-k", type=int, default=60)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        dims, k = options["dimensions"], options["k"]
+        centroids = {topic: [rng.gauss(0, 1) for _ in range(dims)] for topic in TOPICS}
+
+        def embed(topic):
+            return [c + rng.gauss(0, 0.3) for c in centroids[topic]]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(
+                f"""
+                CREATE TABLE {TABLE} (
+                    id text PRIMARY KEY,
+                    content text NOT NULL,
+                    metadata jsonb NOT NULL DEFAULT '{{}}',
+                    document_id text NOT NULL,
+                    embedding vector({dims}),
+                    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', content)) STORED
+                )
+                """
+            )
+        try:
+            chunks = self._load(rng, embed, options["rows"])
+            with connection.cursor() as cursor:
+                cursor.execute(build_index_sql("hnsw", name=f"{TABLE}_hnsw_idx", table=TABLE))
+                cursor.execute(f"CREATE INDEX {TABLE}_gin_idx ON {TABLE} USING gin (search_vector)")
+                cursor.execute(f"ANALYZE {TABLE}")
+
+            queries = []
+            for chunk_id, topic, section, party in rng.sample(chunks, min(options["queries"], len(chunks))):
+                question = f"What does section {section} say about {topic} for {party}?"
+                queries.append((chunk_id, question, embed(topic)))
+
+            self.stdout.write(f"{len(chunks)} chunks x {dims} dims, {len(queries)} queries, k={k}")
+            self.stdout.write(f"{'mode':>8} {'hit@k':>7} {'MRR':>7} {'avg ms':>8} {'p95 ms':>8}")
+            for mode in ("vector", "fulltext", "hybrid"):
+                hits, ranks, latencies = 0, [], []
+                for chunk_id, question, vector in queries:
+                    ids, ms = self._search(mode, question, vector, k, options)
+                    latencies.append(ms)
+                    if chunk_id in ids:
+                        hits += 1
+                        ranks.append(1 / (ids.index(chunk_id) + 1))
+                    else:
+                        ranks.append(0.0)
+                latencies.sort()
+                self.stdout.write(
+                    f"{mode:>8} {hits / len(queries):>7.3f} {statistics.mean(ranks):>7.3f} "
+                    f"{statistics.mean(latencies):>8.2f} {latencies[int(len(latencies) * 0.95) - 1]:>8.2f}"
+                )
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def _load(self, rng, embed, rows, batch=1000):
+        chunks = []
+        topics = list(TOPICS)
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, batch):
+                values = []
+                for i in range(offset, min(offset + batch, rows)):
+                    topic, party = rng.choice(topics), rng.choice(PARTIES)
+                    section = f"{i // 20 + 1}.{i % 20 + 1}"
+                    content = f"Section {section} ({topic.title()}). {party} {TOPICS[topic]}."
+                    chunk_id = f"chunk-{i}"
+                    chunks.append((chunk_id, topic, section, party))
+                    values.append((chunk_id, content, f"doc-{i // 50}", vector_literal(embed(topic))))
+                cursor.executemany(
+                    f"INSERT INTO {TABLE} (id, content, document_id, embedding) VALUES (%s, %s, %s, %s::vector)",
+                    values,
+                )
+        return chunks
+
+    def _search(self, mode, question, vector, k, options):
+        if mode == "vector":
+            sql = f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s::vector LIMIT %s"
+            params = [vector_literal(vector), k]
+        elif mode == "fulltext":
+            terms = "replace(plainto_tsquery(%s::regconfig, %s)::text, '&', '|')::tsquery"
+            sql = (
+                f"SELECT id FROM {TABLE} WHERE search_vector @@ {terms} "
+                f"ORDER BY ts_rank_cd(search_vector, {terms}) DESC LIMIT %s"
+            )
+            params = [TEXT_SEARCH_CONFIG, question, TEXT_SEARCH_CONFIG, question, k]
+        else:
+            sql, params = hybrid_search_sql(
+                vector, question, k, candidates=options["candidates"], rrf_k=options["rrf_k"], table=TABLE,
+                vector_type="vector",
+            )
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            apply_search_params(cursor, ef_search=max(options["candidates"], 40))
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+            return ids, (time.perf_counter() - start) * 1000
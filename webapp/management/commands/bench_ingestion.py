@@ -0,0 +1,78 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from langchain_core.documents import Document as LCDocument
+
+from webapp.models import Document, Embedding
+from webapp.services.embeddings import store_chunks
+from webapp.services.fakes import FakeEmbeddings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-chunk embedding/insert against batched embed_documents + "
+        "bulk_create, using a stubbed embedding provider. All rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--latency", type=float, default=0.02,
+            help="Simulated provider round trip in seconds, per call.",
+        )
+        parser.add_argument(
+            "--per-item-latency", type=float, default=0.0005,
+            help="Simulated provider cost in seconds, per text.",
+        )
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(
+            username="bench_ingestion", defaults={"email": "bench@example.com"}
+        )
+
+        self.stdout.write(f"{'chunks':>8} {'per-chunk (s)':>14} {'batched (s)':>12} {'speedup':>8}")
+        for size in options["sizes"]:
+            chunks = [
+                LCDocument(page_content=f"Clause {i}. The parties agree to the terms set out in section {i}.")
+                for i in range(size)
+            ]
+            model = FakeEmbeddings(
+                latency=options["latency"], per_item_latency=options["per_item_latency"]
+            )
+
+            naive = self._timed(user, lambda doc: self._store_per_chunk(doc, chunks, model))
+            batched = self._timed(
+                user,
+                lambda doc: store_chunks(
+                    doc, chunks, batch_size=options["batch_size"], embedding_model=model
+                ),
+            )
+            self.stdout.write(
+                f"{size:>8} {naive:>14.3f} {batched:>12.3f} {naive / batched if batched else 0:>7.1f}x"
+            )
+
+    def _timed(self, user, run):
+        with transaction.atomic():
+            # bulk_create skips post_save, so the ingestion signal does not fire.
+            document = Document.objects.bulk_create(
+                [Document(user=user, title="Benchmark document", file="uploads/bench.pdf")]
+            )[0]
+            start = time.perf_counter()
+            run(document)
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed
+
+    @staticmethod
+    def _store_per_chunk(document, chunks, model):
+        """The previous ingestion loop: one provider call and one INSERT per chunk."""
+        for chunk in chunks:
+            Embedding.objects.create(
+                document=document,
+                content=chunk.page_content,
+                embedding=model.embed_query(chunk.page_content),
+                metadata={"document_id": str(document.id), "file_name": document.file.name},
+            )
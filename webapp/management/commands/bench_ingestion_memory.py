@@ -0,0 +1,101 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from webapp.models import Document
+from webapp.services.embeddings import iter_pdf_pages, store_chunks, store_document_embeddings
+from webapp.services.fakes import FakeEmbeddings, write_sample_pdf
+
+MODES = ("eager", "streaming")
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure peak RSS while ingesting synthetic PDFs, comparing the eager load-everything "
+        "pipeline with the streaming one. Each run happens in a fresh process, so one mode's "
+        "peak cannot hide the other's. All rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--batch-size", type=int, default=None)
+        # Internal: run a single mode on one PDF and print the result as JSON.
+        parser.add_argument("--run", choices=MODES, default=None, help="Run a single mode in this process.")
+        parser.add_argument("--pdf", default=None)
+
+    def handle(self, *args, **options):
+        if options["run"]:
+            self.stdout.write(json.dumps(self._run(options["run"], options["pdf"], options["batch_size"])))
+            return
+
+        self.stdout.write(
+            f"{'pages':>6} {'eager peak RSS (MiB)':>21} {'streaming peak RSS (MiB)':>25} "
+            f"{'baseline (MiB)':>15} {'streaming (s)':>14}"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for pages in options["pages"]:
+                path = write_sample_pdf(os.path.join(tmpdir, f"sample_{pages}.pdf"), pages)
+                eager = self._spawn("eager", path, options["batch_size"])
+                streaming = self._spawn("streaming", path, options["batch_size"])
+                self.stdout.write(
+                    f"{pages:>6} {eager['peak_rss'] / 2**20:>21.1f} {streaming['peak_rss'] / 2**20:>25.1f} "
+                    f"{streaming['baseline_rss'] / 2**20:>15.1f} {streaming['seconds']:>14.2f}"
+                )
+
+    def _spawn(self, mode, path, batch_size):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "bench_ingestion_memory",
+            "--run", mode, "--pdf", path,
+        ]
+        if batch_size:
+            command += ["--batch-size", str(batch_size)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def _run(self, mode, path, batch_size):
+        user, _ = User.objects.get_or_create(
+            username="bench_ingestion", defaults={"email": "bench@example.com"}
+        )
+        model = FakeEmbeddings()
+        with transaction.atomic():
+            # bulk_create skips post_save, so the ingestion signal does not fire.
+            document = Document.objects.bulk_create(
+                [Document(user=user, title="Benchmark document", file="uploads/bench.pdf")]
+            )[0]
+            baseline = peak_rss_bytes()
+            start = time.perf_counter()
+            try:
+                if mode == "eager":
+                    self._eager(document, path, model, batch_size)
+                else:
+                    store_document_embeddings(document, source=path, embedding_model=model, batch_size=batch_size)
+                elapsed = time.perf_counter() - start
+            finally:
+                transaction.set_rollback(True)
+        return {"mode": mode, "peak_rss": peak_rss_bytes(), "baseline_rss": baseline, "seconds": elapsed}
+
+    @staticmethod
+    def _eager(document, path, model, batch_size):
+        """The previous pipeline: whole file, every page and every chunk in memory before embedding."""
+        with open(path, "rb") as f:
+            content = f.read()
+        pages = list(iter_pdf_pages(document, content))
+        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+        chunks = splitter.split_documents(pages)
+        store_chunks(document, chunks, batch_size=batch_size, embedding_model=model)
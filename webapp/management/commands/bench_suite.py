@@ -0,0 +1,338 @@
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from langchain_core.documents import Document as LCDocument
+
+from webapp.models import Conversation, Document
+from webapp.services import conversations
+from webapp.services.chat_service import ChatService
+from webapp.services.embeddings import QUERY_EMBEDDING_MODEL, store_chunks
+from webapp.services.fakes import CheckOnlyFGAClient
+from webapp.services.fga_client import FGAService, fga_service
+from webapp.services.retrieval import build_authorized_retriever, viewable_document_ids
+
+SCENARIOS = ["ingestion", "authorization", "retrieval", "chat"]
+PARTIES = ["Acme Holdings", "Borealis Capital", "Cobalt Logistics", "Dunmore Estates", "Everline Media"]
+CLAUSES = [
+    "may terminate this agreement on ninety days written notice",
+    "must keep all confidential information secret",
+    "shall indemnify the other party against third party claims",
+    "shall pay every invoice within thirty days of receipt",
+    "is not liable for indirect or consequential loss",
+]
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline benchmark suite: ingestion throughput, authorization, retrieval latency "
+        "and end-to-end chat against the fake providers (EMBEDDING_PROVIDER=fake, "
+        "LLM_PROVIDER=fake, FGA_PROVIDER=memory). Results are written as JSON and can be "
+        "compared with a previous run. Benchmark users and documents are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument("--documents", type=int, default=20)
+        parser.add_argument("--chunks", type=int, default=50, help="Chunks per document.")
+        parser.add_argument("--shared", type=float, default=0.25, help="Fraction of documents made public.")
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--chats", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", default="bench-results.json")
+        parser.add_argument("--compare", default=None, help="Earlier JSON results to diff against.")
+
+    def handle(self, *args, **options):
+        providers = {
+            "embedding": settings.EMBEDDING_PROVIDER,
+            "llm": settings.LLM_PROVIDER,
+            "fga": settings.FGA_PROVIDER,
+        }
+        if providers != {"embedding": "fake", "llm": "fake", "fga": "memory"}:
+            raise CommandError(
+                "Run with EMBEDDING_PROVIDER=fake LLM_PROVIDER=fake FGA_PROVIDER=memory "
+                f"so results are deterministic (got {providers})."
+            )
+
+        self.rng = random.Random(options["seed"])
+        suffix = uuid.uuid4().hex[:8]
+        self.owner = User.objects.create(username=f"bench-owner-{suffix}", email=f"bench-owner-{suffix}@example.com")
+        self.reader = User.objects.create(username=f"bench-reader-{suffix}", email=f"bench-reader-{suffix}@example.com")
+
+        results = {}
+        try:
+            # Every scenario needs the corpus and its tuples, so both always run.
+            ingestion = self._ingestion(options)
+            authorization = self._authorization(options)
+            if "ingestion" in options["scenarios"]:
+                results["ingestion"] = ingestion
+            if "authorization" in options["scenarios"]:
+                results["authorization"] = authorization
+            if "retrieval" in options["scenarios"]:
+                results["retrieval"] = self._retrieval(options)
+            if "chat" in options["scenarios"]:
+                results["chat"] = asyncio.run(self._chat(options))
+        finally:
+            # Cascades to documents, embeddings and ACL mirror rows.
+            User.objects.filter(pk__in=[self.owner.pk, self.reader.pk]).delete()
+
+        report = {
+            "meta": {
+                "timestamp": timezone.now().isoformat(),
+                "git_commit": self._git_commit(),
+                "providers": providers,
+                "params": {key: options[key] for key in ("documents", "chunks", "shared", "queries", "chats", "seed")},
+            },
+            "results": results,
+        }
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(json.dumps(results, indent=2))
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options["compare"]:
+            self._compare(options["compare"], results)
+
+    # scenarios
+
+    def _ingestion(self, options):
+        self.documents = Document.objects.bulk_create([
+            # bulk_create skips post_save, so no ingestion job or FGA write is triggered.
+            Document(user=self.owner, title=f"Bench contract {i}", file=f"bench/contract-{i}.pdf")
+            for i in range(options["documents"])
+        ])
+        self.chunks = {}
+        for doc_number, document in enumerate(self.documents):
+            self.chunks[document.id] = [
+                LCDocument(page_content=(
+                    f"Section {doc_number}.{i}. {self.rng.choice(PARTIES)} {self.rng.choice(CLAUSES)} "
+                    f"under contract {doc_number}."
+                ))
+                for i in range(options["chunks"])
+            ]
+
+        start = time.perf_counter()
+        # The persistent embedding cache would make reruns measure cache lookups only.
+        with override_settings(EMBEDDING_CACHE_ENABLED=False):
+            stored = sum(
+                store_chunks(document, self.chunks[document.id])
+                for document in self.documents
+            )
+        elapsed = time.perf_counter() - start
+        return {
+            "chunks": stored,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(stored / elapsed, 1) if elapsed else None,
+        }
+
+    def _authorization(self, options):
+        shared_count = int(len(self.documents) * options["shared"])
+        self.public_ids = {document.id for document in self.documents[:shared_count]}
+
+        start = time.perf_counter()
+        for document in self.documents:
+            fga_service.add_relation(self.owner.email, document.id, relation="owner")
+            if document.id in self.public_ids:
+                fga_service.add_public_access(document.id)
+        write_seconds = time.perf_counter() - start
+        writes = len(self.documents) + len(self.public_ids)
+
+        def checks():
+            samples, allowed = [], 0
+            for document in self.documents:
+                start = time.perf_counter()
+                allowed += fga_service.check_relation(self.reader.email, document.id, relation="viewer")
+                samples.append(time.perf_counter() - start)
+            return samples, allowed
+
+        fga_service.decisions.clear()
+        cold, allowed = checks()
+        warm, _ = checks()
+
+        start = time.perf_counter()
+        listed = fga_service.list_accessible_documents(self.reader.email, relation="viewer")
+        list_seconds = time.perf_counter() - start
+
+        mirrored = set(
+            viewable_document_ids(self.reader.email)
+            .filter(document_id__in=[d.id for d in self.documents])
+            .values_list("document_id", flat=True)
+        )
+        return {
+            "tuple_writes": writes,
+            "write_ms_per_tuple": round(write_seconds / writes * 1000, 3),
+            "check_cold": latency_summary(cold),
+            "check_cached": latency_summary(warm),
+            "list_objects_ms": round(list_seconds * 1000, 3),
+            "reader_visible_fraction": round(allowed / len(self.documents), 4),
+            "mirror_matches_fga": mirrored == self.public_ids == set(listed) & {d.id for d in self.documents},
+        }
+
+    def _retrieval(self, options):
+        owner_queries = [
+            (document_id, chunk.page_content)
+            for document_id, chunks in self.chunks.items()
+            for chunk in chunks
+        ]
+        reader_queries = [(d, text) for d, text in owner_queries if d in self.public_ids]
+        results = {}
+        for label, email, pool, allowed in (
+            ("owner", self.owner.email, owner_queries, set(self.chunks)),
+            ("reader", self.reader.email, reader_queries, self.public_ids),
+        ):
+            if not pool:
+                continue
+            queries = self.rng.sample(pool, min(options["queries"], len(pool)))
+            for hybrid in (False, True):
+                QUERY_EMBEDDING_MODEL.cache.clear()
+                retriever = build_authorized_retriever(email, k=4, hybrid=hybrid, **self._search_params())
+                samples, hits, leaked = [], 0, 0
+                for _, text in queries:
+                    start = time.perf_counter()
+                    docs = retriever.invoke(text)
+                    samples.append(time.perf_counter() - start)
+                    hits += any(doc.page_content == text for doc in docs)
+                    leaked += sum(doc.metadata.get("document_id") not in allowed for doc in docs)
+                results[f"{label}_{'hybrid' if hybrid else 'vector'}"] = {
+                    **latency_summary(samples),
+                    "hit_rate": round(hits / len(queries), 4),
+                    "unauthorized_results": leaked,
+                }
+            results[f"{label}_async_checked"] = asyncio.run(self._async_checked(email, queries, allowed))
+        return results
+
+    async def _async_checked(self, email, queries, allowed):
+        """
+        The async path chat uses, with FGA decisions from a stub of the hosted
+        client (check() only), so the final per-document filter really runs.
+        """
+        QUERY_EMBEDDING_MODEL.cache.clear()
+        client = CheckOnlyFGAClient(fga_service.client)
+        retriever = build_authorized_retriever(email, k=4, fga=FGAService(client=client), **self._search_params())
+        samples, hits, leaked, returned = [], 0, 0, 0
+        for _, text in queries:
+            start = time.perf_counter()
+            docs = await retriever.ainvoke(text)
+            samples.append(time.perf_counter() - start)
+            returned += len(docs)
+            hits += any(doc.page_content == text for doc in docs)
+            leaked += sum(doc.metadata.get("document_id") not in allowed for doc in docs)
+        if not returned:
+            raise CommandError(f"Async retrieval for {email} returned nothing through the FGA check")
+        return {
+            **latency_summary(samples),
+            "hit_rate": round(hits / len(queries), 4),
+            "unauthorized_results": leaked,
+            "fga_checks": client.checks,
+        }
+
+    async def _chat(self, options):
+        QUERY_EMBEDDING_MODEL.cache.clear()
+        service = ChatService()
+        # Deleted with the owner.
+        conversation = await Conversation.objects.acreate(user=self.owner)
+        samples = []
+        questions = [chunk.page_content for chunks in self.chunks.values() for chunk in chunks]
+        for i in range(options["chats"]):
+            question = questions[i % len(questions)] if i % 3 else "What does it say about termination?"
+            start = time.perf_counter()
+            summary, history = await conversations.aload_history(conversation)
+            answer, _, sources = await service.aget_response(self.owner.email, question, history, summary=summary)
+            samples.append(time.perf_counter() - start)
+            if answer.startswith("Sorry"):
+                raise CommandError("Chat scenario failed; see the traceback above.")
+            # As the views do after responding (there in a background task).
+            await conversations.aappend_turn(conversation, question, answer, sources)
+            if service.condense_mode != "always":
+                await conversations.acompact(conversation, service.asummarize)
+        return {
+            **latency_summary(samples),
+            "turns": len(samples),
+            "llm_calls": service.llm.calls,
+            "stream": await self._stream(questions[: options["chats"]]),
+        }
+
+    async def _stream(self, questions):
+        """
+        The SSE path (astream_answer), retrieving through the stub-checked
+        retriever, so a failing FGA filter shows up as an error here.
+        """
+        QUERY_EMBEDDING_MODEL.cache.clear()
+        client = CheckOnlyFGAClient(fga_service.client)
+        retriever = build_authorized_retriever(k=4, fga=FGAService(client=client), **self._search_params())
+        service = ChatService(retriever=retriever)
+        samples, first_token, sourced = [], [], 0
+        for question in questions:
+            start = time.perf_counter()
+            first = final = None
+            async for event in service.astream_answer(self.owner.email, question, []):
+                if event["type"] == "token" and first is None:
+                    first = time.perf_counter() - start
+                elif event["type"] == "done":
+                    final = event
+            samples.append(time.perf_counter() - start)
+            if first is not None:
+                first_token.append(first)
+            if final is None:
+                raise CommandError("Streaming chat ended without a done event")
+            sourced += bool(final["sources"])
+        if not sourced:
+            raise CommandError("Streaming chat found no sources through the FGA check")
+        return {
+            **latency_summary(samples),
+            "first_token_p50_ms": latency_summary(first_token)["p50_ms"] if first_token else None,
+            "answers_with_sources": sourced,
+            "fga_checks": client.checks,
+        }
+
+    # helpers
+
+    @staticmethod
+    def _search_params():
+        return {key: value for key, value in ChatService.RETRIEVER_CONFIG.items() if key not in ("k", "hybrid")}
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _compare(self, path, results):
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+
+        def flatten(data, prefix=""):
+            for key, value in data.items():
+                if isinstance(value, dict):
+                    yield from flatten(value, f"{prefix}{key}.")
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield f"{prefix}{key}", value
+
+        old = dict(flatten(previous))
+        self.stdout.write(f"{'metric':<40} {'before':>12} {'after':>12} {'change':>8}")
+        for name, value in flatten(results):
+            if name not in old:
+                continue
+            change = f"{(value - old[name]) / old[name]:+.1%}" if old[name] else "n/a"
+            self.stdout.write(f"{name:<40} {old[name]:>12} {value:>12} {change:>8}")
@@ -0,0 +1,102 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from webapp.services.vector_index import apply_search_params, build_index_sql
+
+TABLE = "bench_vector_index"
+
+
+def _literal(vector):
+    return "[" + ",".join(f"{v:.6f}" for v in vector) + "]"
+
+
+class Command(BaseCommand):
+    help = (
+        "Recall@k and latency of HNSW/IVFFlat search against exact search on a "
+        "synthetic clustered corpus, in a scratch table that is dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--dimensions", type=int, default=256)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--k", type=int, default=4)
+        parser.add_argument("--type", dest="kind", choices=["hnsw", "ivfflat"], default="hnsw")
+        parser.add_argument("--m", type=int, default=None)
+        parser.add_argument("--ef-construction", type=int, default=None)
+        parser.add_argument("--lists", type=int, default=None)
+        parser.add_argument(
+            "--search-values", type=int, nargs="+", default=None,
+            help="ef_search (hnsw) or probes (ivfflat) values to sweep.",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        dims, k = options["dimensions"], options["k"]
+        centroids = [[rng.gauss(0, 1) for _ in range(dims)] for _ in range(50)]
+
+        def sample():
+            centre = rng.choice(centroids)
+            return [c + rng.gauss(0, 0.3) for c in centre]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(f"CREATE TABLE {TABLE} (id bigserial PRIMARY KEY, embedding vector({dims}))")
+        try:
+            self._load(rng, sample, options["rows"])
+            queries = [_literal(sample()) for _ in range(options["queries"])]
+
+            exact = [self._search(q, k, exact=True) for q in queries]
+            exact_ids = [ids for ids, _ in exact]
+            exact_ms = statistics.mean(ms for _, ms in exact)
+
+            start = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(build_index_sql(
+                    options["kind"], m=options["m"], ef_construction=options["ef_construction"],
+                    lists=options["lists"], name=f"{TABLE}_ann_idx", table=TABLE,
+                ))
+                cursor.execute(f"ANALYZE {TABLE}")
+            build_s = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{options['rows']} rows x {dims} dims, k={k}, {options['kind']} built in {build_s:.1f}s"
+            )
+            self.stdout.write(f"{'setting':>16} {'recall@k':>9} {'avg ms':>8}")
+            self.stdout.write(f"{'exact':>16} {1.0:>9.3f} {exact_ms:>8.2f}")
+
+            knob = "ef_search" if options["kind"] == "hnsw" else "probes"
+            values = options["search_values"] or ([10, 40, 100, 200] if knob == "ef_search" else [1, 5, 10, 20])
+            for value in values:
+                results = [self._search(q, k, **{knob: value}) for q in queries]
+                recall = statistics.mean(
+                    len(set(ids) & set(truth)) / k for (ids, _), truth in zip(results, exact_ids)
+                )
+                latency = statistics.mean(ms for _, ms in results)
+                self.stdout.write(f"{f'{knob}={value}':>16} {recall:>9.3f} {latency:>8.2f}")
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def _load(self, rng, sample, rows, batch=1000):
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, batch):
+                values = [(_literal(sample()),) for _ in range(min(batch, rows - offset))]
+                cursor.executemany(f"INSERT INTO {TABLE} (embedding) VALUES (%s::vector)", values)
+
+    def _search(self, query, k, exact=False, **params):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if exact:
+                cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+            apply_search_params(cursor, **params)
+            start = time.perf_counter()
+            cursor.execute(
+                f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s::vector LIMIT %s", [query, k]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            return ids, (time.perf_counter() - start) * 1000
@@ -0,0 +1,159 @@
+import math
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from webapp.services.vector_index import TABLE as EMBEDDING_TABLE, apply_search_params, build_index_sql
+from webapp.services.vector_storage import PRECISIONS, storage_type
+
+SOURCE = "bench_vector_storage_src"
+TABLE = "bench_vector_storage"
+FULL_DIMENSIONS = 1536
+
+
+def _literal(vector):
+    return "[" + ",".join(f"{v:.6f}" for v in vector) + "]"
+
+
+def _shorten(vector, dimensions):
+    head = vector[:dimensions]
+    norm = math.sqrt(sum(v * v for v in head)) or 1.0
+    return [v / norm for v in head]
+
+
+def _parse_format(value):
+    try:
+        precision, dimensions = value.split(":")
+        storage_type(precision, dimensions)
+        return precision, int(dimensions)
+    except ValueError:
+        raise CommandError(f"Formats look like halfvec:512 (precision one of {PRECISIONS}), got {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Table size, HNSW index size, query latency and recall@k of chunk vectors stored in "
+        "each format (precision:dimensions), against exact full-precision search. Uses stored "
+        "embeddings with --source embeddings, or a synthetic corpus whose variance decays "
+        "across dimensions like text-embedding-3 output. Scratch tables are dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--formats", nargs="+", default=["vector:1536", "halfvec:1536", "vector:512", "halfvec:512", "halfvec:256"],
+        )
+        parser.add_argument("--source", choices=["synthetic", "embeddings"], default="synthetic")
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--k", type=int, default=4)
+        parser.add_argument("--ef-search", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        formats = [_parse_format(value) for value in options["formats"]]
+        rng = random.Random(options["seed"])
+        k = options["k"]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}, {SOURCE}")
+            cursor.execute(f"CREATE TABLE {SOURCE} (id bigserial PRIMARY KEY, embedding vector({FULL_DIMENSIONS}))")
+        try:
+            queries = self._load(rng, options)
+            truth = [self._search(SOURCE, _literal(q), k, "vector", exact=True)[0] for q in queries]
+
+            self.stdout.write(
+                f"{options['rows']} rows ({options['source']}), k={k}, ef_search={options['ef_search']}"
+            )
+            self.stdout.write(
+                f"{'format':>14} {'table':>10} {'index':>10} {'build s':>8} "
+                f"{'recall exact':>13} {'recall hnsw':>12} {'avg ms':>8}"
+            )
+            for precision, dimensions in formats:
+                self._report(precision, dimensions, queries, truth, options)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}, {SOURCE}")
+
+    def _load(self, rng, options):
+        """Fill the full-precision source table; returns the query vectors."""
+        rows = options["rows"]
+        if options["source"] == "embeddings":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {SOURCE} (embedding) SELECT embedding::vector({FULL_DIMENSIONS}) "
+                    f"FROM {EMBEDDING_TABLE} ORDER BY random() LIMIT %s",
+                    [rows + options["queries"]],
+                )
+                # Held-out stored vectors serve as queries.
+                cursor.execute(
+                    f"DELETE FROM {SOURCE} WHERE id IN (SELECT id FROM {SOURCE} ORDER BY id DESC LIMIT %s) "
+                    f"RETURNING embedding::text",
+                    [options["queries"]],
+                )
+                queries = [[float(v) for v in text.strip("[]").split(",")] for (text,) in cursor.fetchall()]
+            if not queries:
+                raise CommandError(f"{EMBEDDING_TABLE} is empty; use --source synthetic")
+            return queries
+
+        # Most of the variance sits in the leading dimensions, as in Matryoshka-trained models.
+        scales = [1.0 / math.sqrt(1 + i / 64) for i in range(FULL_DIMENSIONS)]
+        centroids = [[rng.gauss(0, s) for s in scales] for _ in range(50)]
+
+        def sample():
+            centre = rng.choice(centroids)
+            return _shorten([c + rng.gauss(0, 0.4 * s) for c, s in zip(centre, scales)], FULL_DIMENSIONS)
+
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, 1000):
+                values = [(_literal(sample()),) for _ in range(min(1000, rows - offset))]
+                cursor.executemany(f"INSERT INTO {SOURCE} (embedding) VALUES (%s::vector)", values)
+        return [sample() for _ in range(options["queries"])]
+
+    def _report(self, precision, dimensions, queries, truth, options):
+        target = storage_type(precision, dimensions)
+        k = options["k"]
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(
+                f"CREATE TABLE {TABLE} AS SELECT id, "
+                f"l2_normalize(subvector(embedding, 1, {dimensions}))::{target} AS embedding FROM {SOURCE}"
+            )
+            cursor.execute(f"VACUUM ANALYZE {TABLE}")
+            cursor.execute("SELECT pg_table_size(%s)", [TABLE])
+            table_bytes = cursor.fetchone()[0]
+
+            start = time.perf_counter()
+            cursor.execute(build_index_sql(
+                "hnsw", name=f"{TABLE}_hnsw_idx", table=TABLE, opclass=f"{precision}_cosine_ops",
+            ))
+            build_s = time.perf_counter() - start
+            cursor.execute("SELECT pg_relation_size(%s)", [f"{TABLE}_hnsw_idx"])
+            index_bytes = cursor.fetchone()[0]
+
+        literals = [_literal(_shorten(q, dimensions)) for q in queries]
+        exact = [self._search(TABLE, q, k, precision, exact=True)[0] for q in literals]
+        approximate = [self._search(TABLE, q, k, precision, ef_search=options["ef_search"]) for q in literals]
+
+        def recall(results):
+            return statistics.mean(len(set(ids) & set(expected)) / k for ids, expected in zip(results, truth))
+
+        self.stdout.write(
+            f"{target:>14} {table_bytes / 2**20:>8.1f}MB {index_bytes / 2**20:>8.1f}MB {build_s:>8.1f} "
+            f"{recall(exact):>13.3f} {recall([ids for ids, _ in approximate]):>12.3f} "
+            f"{statistics.mean(ms for _, ms in approximate):>8.2f}"
+        )
+
+    def _search(self, table, query, k, precision, exact=False, **params):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if exact:
+                cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+            apply_search_params(cursor, **params)
+            start = time.perf_counter()
+            cursor.execute(
+                f"SELECT id FROM {table} ORDER BY embedding <=> %s::{precision} LIMIT %s", [query, k]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            return ids, (time.perf_counter() - start) * 1000
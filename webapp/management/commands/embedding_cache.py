@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from webapp.models import EmbeddingCacheEntry
+from webapp.services.embedding_cache import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Report on the embedding cache, or delete entries no Embedding row references."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["stats", "gc"])
+        parser.add_argument(
+            "--grace-hours", type=int, default=None,
+            help="Keep unreferenced entries younger than this (default EMBEDDING_CACHE_GC_GRACE_HOURS).",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["action"] == "stats":
+            for row in EmbeddingCacheEntry.objects.values("model").annotate(entries=Count("id")).order_by("model"):
+                self.stdout.write(f"{row['model']}: {row['entries']} entries")
+            orphans = collect_garbage(options["grace_hours"], dry_run=True)
+            self.stdout.write(f"Unreferenced entries eligible for gc: {orphans}")
+            return
+
+        deleted = collect_garbage(options["grace_hours"], dry_run=options["dry_run"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {deleted} unreferenced cache entries.")
@@ -0,0 +1,85 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from webapp.services import metrics
+from webapp.services.ingestion_queue import default_worker_id, recover_stale_jobs, run_worker
+
+
+def _worker_main(index, poll_interval, stop_event, metrics_port=None):
+    # Let the parent decide when to stop; a second Ctrl+C should not kill a job mid-batch.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    worker_id = default_worker_id(index)
+    if metrics_port and metrics.ENABLED:
+        # Each worker keeps its own histograms, so each gets its own port.
+        metrics.serve(metrics_port + index)
+    print(f"[INGEST] Worker {worker_id} started")
+    try:
+        run_worker(worker_id, poll_interval=poll_interval, should_stop=stop_event.is_set)
+    finally:
+        connections.close_all()
+        print(f"[INGEST] Worker {worker_id} stopped")
+
+
+class Command(BaseCommand):
+    help = "Process queued document ingestion jobs with N worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.INGESTION_WORKERS)
+        parser.add_argument("--poll-interval", type=float, default=2.0)
+        parser.add_argument(
+            "--stale-after", type=int, default=settings.INGESTION_STALE_AFTER,
+            help="Seconds without a heartbeat before a running job is recovered.",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Drain the queue in this process and exit.",
+        )
+        parser.add_argument(
+            "--metrics-port", type=int, default=None,
+            help="With METRICS_ENABLED, worker N serves /metrics on this port + N.",
+        )
+
+    def handle(self, *args, **options):
+        recover_stale_jobs(options["stale_after"])
+
+        if options["once"]:
+            processed = run_worker(default_worker_id(), once=True)
+            self.stdout.write(f"Processed {processed} job(s).")
+            return
+
+        # Forked children must not share the parent's database connection.
+        connections.close_all()
+        stop_event = multiprocessing.Event()
+        workers = [
+            multiprocessing.Process(
+                target=_worker_main,
+                args=(index, options["poll_interval"], stop_event, options["metrics_port"]),
+                daemon=False,
+            )
+            for index in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+
+        def request_stop(*_):
+            self.stdout.write("Stopping after current jobs...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        last_recovery = time.monotonic()
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(1)
+            if not stop_event.is_set() and time.monotonic() - last_recovery > options["stale_after"] / 2:
+                recover_stale_jobs(options["stale_after"])
+                last_recovery = time.monotonic()
+
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.services import reembed
+
+
+class Command(BaseCommand):
+    help = (
+        "Move stored chunks to another embedding model without downtime. `start --model` registers "
+        "the new version; `run` re-embeds documents into it in the background (throttled with "
+        "--max-rate, resumable) while chat keeps reading the active version; `cutover` activates it "
+        "atomically once every document is covered; run `run` once more to catch uploads made "
+        "during the switch, then `cleanup` deletes the retired chunks. `abort` drops the new version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["status", "start", "run", "cutover", "cleanup", "abort"])
+        parser.add_argument("--model", default=None,
+                            help="Target model, e.g. text-embedding-3-large@1536 (default EMBEDDING_MODEL_NAME).")
+        parser.add_argument("--batch-size", type=int, default=None, help="Chunks per embedding request.")
+        parser.add_argument("--max-rate", type=float, default=None, help="Chunks embedded per second at most.")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many documents.")
+        parser.add_argument("--force", action="store_true", help="Cut over even if documents are still pending.")
+        parser.add_argument("--delete-batch-size", type=int, default=5000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between delete batches.")
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        on_batch = lambda done: self.stdout.write(f"  deleted {done} rows")
+
+        try:
+            if action == "start":
+                version = reembed.start(options["model"])
+                self.stdout.write(f"Re-embedding into {version.model}; run `reembed run` next.")
+            elif action == "run":
+                start = time.perf_counter()
+
+                def on_document(document, chunks, error):
+                    if error is not None:
+                        self.stderr.write(f"  {document.pk}: failed: {error}")
+                    else:
+                        self.stdout.write(f"  {document.pk}: {chunks} chunks")
+
+                version, documents, chunks, failed = reembed.run(
+                    batch_size=options["batch_size"], max_rate=options["max_rate"],
+                    limit=options["limit"], on_document=on_document,
+                )
+                self.stdout.write(
+                    f"Re-embedded {documents} document(s) ({chunks} chunks, {failed} failed) into "
+                    f"{version.model} in {time.perf_counter() - start:.1f}s."
+                )
+            elif action == "cutover":
+                previous, current, stamped = reembed.cutover(force=options["force"])
+                self.stdout.write(
+                    f"Switched from {previous} to {current}; {stamped} documents re-stamped. "
+                    f"Run `reembed run` to catch documents ingested during the switch."
+                )
+            elif action == "cleanup":
+                deleted = reembed.cleanup(options["delete_batch_size"], options["pause"], on_batch)
+                self.stdout.write(f"Deleted {deleted} retired chunks.")
+            elif action == "abort":
+                deleted = reembed.abort(options["delete_batch_size"], options["pause"], on_batch)
+                self.stdout.write(f"Dropped the unfinished version and {deleted} chunks.")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(reembed.status(), indent=2))
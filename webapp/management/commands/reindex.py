@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from webapp.models import Document
+from webapp.services.embeddings import index_version
+from webapp.services.reindex import reindex_documents, stale_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring documents up to the current index version (EMBEDDING_MODEL_NAME, CHUNK_SIZE, "
+        "CHUNK_OVERLAP). Only changed chunks are re-embedded and each document is swapped "
+        "atomically; rerun after an interruption to pick up where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", nargs="+", default=None, help="Only these Document ids.")
+        parser.add_argument("--all", action="store_true", help="Include documents already at the current version.")
+        parser.add_argument("--workers", type=int, default=4, help="Documents reindexed concurrently.")
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--dry-run", action="store_true", help="Only list the documents that would be reindexed.")
+
+    def handle(self, *args, **options):
+        documents = Document.objects.all() if options["all"] else stale_documents()
+        if options["documents"]:
+            documents = documents.filter(pk__in=options["documents"])
+        documents = documents.order_by("created_at", "pk")
+        if options["limit"]:
+            documents = documents[:options["limit"]]
+        documents = list(documents)
+
+        self.stdout.write(f"Index version {index_version()}: {len(documents)} document(s) to reindex.")
+        if options["dry_run"]:
+            for document in documents:
+                self.stdout.write(f"  {document.pk} {document.title} (at {document.index_version or 'unknown'})")
+            return
+
+        totals = {"kept": 0, "added": 0, "removed": 0}
+
+        def on_result(document, result, error):
+            if error is not None:
+                self.stderr.write(f"  {document.pk}: failed: {error}")
+                return
+            for key in totals:
+                totals[key] += result[key]
+
+        start = time.perf_counter()
+        succeeded, failed = reindex_documents(documents, workers=options["workers"], on_result=on_result)
+        self.stdout.write(
+            f"Reindexed {succeeded} document(s), {failed} failed in {time.perf_counter() - start:.1f}s: "
+            f"kept {totals['kept']} chunks, embedded {totals['added']}, removed {totals['removed']}."
+        )
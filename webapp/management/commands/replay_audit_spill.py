@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from webapp.services.audit import SPILL, AuditSink
+
+
+class Command(BaseCommand):
+    help = "Insert audit records spilled to AUDIT_SPILL_PATH, e.g. after the database was unreachable."
+
+    def handle(self, *args, **options):
+        sink = AuditSink(mode=SPILL)
+        written = sink.flush()
+        self.stdout.write(f"Replayed {written} spilled audit records.")
+        if sink.dead_lettered:
+            self.stderr.write(f"{sink.dead_lettered} records were rejected and moved to {sink.dead_letter_path}.")
+        if sink.failed_flushes:
+            self.stderr.write("Replay failed; the records were kept for the next attempt.")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from webapp.models import Document, DocumentAccess
+from webapp.services.fga_client import fga_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the DocumentAccess ACL mirror from the tuples stored in OpenFGA. "
+        "Run once after deploying the mirror, or whenever it may have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        existing = set(Document.objects.values_list("id", flat=True))
+        rows = []
+        skipped = 0
+        for user, relation, document_id in fga_service.read_document_tuples(options["page_size"]):
+            if document_id not in existing:
+                skipped += 1
+                continue
+            rows.append(DocumentAccess(principal=user, document_id=document_id, relation=relation))
+
+        with transaction.atomic():
+            DocumentAccess.objects.all().delete()
+            DocumentAccess.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+        self.stdout.write(
+            f"Mirrored {len(rows)} tuples; skipped {skipped} for documents missing from the database."
+        )
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from webapp.services.vector_index import create_index, drop_index, index_report
+
+
+class Command(BaseCommand):
+    help = "Create, rebuild, drop or report on the ANN index over webapp_embedding.embedding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["create", "rebuild", "drop", "report"])
+        parser.add_argument("--type", dest="kind", choices=["hnsw", "ivfflat"], default="hnsw")
+        parser.add_argument("--m", type=int, default=None, help="HNSW max connections per layer.")
+        parser.add_argument("--ef-construction", type=int, default=None, help="HNSW build candidate list size.")
+        parser.add_argument("--lists", type=int, default=None, help="IVFFlat list count (build after loading data).")
+        parser.add_argument(
+            "--concurrently", action="store_true",
+            help="Build/drop without blocking writes (cannot run inside a transaction).",
+        )
+
+    def handle(self, *args, **options):
+        kind = options["kind"]
+        params = {
+            "m": options["m"],
+            "ef_construction": options["ef_construction"],
+            "lists": options["lists"],
+        }
+
+        if options["action"] in ("drop", "rebuild"):
+            drop_index(kind, concurrently=options["concurrently"])
+            self.stdout.write(f"Dropped {kind} index.")
+        if options["action"] in ("create", "rebuild"):
+            create_index(kind, concurrently=options["concurrently"], **params)
+            self.stdout.write(f"Created {kind} index.")
+
+        self.stdout.write(json.dumps(index_report(), indent=2))
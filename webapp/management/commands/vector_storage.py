@@ -0,0 +1,57 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.services import vector_storage
+from webapp.services.vector_index import index_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert stored chunk vectors to another precision/dimension (see EMBEDDING_PRECISION, "
+        "EMBEDDING_DIMENSIONS). `convert` backfills a new column in batches and indexes it while "
+        "the app keeps running; `cutover` swaps it in atomically; deploy the new settings right "
+        "after. `vacuum` then returns the freed space (locks the table)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["status", "convert", "cutover", "abort", "vacuum"])
+        parser.add_argument("--precision", choices=vector_storage.PRECISIONS, default=None,
+                            help="Target precision (default EMBEDDING_PRECISION).")
+        parser.add_argument("--dimensions", type=int, default=None,
+                            help="Target dimensions (default EMBEDDING_DIMENSIONS).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--no-index", action="store_true", help="Skip building the HNSW index on the new column.")
+
+    def handle(self, *args, **options):
+        precision = options["precision"] or settings.EMBEDDING_PRECISION
+        dimensions = options["dimensions"] or settings.EMBEDDING_DIMENSIONS
+        action = options["action"]
+
+        try:
+            if action == "convert":
+                converted = vector_storage.backfill(
+                    precision, dimensions, batch_size=options["batch_size"], pause=options["pause"],
+                    on_batch=lambda done: self.stdout.write(f"  converted {done} rows"),
+                )
+                self.stdout.write(f"Backfilled {converted} rows to {vector_storage.storage_type(precision, dimensions)}.")
+                if not options["no_index"]:
+                    vector_storage.build_index(precision)
+                    self.stdout.write("Built the HNSW index on the new column.")
+            elif action == "cutover":
+                stamped = vector_storage.cutover(precision, dimensions)
+                self.stdout.write(
+                    f"Switched to {vector_storage.storage_type(precision, dimensions)}; {stamped} documents "
+                    f"re-stamped. Set EMBEDDING_PRECISION={precision} EMBEDDING_DIMENSIONS={dimensions} now."
+                )
+            elif action == "abort":
+                vector_storage.abort()
+                self.stdout.write("Dropped the unfinished conversion.")
+            elif action == "vacuum":
+                vector_storage.vacuum_full()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps({**vector_storage.status(), **index_report()}, indent=2))
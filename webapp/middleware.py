@@ -0,0 +1,49 @@
+# webapp/middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .services import metrics
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the pipeline stages a request runs through (services/metrics.py)
+    and reports them in a Server-Timing header, plus a per-view latency
+    histogram. Streaming responses report their stages in the stream instead,
+    since the headers are sent before the work is done.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.ENABLED:
+            return self.get_response(request)
+        start = time.perf_counter()
+        with metrics.collect_timings() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not metrics.ENABLED:
+            return await self.get_response(request)
+        start = time.perf_counter()
+        with metrics.collect_timings() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    @staticmethod
+    def _finish(request, response, timings, elapsed):
+        match = getattr(request, "resolver_match", None)
+        metrics.REQUEST_SECONDS.observe(match.url_name if match and match.url_name else "unmatched", elapsed)
+        if not response.streaming:
+            response["Server-Timing"] = metrics.server_timing_header(timings, elapsed)
+        return response
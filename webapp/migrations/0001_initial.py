@@ -0,0 +1,56 @@
+import cloudinary_storage.storage
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import pgvector.django
+import webapp.models
+from django.conf import settings
+from django.db import migrations, models
+from pgvector.django import VectorExtension
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        VectorExtension(),
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.CharField(default=webapp.models.nanoid_default, max_length=191, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('file', models.FileField(storage=cloudinary_storage.storage.RawMediaCloudinaryStorage(resource_type='raw'), upload_to='uploads/', validators=[django.core.validators.FileExtensionValidator(['pdf'])])),
+                ('file_type', models.CharField(blank=True, default='pdf', max_length=50)),
+                ('shared', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Embedding',
+            fields=[
+                ('id', models.CharField(default=webapp.models.nanoid_default, max_length=191, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('metadata', models.JSONField(default=dict)),
+                ('embedding', pgvector.django.VectorField(dimensions=1536)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='webapp.document')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('question', models.TextField()),
+                ('document_ids', models.JSONField(default=list)),
+                ('agent_id', models.CharField(default='default_chat_agent', max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
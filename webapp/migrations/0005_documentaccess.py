@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0004_embedding_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('principal', models.CharField(max_length=255)),
+                ('relation', models.CharField(max_length=50)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='webapp.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['principal', 'relation'], name='documentaccess_principal_idx')],
+                'constraints': [models.UniqueConstraint(fields=('principal', 'document', 'relation'), name='documentaccess_tuple_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    HNSW index for cosine similarity search on chunk vectors.
+    On large tables, build it first with
+    `manage.py vector_index create --concurrently`; this migration is then a no-op.
+    """
+
+    dependencies = [
+        ('webapp', '0005_documentaccess'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX IF NOT EXISTS embedding_vector_hnsw_idx ON webapp_embedding "
+                "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+            ),
+            reverse_sql="DROP INDEX IF EXISTS embedding_vector_hnsw_idx",
+        ),
+    ]
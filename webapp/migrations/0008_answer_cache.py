@@ -0,0 +1,38 @@
+import pgvector.django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0007_auditlog_user_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('question', models.TextField()),
+                ('embedding', pgvector.django.VectorField(dimensions=1536)),
+                ('answer', models.TextField()),
+                ('source_ids', models.JSONField(default=list)),
+                ('source_versions', models.JSONField(default=dict)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX IF NOT EXISTS answercache_vector_hnsw_idx ON webapp_answercacheentry "
+                "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+            ),
+            reverse_sql="DROP INDEX IF EXISTS answercache_vector_hnsw_idx",
+        ),
+    ]
@@ -0,0 +1,31 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Stored tsvector of each chunk plus a GIN index, for hybrid retrieval.
+    Adding a stored generated column rewrites webapp_embedding, so run it
+    in a maintenance window on large tables.
+    """
+
+    dependencies = [
+        ('webapp', '0008_answer_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embedding',
+            name='search_vector',
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.SearchVector('content', config='english'),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='embedding',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='embedding_search_gin_idx'),
+        ),
+    ]
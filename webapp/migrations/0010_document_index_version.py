@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Per-document index version (embedding model + splitter config). Existing
+    documents start as "" and are picked up by `manage.py reindex`.
+    """
+
+    dependencies = [
+        ('webapp', '0009_embedding_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='index_version',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=191),
+        ),
+    ]
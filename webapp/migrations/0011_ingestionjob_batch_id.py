@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0010_document_index_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='batch_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,35 @@
+import pgvector.django
+from django.db import migrations
+
+import webapp.models
+
+
+class Migration(migrations.Migration):
+    """
+    Chunk and answer-cache vectors follow EMBEDDING_PRECISION and
+    EMBEDDING_DIMENSIONS. With the defaults (vector, 1536) this changes
+    nothing in the database; apply it before changing either setting, then
+    convert existing rows with `manage.py vector_storage`.
+    """
+
+    dependencies = [
+        ('webapp', '0012_conversations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='embedding',
+            name='embedding',
+            field=webapp.models.StorageVectorField(),
+        ),
+        migrations.AlterField(
+            model_name='answercacheentry',
+            name='embedding',
+            field=webapp.models.StorageVectorField(),
+        ),
+        migrations.AlterField(
+            model_name='embeddingcacheentry',
+            name='embedding',
+            field=pgvector.django.VectorField(),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+from webapp.services.providers import configured_embedding_model_name
+
+
+def create_initial_version(apps, schema_editor):
+    # The vectors stored so far came from the configured model; 0015 tags them with this version.
+    EmbeddingVersion = apps.get_model('webapp', 'EmbeddingVersion')
+    EmbeddingVersion.objects.create(
+        provider=settings.EMBEDDING_PROVIDER,
+        model=configured_embedding_model_name(),
+        status='active',
+        activated_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Embedding versions: the model behind each stored vector, so a new model
+    can be backfilled beside the active one (`manage.py reembed`).
+    """
+
+    dependencies = [
+        ('webapp', '0013_vector_storage_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingVersion',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('provider', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('building', 'Building'), ('active', 'Active'), ('retired', 'Retired')], default='building', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('provider', 'model'), name='embeddingversion_provider_model_uniq'),
+                    models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('provider',), name='embeddingversion_one_active'),
+                ],
+            },
+        ),
+        migrations.RunPython(create_initial_version, migrations.RunPython.noop),
+    ]
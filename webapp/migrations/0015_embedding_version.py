@@ -0,0 +1,24 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Tag every chunk with its embedding version. Existing rows get the initial
+    version created by 0014 through a constant column default, which Postgres
+    (11+) records without rewriting the table; the foreign key check and the
+    index build still scan it once.
+    """
+
+    dependencies = [
+        ('webapp', '0014_embeddingversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embedding',
+            name='version',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.PROTECT, related_name='embeddings', to='webapp.embeddingversion'),
+            preserve_default=False,
+        ),
+    ]
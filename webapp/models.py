@@ -1,6 +1,9 @@
 # webapp/models.py
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from pgvector.django import VectorField
 from nanoid import generate
 from django.core.validators import FileExtensionValidator
@@ -11,6 +14,27 @@ def nanoid_default():
     return generate()
 
 
+class StorageVectorField(VectorField):
+    """
+    Vector column stored as EMBEDDING_PRECISION ('vector' = float32, 'halfvec'
+    = float16) with EMBEDDING_DIMENSIONS. Both are left out of deconstruct(),
+    so changing them produces no migration: existing tables are converted with
+    `manage.py vector_storage`. Values travel as '[...]' text either way.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs["dimensions"] = settings.EMBEDDING_DIMENSIONS
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop("dimensions", None)
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        return f"{settings.EMBEDDING_PRECISION}({settings.EMBEDDING_DIMENSIONS})"
+
+
 class Document(models.Model):
     id = models.CharField(primary_key=True, max_length=191, default=nanoid_default)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="documents")
@@ -18,6 +42,10 @@ class Document(models.Model):
     file = models.FileField(upload_to="uploads/", storage=RawMediaCloudinaryStorage(resource_type='raw'), validators=[FileExtensionValidator(['pdf'])])
     file_type = models.CharField(max_length=50, blank=True, default='pdf')
     shared = models.BooleanField(default=False) 
+    # Bumped whenever the document is (re-)ingested; cached answers record it.
+    content_version = models.PositiveIntegerField(default=1)
+    # Embedding model and splitter config of the stored chunks ("" = unknown, pre-versioning).
+    index_version = models.CharField(max_length=191, blank=True, default="", db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -31,18 +59,158 @@ class Document(models.Model):
         return None
 
 
+class EmbeddingVersion(models.Model):
+    """
+    An embedding model ("name" or "name@dimensions") whose vectors are stored
+    in Embedding. Retrieval reads the ACTIVE version of EMBEDDING_PROVIDER
+    only; a BUILDING version is filled by `manage.py reembed` alongside it and
+    then activated in one transaction.
+    """
+    class Status(models.TextChoices):
+        BUILDING = "building", "Building"
+        ACTIVE = "active", "Active"
+        RETIRED = "retired", "Retired"
+
+    id = models.SmallAutoField(primary_key=True)
+    provider = models.CharField(max_length=20)
+    model = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.BUILDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "model"], name="embeddingversion_provider_model_uniq"),
+            models.UniqueConstraint(
+                fields=["provider"], condition=models.Q(status="active"), name="embeddingversion_one_active",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.model} ({self.status})"
+
+
 class Embedding(models.Model):
     id = models.CharField(primary_key=True, max_length=191, default=nanoid_default)
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="embeddings")
+    # Which model produced `embedding`; only the active version is searched.
+    version = models.ForeignKey(EmbeddingVersion, on_delete=models.PROTECT, related_name="embeddings")
     content = models.TextField()
     metadata = models.JSONField(default=dict)
-    embedding = VectorField(dimensions=1536)
+    embedding = StorageVectorField()
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # Full-text side of hybrid retrieval; maintained by Postgres from content.
+    search_vector = models.GeneratedField(
+        expression=SearchVector("content", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="embedding_search_gin_idx"),
+        ]
 
     def __str__(self):
         return f"Embedding {self.id} for doc {self.document_id}"
     
 
 
+class DocumentAccess(models.Model):
+    """
+    Local mirror of the OpenFGA tuples on documents, so vector search can
+    filter by access in SQL. OpenFGA remains the source of truth.
+    """
+    principal = models.CharField(max_length=255)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="access")
+    relation = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["principal", "document", "relation"], name="documentaccess_tuple_uniq"),
+        ]
+        indexes = [models.Index(fields=["principal", "relation"], name="documentaccess_principal_idx")]
+
+    def __str__(self):
+        return f"{self.principal} {self.relation} doc:{self.document_id}"
+
+
+class EmbeddingCacheEntry(models.Model):
+    """
+    Content-addressed embedding, shared by every document containing the same chunk text.
+    """
+    model = models.CharField(max_length=100)
+    text_hash = models.CharField(max_length=64)
+    # Unconstrained: entries of shortened models (e.g. "text-embedding-3-small@512") sit beside full ones.
+    embedding = VectorField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model", "text_hash"], name="embeddingcache_model_hash_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.text_hash}"
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    A chat answer reusable for semantically similar questions, by any user
+    who can view all of its source documents at the recorded versions.
+    """
+    model = models.CharField(max_length=100)
+    question = models.TextField()
+    embedding = StorageVectorField()
+    answer = models.TextField()
+    source_ids = models.JSONField(default=list)
+    source_versions = models.JSONField(default=dict)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.question[:50]} ({len(self.source_ids)} sources)"
+
+
+class Conversation(models.Model):
+    """
+    A named chat thread. Messages are append-only; older ones are folded into
+    `summary`, which covers every message up to `summarized_through`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversations")
+    title = models.CharField(max_length=255, blank=True, default="")
+    summary = models.TextField(blank=True, default="")
+    summarized_through = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "-updated_at"], name="conversation_user_updated_idx")]
+
+    def __str__(self):
+        return f"{self.title or 'Untitled'} ({self.user_id})"
+
+
+class ChatMessage(models.Model):
+    class Role(models.TextChoices):
+        USER = "user", "User"
+        ASSISTANT = "assistant", "Assistant"
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="messages")
+    role = models.CharField(max_length=10, choices=Role.choices)
+    content = models.TextField()
+    sources = models.JSONField(default=list, blank=True)
+    # Counted once on insert, so history can be cut to a token budget without re-tokenising.
+    tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["conversation", "-id"], name="chatmessage_conv_id_idx")]
+
+    def __str__(self):
+        return f"{self.role}: {self.content[:50]}"
+
+
 class AuditLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(default=timezone.now)
@@ -50,6 +218,49 @@ class AuditLog(models.Model):
     document_ids = models.JSONField(default=list)  
     agent_id = models.CharField(max_length=100, default="default_chat_agent") 
 
+    class Meta:
+        indexes = [
+            # Serves the per-user, newest-first keyset pages of the log viewer.
+            models.Index(fields=["user", "timestamp", "id"], name="auditlog_user_ts_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.email} asked '{self.question}' at {self.timestamp}"
-    
+
+
+class IngestionJob(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name="ingestion_job")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    chunks_done = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    last_error = models.TextField(blank=True, default="")
+    source_path = models.CharField(max_length=500, blank=True, default="")
+    # Groups the jobs of one bulk upload for aggregate progress.
+    batch_id = models.CharField(max_length=32, blank=True, default="", db_index=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker_id = models.CharField(max_length=100, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"], name="ingestionjob_status_run_idx")]
+
+    def __str__(self):
+        return f"Ingestion of {self.document_id} ({self.status})"
+
+    @property
+    def progress(self):
+        if self.status == self.Status.DONE:
+            return 100
+        if not self.chunks_total:
+            return 0
+        return int(100 * self.chunks_done / self.chunks_total)
@@ -0,0 +1,49 @@
+# webapp/pagination.py
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(timestamp, pk):
+    raw = json.dumps([timestamp.isoformat(), pk]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, pk), or None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        timestamp, pk = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        timestamp = parse_datetime(timestamp)
+    except (ValueError, TypeError):
+        return None
+    if timestamp is None:
+        return None
+    return timestamp, pk
+
+
+def keyset_page(queryset, cursor=None, page_size=25, field="created_at"):
+    """
+    Newest-first keyset pagination on (field, pk).
+    Unlike OFFSET paging, every page costs the same index range scan, however
+    deep the user has scrolled. Returns (items, next_cursor); next_cursor is
+    None on the last page.
+    """
+    queryset = queryset.order_by(f"-{field}", "-pk")
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, pk = position
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": timestamp}) | Q(**{field: timestamp, "pk__lt": pk})
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return items, next_cursor
@@ -0,0 +1,135 @@
+# webapp/services/answer_cache.py
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from ..models import AnswerCacheEntry, Document
+from . import metrics
+from .caching import CacheStats
+from .embedding_cache import embedding_model_name
+from .embedding_versions import active_version, query_embeddings
+from .retrieval import viewable_document_ids
+
+
+class SemanticAnswerCache:
+    """
+    Reuses chat answers across users for questions whose embeddings are
+    within `threshold` cosine similarity.
+
+    An entry is only served to a user who can view every one of its source
+    documents (narrowed with the ACL mirror, then confirmed with FGA checks,
+    which make the final decision as in retrieval), and only while those documents are at
+    the content_version the answer was built from. Re-ingesting a document
+    or changing its sharing deletes the entries that cite it.
+    """
+
+    def __init__(self, embeddings=None, threshold=None, ttl=None, candidates=5, fga=None):
+        # None: the active embedding version's query model, followed across reembed cutovers.
+        self._embeddings = embeddings
+        self.threshold = threshold or settings.ANSWER_CACHE_THRESHOLD
+        self.ttl = ttl or settings.ANSWER_CACHE_TTL
+        self.candidates = candidates
+        # FGAService to check with; None uses the shared fga_service.
+        self.fga = fga
+        self.stats = CacheStats()
+
+    @property
+    def embeddings(self):
+        return self._embeddings or query_embeddings(active_version())
+
+    @property
+    def model(self):
+        return embedding_model_name(self.embeddings)
+
+    def lookup(self, email, question):
+        """Return a cached {"answer", "sources"} the user may see, or None."""
+        # The query embedding cache makes this vector free for the retrieval that follows a miss.
+        embeddings = self.embeddings
+        vector = embeddings.embed_query(question)
+        candidates = list(
+            AnswerCacheEntry.objects.filter(
+                model=embedding_model_name(embeddings),
+                created_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+            )
+            .annotate(distance=CosineDistance("embedding", vector))
+            .filter(distance__lte=1 - self.threshold)
+            .order_by("distance")[:self.candidates]
+        )
+        entry = self._first_authorized(email, candidates)
+        if entry is None:
+            self.stats.record(misses=1)
+            return None
+
+        AnswerCacheEntry.objects.filter(pk=entry.pk).update(hits=F("hits") + 1)
+        self.stats.record(hits=1)
+        print(f"[ANSWER CACHE] Hit for user {email} (distance {entry.distance:.4f})")
+        return {"answer": entry.answer, "sources": entry.source_ids}
+
+    def _first_authorized(self, email, candidates):
+        source_ids = {doc_id for entry in candidates for doc_id in entry.source_ids}
+        if not source_ids:
+            return None
+        viewable = set(
+            viewable_document_ids(email).filter(document_id__in=source_ids).values_list("document_id", flat=True)
+        )
+        versions = dict(Document.objects.filter(id__in=source_ids).values_list("id", "content_version"))
+        for entry in candidates:
+            if all(
+                doc_id in viewable and versions.get(doc_id) == entry.source_versions.get(doc_id)
+                for doc_id in entry.source_ids
+            ) and self._checked(email, entry.source_ids):
+                return entry
+        return None
+
+    def _checked(self, email, source_ids):
+        """The mirror may be stale: every source must also pass a (cached) FGA check."""
+        from .fga_client import fga_service  # fga_client imports this module
+
+        fga = self.fga or fga_service
+        return fga.viewable_documents(email, source_ids) == set(source_ids)
+
+    def store(self, question, answer, sources):
+        """
+        Cache an answer built from `sources`. Answers without sources depend on
+        what the asking user could not see, so they are not shared.
+        """
+        sources = [doc_id for doc_id in sources if doc_id != "Unknown"]
+        if not sources:
+            return None
+        versions = dict(Document.objects.filter(id__in=sources).values_list("id", "content_version"))
+        if len(versions) != len(sources):
+            return None
+        embeddings = self.embeddings
+        return AnswerCacheEntry.objects.create(
+            model=embedding_model_name(embeddings),
+            question=question,
+            embedding=embeddings.embed_query(question),
+            answer=answer,
+            source_ids=sources,
+            source_versions=versions,
+        )
+
+    async def alookup(self, email, question):
+        return await sync_to_async(self.lookup)(email, question)
+
+    async def astore(self, question, answer, sources):
+        return await sync_to_async(self.store)(question, answer, sources)
+
+    def invalidate_document(self, document_id):
+        deleted, _ = AnswerCacheEntry.objects.filter(source_ids__contains=[str(document_id)]).delete()
+        if deleted:
+            print(f"[ANSWER CACHE] Dropped {deleted} answers citing doc:{document_id}")
+        return deleted
+
+    def purge_expired(self):
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        deleted, _ = AnswerCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+        return deleted
+
+
+answer_cache = SemanticAnswerCache()
+metrics.register_collector(lambda: metrics.cache_samples("answer", answer_cache.stats))
@@ -0,0 +1,54 @@
+# webapp/services/async_db.py
+import asyncio
+import weakref
+
+from django.conf import settings
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+# psycopg async connections belong to the event loop that opened them,
+# so each loop gets its own pool instead of sharing one across loops.
+_pools = weakref.WeakKeyDictionary()
+
+
+def _conninfo():
+    db = settings.DATABASES["default"]
+    return make_conninfo(
+        dbname=db["NAME"],
+        user=db["USER"],
+        password=db["PASSWORD"],
+        host=db.get("HOST") or None,
+        port=db.get("PORT") or None,
+    )
+
+
+async def get_pool():
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            _conninfo(),
+            min_size=1,
+            max_size=settings.ASYNC_DB_POOL_SIZE,
+            kwargs={"row_factory": dict_row},
+            open=False,
+        )
+        _pools[loop] = pool
+    # Opening an already open pool is a no-op.
+    await pool.open()
+    return pool
+
+
+async def fetch_all(sql, params, setup=None):
+    """
+    Run one query on a pooled async connection and return rows as dicts.
+    setup(conn) runs first in the same transaction, e.g. to SET LOCAL options.
+    """
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            if setup:
+                await setup(conn)
+            cursor = await conn.execute(sql, params)
+            return await cursor.fetchall()
@@ -0,0 +1,387 @@
+# webapp/services/audit.py
+import atexit
+import csv
+import fcntl
+import json
+import os
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import AuditLog, Document
+from . import metrics
+
+SYNC = "sync"
+BUFFERED = "buffered"
+SPILL = "spill"
+
+# The database is unreachable rather than refusing the rows: keep them for later.
+OUTAGE_ERRORS = (InterfaceError, OperationalError)
+
+
+class AuditSink:
+    """
+    Write-behind sink for AuditLog rows.
+
+    sync:     insert each record on the caller's thread, as before.
+    buffered: queue records in memory and bulk_create them from a background
+              thread every `flush_size` records or `flush_interval` seconds,
+              and at shutdown. Records are dropped if the buffer is full.
+    spill:    like buffered, but records that cannot be queued or written are
+              appended to `spill_path` and replayed by the next successful flush.
+              Worker processes share the file; flock() keeps one replay at a time.
+
+    A batch the database rejects for its content is split until the rows at
+    fault are alone; those are appended to `dead_letter_path` and never retried.
+    """
+
+    def __init__(self, mode=None, flush_size=None, flush_interval=None, buffer_limit=None, spill_path=None,
+                 dead_letter_path=None):
+        self.mode = mode or settings.AUDIT_LOG_MODE
+        self.flush_size = flush_size or settings.AUDIT_FLUSH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_FLUSH_INTERVAL
+        self.buffer_limit = buffer_limit or settings.AUDIT_BUFFER_LIMIT
+        self.spill_path = spill_path or settings.AUDIT_SPILL_PATH
+        self.dead_letter_path = dead_letter_path or settings.AUDIT_DEAD_LETTER_PATH
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.dead_lettered = 0
+        self.failed_flushes = 0
+
+    def record(self, user_id, question, document_ids, agent_id="query agent"):
+        entry = {
+            "user_id": user_id,
+            "question": question,
+            "document_ids": list(document_ids),
+            "agent_id": agent_id,
+            "timestamp": timezone.now().isoformat(),
+        }
+        if self.mode == SYNC:
+            self._write([entry])
+            self.flushed += 1
+            return
+
+        self._ensure_thread()
+        with self._lock:
+            if len(self._buffer) >= self.buffer_limit:
+                overflow = entry
+            else:
+                self._buffer.append(entry)
+                self.enqueued += 1
+                overflow = None
+                if len(self._buffer) >= self.flush_size:
+                    self._wakeup.notify()
+        if overflow is not None:
+            self._overflow([overflow])
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "buffered": len(self._buffer),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "dead_lettered": self.dead_lettered,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    def flush(self):
+        """Write every buffered (and spilled) record now. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                entries = list(self._buffer)
+                self._buffer.clear()
+            with self._replaying() as replaying:
+                spilled = self._read_spill() if replaying else []
+                return self._flush(entries, spilled)
+
+    def _flush(self, entries, spilled):
+        if not entries and not spilled:
+            return 0
+
+        records = spilled + entries
+        written, unwritten, error = self._write_isolating(records)
+        self.flushed += written
+        if error is not None:
+            self.failed_flushes += 1
+            print(f"[AUDIT LOG] Flush of {len(unwritten)} records failed: {error}")
+            traceback.print_exc()
+            if len(unwritten) == len(records):
+                # Spilled records stay in the processing file for the next attempt.
+                self._requeue(entries)
+                return 0
+            # Part of the batch is stored; keep only the rest.
+            self._clear_spill()
+            self._requeue(unwritten)
+            return written
+
+        if spilled:
+            self._clear_spill()
+        return written
+
+    def close(self):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    # internals
+
+    @staticmethod
+    def _write(entries):
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                user_id=entry["user_id"],
+                question=entry["question"],
+                document_ids=entry["document_ids"],
+                agent_id=entry["agent_id"],
+                timestamp=parse_datetime(entry["timestamp"]),
+            )
+            for entry in entries
+        ])
+
+    def _write_isolating(self, entries):
+        """
+        Write entries with one bulk insert. If the database rejects the batch
+        for its content, write each half separately, down to single rows; a
+        row rejected on its own is dead-lettered. Stops at the first outage.
+        Returns (written, unwritten, outage error or None).
+        """
+        written = 0
+        pending = [entries]
+        while pending:
+            batch = pending.pop()
+            try:
+                close_old_connections()
+                self._write(batch)
+                written += len(batch)
+            except OUTAGE_ERRORS as e:
+                pending.append(batch)
+                return written, [entry for rest in reversed(pending) for entry in rest], e
+            except Exception as e:
+                if len(batch) == 1:
+                    self._dead_letter(batch[0], e)
+                else:
+                    middle = len(batch) // 2
+                    pending += [batch[middle:], batch[:middle]]
+        return written, [], None
+
+    def _dead_letter(self, entry, error):
+        print(f"[AUDIT LOG] Record rejected, moving it to {self.dead_letter_path}: {error}")
+        try:
+            with self._lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"record": entry, "error": str(error)}, default=str) + "\n")
+            self.dead_lettered += 1
+        except OSError as e:
+            print(f"[AUDIT LOG] Could not write to {self.dead_letter_path}: {e}")
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        # A forked worker inherits the object but not the thread.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="audit-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopping and len(self._buffer) < self.flush_size:
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def _requeue(self, entries):
+        with self._lock:
+            room = max(self.buffer_limit - len(self._buffer), 0)
+            self._buffer.extendleft(reversed(entries[:room]))
+        self._overflow(entries[room:])
+
+    def _overflow(self, entries):
+        if not entries:
+            return
+        if self.mode == SPILL:
+            try:
+                with self._lock, self._file_lock(self._lock_path(), fcntl.LOCK_SH), \
+                        open(self.spill_path, "a", encoding="utf-8") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry) + "\n")
+                self.spilled += len(entries)
+                return
+            except OSError as e:
+                print(f"[AUDIT LOG] Could not spill to {self.spill_path}: {e}")
+        self.dropped += len(entries)
+        print(f"[AUDIT LOG] Dropped {len(entries)} records")
+
+    def _processing_path(self):
+        return f"{self.spill_path}.flushing"
+
+    def _lock_path(self):
+        return f"{self.spill_path}.lock"
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path, operation):
+        with open(path, "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _replaying(self):
+        """
+        True while this process holds the right to replay the spill file.
+        Another process replaying it, or no spill mode, yields False.
+        """
+        if self.mode != SPILL:
+            yield False
+            return
+        lock = None
+        try:
+            lock = open(f"{self._processing_path()}.lock", "a")
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            if not isinstance(e, BlockingIOError):
+                print(f"[AUDIT LOG] Could not lock {self.spill_path} for replay: {e}")
+            if lock is not None:
+                lock.close()
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def _read_spill(self):
+        # Rename first so records spilled during the flush go to a fresh file.
+        # Appenders hold a shared lock, so none is mid-write into the renamed file.
+        processing = self._processing_path()
+        with self._lock, self._file_lock(self._lock_path(), fcntl.LOCK_EX):
+            if os.path.exists(self.spill_path) and not os.path.exists(processing):
+                os.replace(self.spill_path, processing)
+        if not os.path.exists(processing):
+            return []
+        with open(processing, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _clear_spill(self):
+        try:
+            os.remove(self._processing_path())
+        except FileNotFoundError:
+            pass
+
+
+def serialize_logs(logs):
+    """
+    AuditLog rows as dicts with the titles of their documents, fetched with
+    one query for the whole batch instead of one per row. "documents" lists
+    the documents that still exist; "document_ids" is the record as stored.
+    """
+    ids = {str(doc_id) for log in logs for doc_id in log.document_ids}
+    titles = dict(Document.objects.filter(id__in=ids).values_list("id", "title")) if ids else {}
+
+    return [
+        {
+            "timestamp": log.timestamp.isoformat(),
+            "question": log.question,
+            "document_ids": [str(doc_id) for doc_id in log.document_ids],
+            "documents": [
+                {"id": str(doc_id), "title": titles[str(doc_id)]}
+                for doc_id in log.document_ids
+                if str(doc_id) in titles
+            ],
+            "agent_id": log.agent_id,
+        }
+        for log in logs
+    ]
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+EXPORT_FIELDS = ["timestamp", "question", "agent_id", "document_ids", "document_titles"]
+
+
+def export_logs(queryset, fmt="csv", batch_size=500):
+    """
+    Yield the log as CSV or NDJSON lines. Rows are read through a server-side
+    cursor and titled one batch at a time, so memory does not grow with the log.
+    """
+    writer = csv.writer(_Echo())
+    if fmt == "csv":
+        yield writer.writerow(EXPORT_FIELDS)
+
+    batch = []
+    for log in queryset.iterator(chunk_size=batch_size):
+        batch.append(log)
+        if len(batch) >= batch_size:
+            yield from _export_batch(batch, fmt, writer)
+            batch = []
+    if batch:
+        yield from _export_batch(batch, fmt, writer)
+
+
+def _export_batch(logs, fmt, writer):
+    for entry in serialize_logs(logs):
+        if fmt == "ndjson":
+            yield json.dumps(entry) + "\n"
+        else:
+            # Deleted documents keep their id, with a blank title.
+            titles = {doc["id"]: doc["title"] for doc in entry["documents"]}
+            yield writer.writerow([
+                entry["timestamp"],
+                entry["question"],
+                entry["agent_id"],
+                " ".join(entry["document_ids"]),
+                " | ".join(titles.get(doc_id, "") for doc_id in entry["document_ids"]),
+            ])
+
+
+audit_sink = AuditSink()
+atexit.register(audit_sink.close)
+
+
+@metrics.register_collector
+def _audit_metrics():
+    stats = audit_sink.stats()
+    return [
+        ("legalmind_audit_buffered", "Audit records waiting to be written.", "gauge", {"": stats["buffered"]}),
+        ("legalmind_audit_records_total", "Audit records, by outcome.", "counter", {
+            f'outcome="{outcome}"': stats[outcome]
+            for outcome in ("enqueued", "flushed", "dropped", "spilled", "dead_lettered")
+        }),
+        ("legalmind_audit_failed_flushes_total", "Audit flushes that raised.", "counter", {"": stats["failed_flushes"]}),
+    ]
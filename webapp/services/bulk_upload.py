@@ -0,0 +1,149 @@
+# webapp/services/bulk_upload.py
+import os
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from webapp.models import Document
+from .fga_client import fga_service
+from .ingestion_queue import discard_staged_file, enqueue_documents, stage_stream
+
+READ_SIZE = 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+
+
+class FGAWriteError(Exception):
+    """The FGA tuples of a bulk upload could not be written; nothing was saved."""
+
+
+def iter_zip_entries(archive):
+    """
+    Yield (file_name, chunk_iterator) for every PDF in a ZIP archive. Members
+    are decompressed in READ_SIZE chunks, never whole.
+    """
+    with zipfile.ZipFile(archive) as bundle:
+        for info in bundle.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            if info.file_size > settings.BULK_UPLOAD_MAX_FILE_SIZE:
+                yield name, ValueError("File is too large")
+                continue
+            with bundle.open(info) as member:
+                yield name, iter(lambda: member.read(READ_SIZE), b"")
+
+
+def iter_upload_entries(files=(), archive=None):
+    for uploaded in files:
+        yield uploaded.name, uploaded.chunks()
+    if archive is not None:
+        yield from iter_zip_entries(archive)
+
+
+def _stage_entry(name, chunks):
+    if isinstance(chunks, Exception):
+        raise chunks
+    if not name.lower().endswith(".pdf"):
+        raise ValueError("Only PDF files are accepted")
+    path = stage_stream(chunks, max_bytes=settings.BULK_UPLOAD_MAX_FILE_SIZE)
+    with open(path, "rb") as staged:
+        if staged.read(len(PDF_MAGIC)) != PDF_MAGIC:
+            discard_staged_file(path)
+            raise ValueError("Not a PDF file")
+    return path
+
+
+def _store(document, name, path):
+    """Upload a staged file to the document's storage (Cloudinary), without saving the row."""
+    with open(path, "rb") as staged:
+        document.file.save(name, File(staged), save=False)
+    return document
+
+
+def _discard_stored(documents, source_paths):
+    """Delete the staged copies and stored files of documents that were never saved."""
+    for path in source_paths.values():
+        discard_staged_file(path)
+    for document in documents:
+        try:
+            document.file.delete(save=False)
+        except Exception as e:
+            print(f"[UPLOAD] Could not delete {document.file.name} from storage: {e}")
+
+
+def bulk_upload(user, files=(), archive=None, shared=False):
+    """
+    Create one Document per PDF among `files` and the entries of a ZIP
+    `archive`. Every entry is streamed to the staging directory first, then
+    the files are sent to storage on BULK_UPLOAD_CONCURRENCY threads. The
+    documents are inserted with a single bulk_create, their FGA tuples are
+    written in batches, and one ingestion job per document is queued under a
+    shared batch id for the ingest_worker pool. If any of that fails, no
+    document is kept: the rows roll back and the files are deleted.
+
+    Returns {"batch_id", "documents": [Document], "skipped": [{"name", "error"}]}.
+    Raises ValueError past BULK_UPLOAD_MAX_FILES, FGAWriteError if the tuples
+    cannot be written.
+    """
+    staged, skipped = [], []
+    try:
+        for name, chunks in iter_upload_entries(files, archive):
+            if len(staged) >= settings.BULK_UPLOAD_MAX_FILES:
+                raise ValueError(f"At most {settings.BULK_UPLOAD_MAX_FILES} files per upload")
+            try:
+                staged.append((name, _stage_entry(name, chunks)))
+            except ValueError as e:
+                skipped.append({"name": name, "error": str(e)})
+    except Exception:
+        for _, path in staged:
+            discard_staged_file(path)
+        raise
+
+    documents = [
+        Document(user=user, title=os.path.splitext(name)[0][:255], shared=shared)
+        for name, _ in staged
+    ]
+    stored, source_paths = [], {}
+    with ThreadPoolExecutor(max_workers=settings.BULK_UPLOAD_CONCURRENCY) as pool:
+        futures = [
+            (document, name, path, pool.submit(_store, document, name, path))
+            for document, (name, path) in zip(documents, staged)
+        ]
+        for document, name, path, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[UPLOAD] Storing {name} failed: {e}")
+                skipped.append({"name": name, "error": f"Storage failed: {e}"})
+                discard_staged_file(path)
+                continue
+            stored.append(document)
+            source_paths[document.id] = path
+
+    batch_id = uuid.uuid4().hex
+    try:
+        # The rows and jobs commit only with their tuples; tuples written
+        # before a failure name rolled-back ids, so they grant nothing.
+        with transaction.atomic():
+            # bulk_create skips post_save, so the owner tuples and jobs are created here.
+            Document.objects.bulk_create(stored)
+
+            tuples = [(f"user:{user.email}", "owner", document.id) for document in stored]
+            if shared:
+                tuples += [("user:*", "viewer", document.id) for document in stored]
+            try:
+                fga_service.add_document_tuples(tuples)
+            except Exception as e:
+                print(f"[FGA ERROR] {e}")
+                raise FGAWriteError(str(e)) from e
+
+            enqueue_documents(stored, source_paths, batch_id=batch_id)
+    except Exception:
+        _discard_stored(stored, source_paths)
+        raise
+    print(f"[UPLOAD] Batch {batch_id}: {len(stored)} stored, {len(skipped)} skipped")
+    return {"batch_id": batch_id, "documents": stored, "skipped": skipped}
@@ -0,0 +1,124 @@
+# webapp/services/caching.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hit_rate, 4)}
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire after `ttl` seconds.
+    When `backend` names a Django cache alias, misses fall through to that
+    shared cache and writes go to both, so several processes share results.
+    Shared entries carry their wall-clock expiry, so a value copied into
+    another process's local cache expires when the original entry does.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, backend=None, prefix=""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prefix = prefix
+        self.shared = caches[backend] if backend else None
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def _local_get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _from_shared(self, key, item):
+        """Copy a shared (expires_at, value) entry into the local cache for what is left of its TTL."""
+        if not isinstance(item, tuple) or len(item) != 2:
+            return _MISSING
+        expires_at, value = item
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return _MISSING
+        self._local_set(key, value, min(remaining, self.ttl))
+        return value
+
+    def get(self, key, default=None):
+        value = self._local_get(key)
+        if value is _MISSING and self.shared is not None:
+            value = self._from_shared(key, self.shared.get(self.prefix + key, _MISSING))
+        if value is _MISSING:
+            self.stats.record(misses=1)
+            return default
+        self.stats.record(hits=1)
+        return value
+
+    async def aget(self, key, default=None):
+        value = self._local_get(key)
+        if value is _MISSING and self.shared is not None:
+            value = self._from_shared(key, await self.shared.aget(self.prefix + key, _MISSING))
+        if value is _MISSING:
+            self.stats.record(misses=1)
+            return default
+        self.stats.record(hits=1)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._local_set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(self.prefix + key, (time.time() + ttl, value), ttl)
+
+    async def aset(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._local_set(key, value, ttl)
+        if self.shared is not None:
+            await self.shared.aset(self.prefix + key, (time.time() + ttl, value), ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self.prefix + key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
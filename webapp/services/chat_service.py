@@ -1,24 +1,42 @@
 # webapp/services/chat_service.py
 
+import asyncio
+import threading
 from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-from asgiref.sync import async_to_sync
-from .embeddings import get_vector_store
-from auth0_ai_langchain import FGARetriever
-from openfga_sdk.client.models import ClientBatchCheckItem
-from ..models import AuditLog
-from django.contrib.auth import get_user_model
-
-User = get_user_model()
+from langchain_core.messages import AIMessage, HumanMessage
+from asgiref.sync import sync_to_async
+from . import metrics
+from .audit import audit_sink
+from .condense import needs_condensing
+from .providers import get_chat_model
+from .retrieval import build_authorized_retriever, retrieval_user
+from django.conf import settings
 
 class ChatService:
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.1)
+    # Retrieval settings; the ANN knobs trade recall for latency per query.
+    RETRIEVER_CONFIG = {
+        "k": 4,
+        "hybrid": settings.RETRIEVAL_HYBRID,
+        "ef_search": settings.VECTOR_HNSW_EF_SEARCH or None,
+        "probes": settings.VECTOR_IVFFLAT_PROBES or None,
+        "iterative_scan": settings.VECTOR_HNSW_ITERATIVE_SCAN or None,
+    }
+
+    def __init__(self, llm=None, retriever=None, answer_cache=None, condense_mode=None):
+        self.llm = llm or get_chat_model()
+        self._retriever = retriever
+        # Optional SemanticAnswerCache, consulted for questions without history.
+        self.answer_cache = answer_cache
+        # "always": condense every follow-up, then retrieve (ConversationalRetrievalChain).
+        # "auto": condense only when needed, in parallel with retrieval, over a rolling summary.
+        self.condense_mode = condense_mode or settings.CHAT_CONDENSE_MODE
+        self._qa_chain = None
+        self._chain_lock = threading.Lock()
 
-        
         prompt_template = """
         You are an AI assistant specialized in answering questions about private legal and corporate documents. 
         Your responses should:
@@ -46,108 +64,225 @@ class ChatService:
             input_variables=["chat_history", "context", "question"],
             template=prompt_template,
         )
+        # Same prompt and LLM as the chain's answer step, exposed for token streaming.
+        self.answer_chain = self.PROMPT | self.llm | StrOutputParser()
 
-    def _build_retriever(self, email: str):
-        """Build FGA-filtered retriever."""
-        vector_store = async_to_sync(get_vector_store)()
-        if not vector_store:
-            raise ValueError("No vector store available.")
-        
-        base_retriever = vector_store.as_retriever(search_kwargs={"k": 4})
-        return FGARetriever(
-            retriever=base_retriever,
-            build_query=lambda doc: ClientBatchCheckItem(
-                user=f"user:{email}",
-                object=f"doc:{doc.metadata.get('document_id')}",
-                relation="viewer",
+        self.SUMMARY_PROMPT = PromptTemplate(
+            input_variables=["summary", "lines"],
+            template=(
+                "Progressively summarize this conversation about legal documents, "
+                "keeping the documents, parties, clauses and facts discussed.\n\n"
+                "Current summary:\n{summary}\n\n"
+                "New lines of conversation:\n{lines}\n\n"
+                "New summary:"
             ),
         )
+        self.summary_chain = self.SUMMARY_PROMPT | self.llm | StrOutputParser()
+
+    def _build_retriever(self, email: str | None = None):
+        """Build FGA-filtered retriever. Without an email it serves the user set by retrieval_user()."""
+        return build_authorized_retriever(email, **self.RETRIEVER_CONFIG)
+
+    @property
+    def qa_chain(self):
+        """
+        The retrieval chain, built once per process and shared by every request.
+        It holds no per-user state: the user comes from retrieval_user() and the
+        history is passed in with each call, so concurrent calls are safe.
+        """
+        if self._qa_chain is None:
+            with self._chain_lock:
+                if self._qa_chain is None:
+                    self._qa_chain = ConversationalRetrievalChain.from_llm(
+                        llm=self.llm,
+                        retriever=self._retriever or self._build_retriever(),
+                        return_source_documents=True,
+                        combine_docs_chain_kwargs={"prompt": self.PROMPT},
+                        verbose=False,
+                    )
+        return self._qa_chain
+
+    @staticmethod
+    def _to_messages(history: List[Dict[str, Any]]):
+        messages = []
+        for msg in history or []:
+            if msg.get('role') == 'user':  
+                messages.append(HumanMessage(content=msg['content']))
+            elif msg.get('role') == 'assistant':
+                messages.append(AIMessage(content=msg['content']))
+        return messages
+
+    @staticmethod
+    def _sources(source_docs) -> tuple[List[str], str]:
+        sources = list(set(doc.metadata.get("document_id", "Unknown") for doc in source_docs))
+        return sources, ChatService._source_str(sources)
+
+    @staticmethod
+    def _source_str(sources: List[str]) -> str:
+        return f"Sources: {', '.join(sources)}" if sources else ""
+
+    async def _acached_answer(self, email: str, question: str, messages):
+        if self.answer_cache is None or messages:
+            return None
+        try:
+            return await self.answer_cache.alookup(email, question)
+        except Exception as e:
+            print(f"[ANSWER CACHE] Lookup failed: {e}")
+            return None
+
+    async def _acache_answer(self, question: str, answer: str, sources: List[str], messages):
+        if self.answer_cache is None or messages:
+            return
+        try:
+            await self.answer_cache.astore(question, answer, sources)
+        except Exception as e:
+            print(f"[ANSWER CACHE] Store failed: {e}")
 
-    def get_response(self, email: str, question: str, history: List[Dict[str, Any]]) -> tuple[str, str, List[Dict[str, Any]]]:
+    def log_query(self, user_id: int, question: str, sources: List[str]):
         """
-        Generate chat response.
-        :param email: User email for FGA checks.
-        :param question: Current question.
-        :param history: List of message dicts from session.
-        :return: (answer, sources_str, updated_history)
+        Hand the record to the audit sink. In the default buffered mode this
+        only appends to an in-memory queue; the rows are bulk inserted later.
         """
         try:
-            
-            from langchain.schema import HumanMessage, AIMessage
-
-            
-            memory = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True,
-                output_key="answer"
-            )
-            if history:
-                
-                messages = []
-                for msg in history:
-                    if msg.get('role') == 'user':  
-                        messages.append(HumanMessage(content=msg['content']))
-                    elif msg.get('role') == 'assistant':
-                        messages.append(AIMessage(content=msg['content']))
-                memory.chat_memory.add_messages(messages)
-
-        
-            retriever = self._build_retriever(email)
-            qa_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                retriever=retriever,
-                memory=memory,
-                return_source_documents=True,
-                combine_docs_chain_kwargs={"prompt": self.PROMPT},
-                verbose=False,
-            )
-
-        
-            result = qa_chain({"question": question})
-            answer = result["answer"].strip()
-
-            
-            updated_history = memory.chat_memory.messages
-
-
-            
-            source_docs = result.get("source_documents", [])
-            print(f"[CHAT SERVICE] Retrieved {len(source_docs)} documents for user {email}:")
-            for doc in source_docs:
-                doc_id = doc.metadata.get("document_id", "Unknown")
-                title = doc.metadata.get("title", "No title")
-                # print(f" - Doc ID: {doc_id}, Title: {title}")
-
-            
-            source_docs = result.get("source_documents", [])
-            sources = list(set(doc.metadata.get("document_id", "Unknown") for doc in source_docs))
-            source_str = f"Sources: {', '.join(sources)}" if sources else ""
-            try:
-                user_obj = User.objects.get(email=email)
-                AuditLog.objects.create(
-                    user=user_obj,
-                    question=question,
-                    document_ids=sources, 
-                    agent_id="query agent"  
-                    
+            audit_sink.record(user_id, question, sources)
+        except Exception as e:
+            print(f"[AUDIT LOG] Failed to log query: {e}")
+
+    async def alog_query(self, user_id: int, question: str, sources: List[str]):
+        if audit_sink.mode == "sync":
+            await sync_to_async(self.log_query)(user_id, question, sources)
+        else:
+            self.log_query(user_id, question, sources)
+
+    def _history_text(self, messages, summary: str = "") -> str:
+        chat_history = (self.qa_chain.get_chat_history or _get_chat_history)(messages)
+        if summary:
+            return f"Summary of the earlier conversation: {summary}\n{chat_history}"
+        return chat_history
+
+    @staticmethod
+    def _retrieval_query(question: str, messages) -> str:
+        """The raw question, prefixed by the previous user turn so references have a referent."""
+        previous = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        return f"{previous} {question}".strip()
+
+    async def _aprepare(self, email: str, question: str, messages, summary: str = ""):
+        """
+        Resolve the standalone question and the source documents.
+        Returns (standalone_question, source_docs, chat_history_text).
+        """
+        chain = self.qa_chain
+        chat_history = self._history_text(messages, summary)
+        has_history = bool(messages or summary)
+
+        async def retrieve(query):
+            with metrics.stage("retrieval"), retrieval_user(email):
+                return await chain.retriever.ainvoke(query)
+
+        async def condense():
+            with metrics.stage("llm_condense"):
+                condensed = await chain.question_generator.ainvoke(
+                    {"question": question, "chat_history": chat_history}
                 )
-                # print(f"[AUDIT LOG] Logged query for user {email} with docs: {sources}")
-            except Exception as e:
-                print(f"[AUDIT LOG] Failed to log query: {e}")
+            return condensed["text"]
+
+        if self.condense_mode == "always":
+            standalone = await condense() if has_history else question
+            return standalone, await retrieve(standalone), chat_history
+
+        if not needs_condensing(question, has_history):
+            return question, await retrieve(question), chat_history
+
+        # Condensing only rewrites the question for the answer prompt; retrieval
+        # does not wait for it.
+        standalone, source_docs = await asyncio.gather(
+            condense(), retrieve(self._retrieval_query(question, messages))
+        )
+        return standalone, source_docs, chat_history
+
+    async def astream_answer(self, email: str, question: str, history: List[Dict[str, Any]], summary: str = ""):
+        """
+        Stream the answer: condense the question if needed, retrieve, then generate.
+        Yields {"type": "token", "text": ...} per generated token, then
+        {"type": "done", "answer", "sources", "source_str"}. Saving the history
+        and the audit log is left to the caller, once the stream is delivered.
+        """
+        messages = self._to_messages(history)
+
+        cached = await self._acached_answer(email, question, messages or summary)
+        if cached:
+            yield {"type": "token", "text": cached["answer"]}
+            yield {
+                "type": "done",
+                "answer": cached["answer"],
+                "sources": cached["sources"],
+                "source_str": self._source_str(cached["sources"]),
+            }
+            return
+
+        standalone, source_docs, chat_history = await self._aprepare(email, question, messages, summary)
+        print(f"[CHAT SERVICE] Retrieved {len(source_docs)} documents for user {email}:")
+
+        parts = []
+        # Includes the time the caller takes to send each token on.
+        with metrics.stage("llm_answer"):
+            async for token in self.answer_chain.astream({
+                "context": "\n\n".join(doc.page_content for doc in source_docs),
+                "question": standalone,
+                "chat_history": chat_history,
+            }):
+                parts.append(token)
+                yield {"type": "token", "text": token}
+
+        answer = "".join(parts).strip()
+        sources, source_str = self._sources(source_docs)
+        await self._acache_answer(question, answer, sources, messages or summary)
+        yield {"type": "done", "answer": answer, "sources": sources, "source_str": source_str}
+
+    async def asummarize(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """Fold message dicts into the running summary with one LLM call."""
+        with metrics.stage("llm_summary"):
+            return (await self.summary_chain.ainvoke({
+                "summary": summary or "(none)",
+                "lines": _get_chat_history(self._to_messages(messages)),
+            })).strip()
+
+    async def aget_response(self, email: str, question: str, history: List[Dict[str, Any]], user_id: int | None = None,
+                            summary: str = "") -> tuple[str, str, List[str]]:
+        """
+        Answer a question for the ASGI chat views. The LLM, vector search and
+        OpenFGA calls all await I/O, so one event loop can serve many chats at once.
+        :param summary: Rolling summary of the conversation before `history`.
+        :return: (answer, sources_str, source_document_ids); storing the turn
+            is left to the caller (see services/conversations.py).
+        """
+        try:
+            messages = self._to_messages(history)
+            cached = await self._acached_answer(email, question, messages or summary)
+            if cached:
+                answer, sources = cached["answer"], cached["sources"]
+                source_str = self._source_str(sources)
+            else:
+                standalone, source_docs, chat_history = await self._aprepare(email, question, messages, summary)
+                print(f"[CHAT SERVICE] Retrieved {len(source_docs)} documents for user {email}:")
 
+                with metrics.stage("llm_answer"):
+                    answer = (await self.answer_chain.ainvoke({
+                        "context": "\n\n".join(doc.page_content for doc in source_docs),
+                        "question": standalone,
+                        "chat_history": chat_history,
+                    })).strip()
 
+                sources, source_str = self._sources(source_docs)
+                await self._acache_answer(question, answer, sources, messages or summary)
 
-            
-            history_dicts = []
-            for msg in updated_history:
-                history_dicts.append({
-                    "role": "user" if isinstance(msg, HumanMessage) else "assistant",                  "content": msg.content
-                })
+            if user_id is not None:
+                await self.alog_query(user_id, question, sources)
 
-            return answer, source_str, history_dicts
+            return answer, source_str, sources
 
         except Exception as e:
             print(f"[CHAT SERVICE] Error: {e}")
             import traceback
             traceback.print_exc()
-            return "Sorry, something went wrong. Try rephrasing!", "", history  
\ No newline at end of file
+            return "Sorry, something went wrong. Try rephrasing!", "", []
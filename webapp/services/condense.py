@@ -0,0 +1,30 @@
+# webapp/services/condense.py
+import re
+
+# Words that usually point back at something said earlier in the chat.
+_REFERENCES = re.compile(
+    r"\b(it|its|this|these|those|they|them|their|he|him|his|she|her|"
+    r"same|above|previous|earlier|former|latter)\b",
+    re.IGNORECASE,
+)
+_FOLLOW_UP_START = re.compile(
+    r"^\s*(and|but|or|so|also|what about|how about|why|what else)\b",
+    re.IGNORECASE,
+)
+MIN_STANDALONE_WORDS = 4
+
+
+def needs_condensing(question, has_history):
+    """
+    Whether a question has to be rewritten with the chat history before it
+    can be answered on its own. Decided locally, so self-contained follow-ups
+    ("What is the notice period in the Acme lease?") skip an LLM round trip.
+    Errs towards condensing: a false positive only costs latency.
+    """
+    if not has_history:
+        return False
+    if len(re.findall(r"\w+", question)) < MIN_STANDALONE_WORDS:
+        return True
+    if _FOLLOW_UP_START.search(question):
+        return True
+    return bool(_REFERENCES.search(question))
@@ -0,0 +1,150 @@
+# webapp/services/conversations.py
+from functools import lru_cache
+
+import tiktoken
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import ChatMessage, Conversation
+
+SESSION_KEY = "conversation_id"
+# Chat state the session used to carry; dropped from sessions as they are seen.
+LEGACY_SESSION_KEYS = ("chat_history", "chat_memory")
+TITLE_LENGTH = 60
+# Rows scanned for the token budget; a budget never needs more than this.
+HISTORY_SCAN_LIMIT = 200
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        return tiktoken.encoding_for_model(settings.CHAT_MODEL_NAME)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # e.g. offline, without the BPE file cached.
+            print(f"[CHAT] No tokenizer available, estimating tokens as chars / 4: {e}")
+            return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+async def aget_current(session, user, conversation_id=None, create=False):
+    """
+    The conversation named by conversation_id, else the one in the session,
+    else (with create=True) a new one. Whatever is returned becomes the
+    session's current conversation; other users' ids are ignored.
+    """
+    for key in LEGACY_SESSION_KEYS:
+        await session.apop(key, None)
+
+    session_id = await session.aget(SESSION_KEY)
+    conversation = None
+    for candidate in (conversation_id, session_id):
+        if candidate:
+            conversation = await Conversation.objects.filter(pk=candidate, user=user).afirst()
+            if conversation:
+                break
+    if conversation is None and create:
+        conversation = await Conversation.objects.acreate(user=user)
+    if conversation is not None and conversation.pk != session_id:
+        await session.aset(SESSION_KEY, conversation.pk)
+    return conversation
+
+
+async def aload_history(conversation, budget=None):
+    """
+    What the LLM sees of a conversation: (summary, messages), where messages
+    are the newest unsummarised {"role", "content"} dicts whose stored token
+    counts, plus the summary's, fit in `budget` (CHAT_HISTORY_TOKEN_BUDGET).
+    """
+    if conversation is None:
+        return "", []
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET if budget is None else budget
+    if conversation.summary:
+        budget -= count_tokens(conversation.summary)
+
+    rows = (
+        ChatMessage.objects.filter(conversation=conversation, id__gt=conversation.summarized_through)
+        .order_by("-id")
+        .values("role", "content", "tokens")[:HISTORY_SCAN_LIMIT]
+    )
+    messages, used = [], 0
+    async for row in rows:
+        used += row["tokens"]
+        if used > budget:
+            break
+        messages.append({"role": row["role"], "content": row["content"]})
+    messages.reverse()
+    # Start on a question, not on an answer whose question was cut off.
+    if messages and messages[0]["role"] == ChatMessage.Role.ASSISTANT:
+        messages.pop(0)
+    return conversation.summary, messages
+
+
+async def arecent_messages(conversation, limit=None):
+    """The last `limit` messages (CHAT_DISPLAY_MESSAGES) for display, oldest first."""
+    if conversation is None:
+        return []
+    limit = limit or settings.CHAT_DISPLAY_MESSAGES
+    rows = [
+        row async for row in ChatMessage.objects.filter(conversation=conversation)
+        .order_by("-id")
+        .values("role", "content", "sources")[:limit]
+    ]
+    rows.reverse()
+    return rows
+
+
+async def aappend_turn(conversation, question, answer, sources=()):
+    """
+    Append a question and its answer: one two-row insert plus one update of
+    the conversation. Earlier messages are never rewritten.
+    """
+    await ChatMessage.objects.abulk_create([
+        ChatMessage(conversation=conversation, role=ChatMessage.Role.USER,
+                    content=question, tokens=count_tokens(question)),
+        ChatMessage(conversation=conversation, role=ChatMessage.Role.ASSISTANT,
+                    content=answer, sources=list(sources), tokens=count_tokens(answer)),
+    ])
+    updates = {"updated_at": timezone.now()}
+    if not conversation.title:
+        conversation.title = updates["title"] = question[:TITLE_LENGTH]
+    await Conversation.objects.filter(pk=conversation.pk).aupdate(**updates)
+
+
+async def acompact(conversation, summarize, keep=None, batch=None):
+    """
+    Once `keep` + `batch` (CHAT_RECENT_MESSAGES + CHAT_SUMMARY_BATCH) messages
+    are unsummarised, fold all but the newest `keep` into the summary with
+    `await summarize(summary, older_messages)`. Only the conversation row is
+    updated. Returns True when the summary moved on.
+    """
+    keep = settings.CHAT_RECENT_MESSAGES if keep is None else keep
+    batch = settings.CHAT_SUMMARY_BATCH if batch is None else batch
+    pending = ChatMessage.objects.filter(conversation=conversation, id__gt=conversation.summarized_through)
+    if await pending.acount() < keep + batch:
+        return False
+
+    rows = [row async for row in pending.order_by("id").values("id", "role", "content")]
+    older = rows[:-keep] if keep else rows
+    try:
+        summary = await summarize(conversation.summary, older)
+    except Exception as e:
+        print(f"[CHAT] Summary update failed for conversation {conversation.pk}: {e}")
+        return False
+
+    through = older[-1]["id"]
+    # Another request may have compacted meanwhile; its summary then stands.
+    updated = await Conversation.objects.filter(
+        pk=conversation.pk, summarized_through=conversation.summarized_through
+    ).aupdate(summary=summary, summarized_through=through)
+    if updated:
+        conversation.summary, conversation.summarized_through = summary, through
+    return bool(updated)
@@ -0,0 +1,145 @@
+# webapp/services/embedding_cache.py
+import hashlib
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from langchain_core.embeddings import Embeddings
+
+from webapp.models import Embedding, EmbeddingCacheEntry
+from . import metrics
+from .caching import CacheStats, TTLCache
+from .providers import model_name_with_dimensions
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normalise chunk text so formatting-only differences share a cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embedding_model):
+    name = getattr(embedding_model, "model", None) or type(embedding_model).__name__
+    return model_name_with_dimensions(name, getattr(embedding_model, "dimensions", None))
+
+
+stats = CacheStats()
+
+
+def embed_documents_cached(texts, embedding_model):
+    """
+    Embed texts, looking them up in the cache first with one query per batch.
+    Only cache misses are sent to the provider, deduplicated within the batch,
+    and their vectors are written back for the next upload.
+    Returns (vectors, content_hashes) in the order of texts.
+    """
+    hashes = [content_hash(text) for text in texts]
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        with metrics.stage("embed"):
+            return embedding_model.embed_documents(texts), hashes
+
+    model_name = embedding_model_name(embedding_model)
+    vectors = dict(
+        EmbeddingCacheEntry.objects.filter(model=model_name, text_hash__in=set(hashes))
+        .values_list("text_hash", "embedding")
+    )
+
+    missing = {}
+    for text, text_hash in zip(texts, hashes):
+        if text_hash not in vectors and text_hash not in missing:
+            missing[text_hash] = text
+
+    if missing:
+        with metrics.stage("embed"):
+            new_vectors = embedding_model.embed_documents(list(missing.values()))
+        vectors.update(zip(missing.keys(), new_vectors))
+        EmbeddingCacheEntry.objects.bulk_create(
+            [
+                EmbeddingCacheEntry(model=model_name, text_hash=text_hash, embedding=vectors[text_hash])
+                for text_hash in missing
+            ],
+            ignore_conflicts=True,
+        )
+
+    stats.record(hits=len(texts) - len(missing), misses=len(missing))
+    return [vectors[text_hash] for text_hash in hashes], hashes
+
+
+def collect_garbage(grace_period_hours=None, dry_run=False):
+    """
+    Delete cache entries that no Embedding row of the same model references
+    any more, so a retired model's vectors go even when its chunk texts are
+    still stored under another model. Entries younger than the grace period are kept, since an ingestion
+    may have cached them without having written its Embedding rows yet.
+    """
+    if grace_period_hours is None:
+        grace_period_hours = settings.EMBEDDING_CACHE_GC_GRACE_HOURS
+    cutoff = timezone.now() - timedelta(hours=grace_period_hours)
+    orphans = EmbeddingCacheEntry.objects.filter(
+        ~Exists(Embedding.objects.filter(content_hash=OuterRef("text_hash"), version__model=OuterRef("model"))),
+        created_at__lt=cutoff,
+    )
+    if dry_run:
+        return orphans.count()
+    deleted, _ = orphans.delete()
+    return deleted
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so repeated questions reuse their query vector.
+    Used as the vector store's embedding service, so chat and search share it.
+    Document embedding is passed straight through.
+    """
+
+    def __init__(self, embeddings, cache=None):
+        self.embeddings = embeddings
+        self.cache = cache or TTLCache(
+            maxsize=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+            backend=settings.QUERY_EMBEDDING_CACHE_BACKEND or None,
+            prefix="query-embedding:",
+        )
+
+    @property
+    def model(self):
+        return embedding_model_name(self.embeddings)
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def _key(self, text):
+        return f"{self.model}:{content_hash(text)}"
+
+    def embed_query(self, text):
+        key = self._key(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            with metrics.stage("embed_query"):
+                vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        key = self._key(text)
+        vector = await self.cache.aget(key)
+        if vector is None:
+            with metrics.stage("embed_query"):
+                vector = await self.embeddings.aembed_query(text)
+            await self.cache.aset(key, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
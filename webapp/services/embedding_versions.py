@@ -0,0 +1,91 @@
+# webapp/services/embedding_versions.py
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from ..models import EmbeddingVersion
+from .embedding_cache import CachedQueryEmbeddings
+from .providers import configured_embedding_model_name, get_embedding_model
+
+Status = EmbeddingVersion.Status
+
+_models = {}
+_models_lock = threading.Lock()
+# provider -> (expires_at, active EmbeddingVersion)
+_active = {}
+
+
+def embedding_models(model_name):
+    """
+    (embedding model, CachedQueryEmbeddings) for a model of EMBEDDING_PROVIDER,
+    built once per process. All of them share one query cache, whose keys
+    already include the model name.
+    """
+    with _models_lock:
+        if model_name not in _models:
+            model = get_embedding_model(model_name)
+            shared = next(iter(_models.values()))[1].cache if _models else None
+            _models[model_name] = (model, CachedQueryEmbeddings(model, cache=shared))
+        return _models[model_name]
+
+
+def query_embeddings(version):
+    return embedding_models(version.model)[1]
+
+
+def index_version_for(model_name):
+    """Document.index_version of chunks embedded by model_name with the current splitter."""
+    return f"{model_name}:{settings.CHUNK_SIZE}:{settings.CHUNK_OVERLAP}"
+
+
+def _load_active():
+    provider = settings.EMBEDDING_PROVIDER
+    version = EmbeddingVersion.objects.filter(provider=provider, status=Status.ACTIVE).first()
+    if version is None:
+        # First use of this provider: its configured model starts out active.
+        try:
+            version, _ = EmbeddingVersion.objects.update_or_create(
+                provider=provider, model=configured_embedding_model_name(),
+                defaults={"status": Status.ACTIVE, "activated_at": timezone.now()},
+            )
+        except IntegrityError:
+            version = EmbeddingVersion.objects.get(provider=provider, status=Status.ACTIVE)
+    _active[provider] = (time.monotonic() + settings.EMBEDDING_VERSION_CACHE_TTL, version)
+    return version
+
+
+def _cached_active():
+    expires_at, version = _active.get(settings.EMBEDDING_PROVIDER, (0.0, None))
+    return version if time.monotonic() < expires_at else None
+
+
+def active_version():
+    """
+    The version retrieval reads and ingestion writes. Looked up at most once
+    per EMBEDDING_VERSION_CACHE_TTL seconds, so a cutover reaches every
+    process within that time without a restart.
+    """
+    return _cached_active() or _load_active()
+
+
+async def aactive_version():
+    return _cached_active() or await sync_to_async(_load_active)()
+
+
+def forget_active():
+    _active.clear()
+
+
+def version_for(model_name):
+    """The version chunks embedded by model_name belong to; a new model starts out BUILDING."""
+    active = active_version()
+    if active.model == model_name:
+        return active
+    version, _ = EmbeddingVersion.objects.get_or_create(
+        provider=settings.EMBEDDING_PROVIDER, model=model_name, defaults={"status": Status.BUILDING},
+    )
+    return version
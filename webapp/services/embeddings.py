@@ -1,69 +1,259 @@
 # webapp/embeddings.py
+import io
 import warnings
-from langchain_community.document_loaders import PyPDFLoader
+from contextlib import contextmanager
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_postgres import PGVectorStore, PGEngine
+from langchain_core.documents import Document as LCDocument
+from pypdf import PdfReader
 import os
 import urllib.parse
-from webapp.models import Embedding
+from django.conf import settings
+from django.db import connection, transaction
+from webapp.models import Document, Embedding
+from . import metrics
+from . import embedding_cache
+from .embedding_cache import embed_documents_cached, embedding_model_name
+from .embedding_versions import active_version, embedding_models, index_version_for, version_for
+from .providers import configured_embedding_model_name
 import requests
 import tempfile
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
-EMBEDDING_MODEL = OpenAIEmbeddings(
-    model="text-embedding-3-small"
-   
-)
+# The configured model. Retrieval and ingestion use the active embedding version's
+# model (embedding_versions.active_version()), which is this one until a reembed cutover.
+# Question embeddings go through an LRU/TTL cache; chunk embeddings use the persistent cache.
+EMBEDDING_MODEL, QUERY_EMBEDDING_MODEL = embedding_models(configured_embedding_model_name())
+
+
+@metrics.register_collector
+def _embedding_cache_metrics():
+    return (
+        metrics.cache_samples("chunk_embedding", embedding_cache.stats)
+        + metrics.cache_samples("query_embedding", QUERY_EMBEDDING_MODEL.stats)
+    )
+
 
 vector_store: PGVectorStore | None = None
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
-def store_document_embeddings(document_instance):
+
+def store_document_embeddings(document_instance, source=None, on_progress=None, embedding_model=None, guard=None,
+                              batch_size=None):
     """
     Load PDF, split into chunks, generate embeddings, store in Embedding model.
+    source may be a local file path, a file-like object or bytes holding the PDF;
+    without one the file is downloaded from Cloudinary (e.g. when re-indexing).
+    on_progress(done, total) is called after every stored batch.
+    guard, if given, is called inside each batch's transaction before the
+    insert and may raise to abort (see store_chunks).
+
+    Pages are extracted, split and embedded as a stream, so memory use is
+    bounded by the batch size rather than by the number of pages.
+    """
+    pages = PageCounter()
+    chunks = iter_document_chunks(document_instance, source, pages)
+
+    def report(done, _total):
+        if on_progress:
+            on_progress(done, pages.estimate_total(done))
+
+    return store_chunks(
+        document_instance, chunks, batch_size=batch_size, embedding_model=embedding_model,
+        on_progress=report, guard=guard,
+    )
+
+
+class PageCounter:
+    """
+    Tracks how far a streamed PDF has been read, so progress can be
+    reported before the total number of chunks is known.
+    """
+
+    def __init__(self):
+        self.done = 0
+        self.total = 0
+
+    def estimate_total(self, chunks_done):
+        if not self.done or self.done >= self.total:
+            return chunks_done
+        return max(chunks_done, round(chunks_done * self.total / self.done))
+
+
+def index_version(embedding_model=None):
+    """
+    Identifies how a document's chunks were produced: embedding model (by
+    default the active version's) plus splitter config. Stored on
+    Document.index_version by ingestion and reindex.
+    """
+    if embedding_model is None:
+        return index_version_for(active_version().model)
+    return index_version_for(embedding_model_name(embedding_model))
+
+
+def iter_document_chunks(document_instance, source=None, pages=None):
+    """
+    Yield chunks page by page. The splitter works per page, as
+    split_documents did on the fully loaded list.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE, chunk_overlap=settings.CHUNK_OVERLAP
+    )
+    for page in iter_pdf_pages(document_instance, source, pages):
+        with metrics.stage("split"):
+            chunks = splitter.split_documents([page])
+        yield from chunks
+
+
+def iter_pdf_pages(document_instance, source=None, pages=None):
     """
+    Lazily yield one LangChain document per PDF page.
+    """
+    pages = pages or PageCounter()
+    with open_pdf(document_instance, source) as stream:
+        reader = PdfReader(stream)
+        pages.total = len(reader.pages)
+        for page_number, page in enumerate(reader.pages):
+            with metrics.stage("parse"):
+                text = page.extract_text() or ""
+            yield LCDocument(
+                page_content=text,
+                metadata={"source": document_instance.file.name, "page": page_number},
+            )
+            pages.done = page_number + 1
+            # Drop parsed objects of finished pages; pypdf re-reads anything needed later.
+            reader.resolved_objects.clear()
+
+
+@contextmanager
+def open_pdf(document_instance, source=None):
+    """
+    Open the PDF as a binary stream. Remote files are downloaded to a
+    temporary file in chunks instead of being held in memory.
+    """
+    if source is None:
+        with _download_pdf(document_instance) as tmp:
+            yield tmp
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield f
+        return
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    # Uploaded files have usually been read once already by validation/storage.
+    source.seek(0)
+    yield source
+
+
+@contextmanager
+def _download_pdf(document_instance):
     pdf_url = document_instance.file_url
     if not pdf_url:
         raise ValueError("Document has no Cloudinary URL")
-    
-    response = requests.get(pdf_url)
-    response.raise_for_status()
 
-     
-    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
-        tmp.write(response.content)
-        tmp.flush()
+    with tempfile.TemporaryFile(suffix=".pdf") as tmp:
+        with metrics.stage("download"), requests.get(pdf_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                tmp.write(block)
+        tmp.seek(0)
+        yield tmp
 
-        
-        loader = PyPDFLoader(tmp.name)
-        documents = loader.load()
-    
-    
 
-    
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    chunks = splitter.split_documents(documents)
+def iter_batches(items, batch_size):
+    """
+    Yield successive lists of at most batch_size items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    
-    for chunk in chunks:
-        vector = EMBEDDING_MODEL.embed_query(chunk.page_content)
-        Embedding.objects.create(
-            document=document_instance,
-            content=chunk.page_content,
-            embedding=vector,
-            metadata={
-                "document_id": str(document_instance.id),
-                "file_name": document_instance.file.name
-            },
+
+def store_chunks(document_instance, chunks, batch_size=None, embedding_model=None, on_progress=None, guard=None):
+    """
+    Embed chunks in batches via embed_documents and bulk insert each batch
+    in its own transaction. Chunks already in the embedding cache are not
+    sent to the provider. Rows are tagged with embedding_model's version,
+    by default the active one. guard() runs in each batch's transaction
+    right before the insert, e.g. to check the caller still owns the work.
+    Returns the number of Embedding rows written.
+    """
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    if embedding_model is None:
+        version = active_version()
+        embedding_model = embedding_models(version.model)[0]
+    else:
+        version = version_for(embedding_model_name(embedding_model))
+    metadata = {
+        "document_id": str(document_instance.id),
+        "file_name": document_instance.file.name,
+    }
+
+    stored = 0
+    for batch in iter_batches(chunks, batch_size):
+        texts = [chunk.page_content for chunk in batch]
+        vectors, hashes = embed_documents_cached(texts, embedding_model)
+
+        with metrics.stage("db_insert"), transaction.atomic():
+            if guard:
+                guard()
+            Embedding.objects.bulk_create([
+                Embedding(
+                    document=document_instance,
+                    version=version,
+                    content=text,
+                    embedding=vector,
+                    content_hash=text_hash,
+                    metadata=dict(metadata),
+                )
+                for text, vector, text_hash in zip(texts, vectors, hashes)
+            ])
+        stored += len(batch)
+        if on_progress:
+            on_progress(stored, len(chunks) if hasattr(chunks, "__len__") else None)
+
+    return stored
+
+
+def sync_chunk_file_name(document_id):
+    """
+    Point the file_name metadata of the document's chunks at its stored file
+    name. Uploads are queued before storage picks the final name, so the
+    worker may have recorded the provisional one. Returns the rows updated.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {Embedding._meta.db_table} e
+            SET metadata = jsonb_set(e.metadata, '{{file_name}}', to_jsonb(d.file::text))
+            FROM {Document._meta.db_table} d
+            WHERE d.id = %s AND e.document_id = d.id
+              AND e.metadata->>'file_name' IS DISTINCT FROM d.file
+            """,
+            [document_id],
         )
+        return cursor.rowcount
 
 
 async def get_vector_store():
     """
     Return a singleton PGVectorStore instance for similarity search.
+    Its query vectors come from QUERY_EMBEDDING_MODEL, so they have
+    EMBEDDING_DIMENSIONS like the stored ones; pgvector casts the query
+    literal to the column's type, vector or halfvec.
+    It searches every embedding version; chat goes through
+    build_authorized_retriever, which reads the active one only.
     """
     global vector_store
     if vector_store is not None:
@@ -97,7 +287,7 @@ async def get_vector_store():
     vector_store = await PGVectorStore.create(
         engine=pg_engine,
         table_name="webapp_embedding",  
-        embedding_service=EMBEDDING_MODEL,
+        embedding_service=QUERY_EMBEDDING_MODEL,
         id_column="id",
         embedding_column="embedding",
         content_column="content",
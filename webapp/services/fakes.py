@@ -0,0 +1,333 @@
+# webapp/services/fakes.py
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from types import SimpleNamespace
+
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.retrievers import BaseRetriever
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic, offline stand-in for OpenAIEmbeddings.
+    Vectors are derived from a hash of the text, so identical text always
+    maps to the same unit vector. `latency` is slept once per provider call
+    and `per_item_latency` once per text, to mimic a remote round trip.
+    """
+
+    model = "fake-hash-embedding"
+
+    def __init__(self, dimensions=1536, latency=0.0, per_item_latency=0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        values = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def _simulate(self, count):
+        self.calls += 1
+        self.texts_embedded += count
+        delay = self.latency + self.per_item_latency * count
+        if delay:
+            time.sleep(delay)
+
+    def embed_documents(self, texts):
+        self._simulate(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self._simulate(1)
+        return self._vector(text)
+
+
+class StaticRetriever(BaseRetriever):
+    """Returns the same chunks for every query, with an optional simulated delay."""
+
+    documents: list = []
+    latency: float = 0.0
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return list(self.documents)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return list(self.documents)
+
+
+class CannedChatModel(BaseChatModel):
+    """
+    Chat model that always answers with `response`, streamed word by word.
+    `latency` is the simulated time to the first token and `token_latency`
+    the delay between tokens; the async methods sleep without blocking the loop.
+    `calls` and `prompt_chars` count requests and the prompt text sent.
+    """
+
+    response: str = "Either party may terminate this agreement with 30 days written notice."
+    latency: float = 0.0
+    token_latency: float = 0.0
+    calls: int = 0
+    prompt_chars: int = 0
+
+    @property
+    def _llm_type(self):
+        return "canned"
+
+    def _record(self, messages):
+        self.calls += 1
+        self.prompt_chars += sum(len(str(message.content)) for message in messages)
+
+    def _tokens(self):
+        words = self.response.split(" ")
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._record(messages)
+        time.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._record(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._record(messages)
+        time.sleep(self.latency)
+        for token in self._tokens():
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._record(messages)
+        await asyncio.sleep(self.latency)
+        for token in self._tokens():
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def sample_chunks(count=4):
+    return [
+        LCDocument(
+            page_content=f"Section {i}. Either party may terminate this agreement with 30 days written notice.",
+            metadata={"document_id": f"doc{i}"},
+        )
+        for i in range(count)
+    ]
+
+
+def write_sample_pdf(path, pages, lines_per_page=40):
+    """
+    Write a plain-text PDF with the given number of pages, one object at a
+    time, so very large benchmark files never have to be held in memory.
+    """
+    page_ids = [4 + 2 * i for i in range(pages)]
+    offsets = []
+
+    with open(path, "wb") as f:
+        def write_object(number, body):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("ascii"))
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        for page_number, page_id in enumerate(page_ids, start=1):
+            lines = [
+                f"Page {page_number} clause {line}: the parties agree that section {page_number}.{line} applies."
+                for line in range(lines_per_page)
+            ]
+            text = " T* ".join(f"({line}) Tj" for line in lines)
+            stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text} ET".encode("ascii")
+            write_object(
+                page_id,
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode("ascii"),
+            )
+            write_object(
+                page_id + 1,
+                f"<< /Length {len(stream)} >>\nstream\n".encode("ascii") + stream + b"\nendstream",
+            )
+
+        xref_offset = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode("ascii"))
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+        f.write(
+            f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii")
+        )
+    return path
+
+
+class InMemoryFGAClient:
+    """
+    Offline stand-in for the synchronous OpenFgaClient used by FGAService.
+    Tuples live in memory and checks evaluate the type definitions of an
+    authorization model such as openfga_model.json: direct relations
+    ("this", including "user:*" wildcards and usersets like "team:x#member"),
+    computed usersets, tuple-to-userset, union, intersection and difference.
+    Like the server, ListObjects returns at most list_objects_max_results objects.
+    """
+
+    def __init__(self, model, list_objects_max_results=1000):
+        self.relations = {
+            definition["type"]: definition.get("relations") or {}
+            for definition in model.get("type_definitions", [])
+        }
+        self.tuples = set()
+        self.checks = 0
+        self.list_objects_max_results = list_objects_max_results
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    # OpenFgaClient API
+
+    def write(self, body, options=None):
+        for item in getattr(body, "writes", None) or []:
+            self.tuples.add((item.user, item.relation, item.object))
+        for item in getattr(body, "deletes", None) or []:
+            self.tuples.discard((item.user, item.relation, item.object))
+        return SimpleNamespace(writes=body.writes, deletes=getattr(body, "deletes", None))
+
+    def check(self, body, options=None):
+        self.checks += 1
+        return SimpleNamespace(allowed=self._check(body.user, body.relation, body.object, set()))
+
+    def list_objects(self, body, options=None):
+        prefix = f"{body.type}:"
+        candidates = sorted({obj for _, _, obj in self.tuples if obj.startswith(prefix)})
+        allowed = [obj for obj in candidates if self._check(body.user, body.relation, obj, set())]
+        return SimpleNamespace(objects=allowed[:self.list_objects_max_results])
+
+    def read(self, body, options=None):
+        """
+        Tuples matching body.object: "type:id", or "type:" for a whole type,
+        which OpenFGA only accepts together with body.user. Without an object,
+        every tuple.
+        """
+        options = options or {}
+        pattern = getattr(body, "object", None) or ""
+        principal = getattr(body, "user", None) or ""
+        if pattern.endswith(":") and not principal:
+            raise ValueError("400 Bad Request: tuple_key.user is required when the object has no id")
+        matches = sorted(
+            t for t in self.tuples
+            if (not pattern or (t[2].startswith(pattern) if pattern.endswith(":") else t[2] == pattern))
+            and (not principal or t[0] == principal)
+        )
+        offset = int(options.get("continuation_token") or 0)
+        page_size = options.get("page_size") or 50
+        page = matches[offset:offset + page_size]
+        next_offset = offset + len(page)
+        return SimpleNamespace(
+            tuples=[
+                SimpleNamespace(key=SimpleNamespace(user=user, relation=relation, object=obj))
+                for user, relation, obj in page
+            ],
+            continuation_token=str(next_offset) if next_offset < len(matches) else "",
+        )
+
+    # model evaluation
+
+    def _check(self, user, relation, obj, visited):
+        if (user, relation, obj) in visited:
+            return False
+        visited = visited | {(user, relation, obj)}
+        rewrite = self.relations.get(obj.split(":", 1)[0], {}).get(relation)
+        if rewrite is None:
+            return False
+        return self._evaluate(rewrite, user, relation, obj, visited)
+
+    def _evaluate(self, rewrite, user, relation, obj, visited):
+        if "this" in rewrite:
+            return self._direct(user, relation, obj, visited)
+
+        computed = rewrite.get("computedUserset") or rewrite.get("computed_userset")
+        if computed:
+            return self._check(user, computed["relation"], obj, visited)
+
+        tuple_to_userset = rewrite.get("tupleToUserset") or rewrite.get("tuple_to_userset")
+        if tuple_to_userset:
+            tupleset = tuple_to_userset["tupleset"]["relation"]
+            target = (tuple_to_userset.get("computedUserset") or tuple_to_userset.get("computed_userset") or {}).get("relation")
+            if target is None:
+                # openfga_model.json writes "owner implies viewer" as a tupleset
+                # without a computed userset; read it as the relation on this object.
+                return self._check(user, tupleset, obj, visited)
+            parents = [u for u, r, o in self.tuples if o == obj and r == tupleset]
+            return any(self._check(user, target, parent, visited) for parent in parents)
+
+        for operator in ("union", "intersection"):
+            if operator in rewrite:
+                children = rewrite[operator]
+                children = children.get("child", []) if isinstance(children, dict) else children
+                results = (self._evaluate(child, user, relation, obj, visited) for child in children)
+                return any(results) if operator == "union" else all(results)
+
+        if "difference" in rewrite:
+            difference = rewrite["difference"]
+            return (
+                self._evaluate(difference["base"], user, relation, obj, visited)
+                and not self._evaluate(difference["subtract"], user, relation, obj, visited)
+            )
+        return False
+
+    def _direct(self, user, relation, obj, visited):
+        user_type = user.split(":", 1)[0]
+        if (user, relation, obj) in self.tuples or (f"{user_type}:*", relation, obj) in self.tuples:
+            return True
+        for subject, rel, target in self.tuples:
+            if rel == relation and target == obj and "#" in subject:
+                userset, userset_relation = subject.split("#", 1)
+                if self._check(user, userset_relation, userset, visited):
+                    return True
+        return False
+
+
+class CheckOnlyFGAClient:
+    """
+    Stub of the hosted OpenFgaClient for FGAService(client=...): it only
+    answers check(), from another client's tuples, with an optional
+    round-trip `latency`. Calling anything else fails, as it would on a
+    store that does not support it.
+    """
+
+    def __init__(self, backend, latency=0.0):
+        self.backend = backend
+        self.latency = latency
+        self.checks = 0
+
+    def check(self, body, options=None):
+        self.checks += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.backend.check(body, options)
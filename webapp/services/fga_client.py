@@ -1,39 +1,97 @@
 
-from openfga_sdk import ClientConfiguration
-from openfga_sdk.sync import OpenFgaClient 
-from openfga_sdk.credentials import Credentials, CredentialConfiguration
-from openfga_sdk.client.models import ClientTuple, ClientWriteRequest, ClientCheckRequest
+from openfga_sdk import ReadRequestTupleKey
+from openfga_sdk.client.models import ClientTuple, ClientWriteRequest, ClientCheckRequest, ClientListObjectsRequest
 from django.conf import settings
+import threading
+import time
+from . import metrics
+from .caching import TTLCache
+from ..models import DocumentAccess
+from .answer_cache import answer_cache
+from .providers import get_fga_client
 
 class FGAService:
-    def __init__(self):
-        cfg = ClientConfiguration(
-            api_url=settings.FGA_API_URL,
-            store_id=settings.FGA_STORE_ID,
-            authorization_model_id=settings.FGA_AUTHORIZATION_MODEL_ID,
-            credentials=Credentials(
-                method="client_credentials",
-                configuration=CredentialConfiguration(
-                    api_issuer=settings.FGA_API_TOKEN_ISSUER,
-                    api_audience=settings.FGA_API_AUDIENCE,
-                    client_id=settings.FGA_CLIENT_ID,
-                    client_secret=settings.FGA_CLIENT_SECRET,
-                ),
-            ),
+    def __init__(self, client=None):
+        # OpenFgaClient, or the in-memory store when FGA_PROVIDER=memory.
+        self.client = client or get_fga_client()
+
+        # Decision cache keyed by (user, relation, object). Writes bump a per-object
+        # version instead of hunting down keys, which also covers "user:*" grants.
+        self.decisions = TTLCache(
+            maxsize=settings.FGA_CHECK_CACHE_SIZE,
+            ttl=settings.FGA_CHECK_CACHE_TTL,
+            backend=settings.FGA_CHECK_CACHE_BACKEND or None,
+            prefix="fga-check:",
         )
-        self.client = OpenFgaClient(cfg)  
+        self._versions = {}
+        self._stats_lock = threading.Lock()
+        self.remote_checks = 0
+        self.remote_check_seconds = 0.0
+
+    def _object_version(self, obj):
+        if self.decisions.shared is not None:
+            return self.decisions.shared.get(f"fga-version:{obj}", 0)
+        return self._versions.get(obj, 0)
+
+    def _bump_version(self, name):
+        self._versions[name] = self._versions.get(name, 0) + 1
+        if self.decisions.shared is not None:
+            key = f"fga-version:{name}"
+            try:
+                self.decisions.shared.incr(key)
+            except ValueError:
+                self.decisions.shared.set(key, 1, None)
+
+    def invalidate_object(self, document_id):
+        """
+        Forget every cached decision about this document, every cached listing,
+        and every cached chat answer that cites it.
+        """
+        self._bump_version(f"doc:{document_id}")
+        self._bump_version("listings")
+        try:
+            answer_cache.invalidate_document(document_id)
+        except Exception as e:
+            print(f"[FGA] Failed to invalidate cached answers for doc:{document_id}: {e}")
+
+    def _decision_key(self, user, relation, obj):
+        return f"{user}|{relation}|{obj}|v{self._object_version(obj)}"
+
+    def mirror_tuple(self, user, document_id, relation):
+        """
+        Record a successful FGA write in the local ACL mirror used by vector search.
+        A failure here only degrades retrieval, so it is logged, not raised.
+        """
+        try:
+            DocumentAccess.objects.bulk_create(
+                [DocumentAccess(principal=user, document_id=document_id, relation=relation)],
+                ignore_conflicts=True,
+            )
+        except Exception as e:
+            print(f"[FGA] Failed to mirror {user} {relation} doc:{document_id}: {e}")
+
+    def cache_stats(self):
+        checks = self.remote_checks
+        return {
+            **self.decisions.stats.as_dict(),
+            "remote_checks": checks,
+            "remote_check_avg_ms": round(1000 * self.remote_check_seconds / checks, 2) if checks else 0.0,
+        }
 
     def add_public_access(self, document_id, relation="viewer"):
         """Allow anyone to view this document."""
-        self.client.write(
-            ClientWriteRequest(
-                writes=[ClientTuple(
-                     user="user:*",
-                    relation=relation,
-                    object=f"doc:{document_id}"
-                )]
+        with metrics.stage("fga_write"):
+            self.client.write(
+                ClientWriteRequest(
+                    writes=[ClientTuple(
+                         user="user:*",
+                        relation=relation,
+                        object=f"doc:{document_id}"
+                    )]
+                )
             )
-        )
+        self.invalidate_object(document_id)
+        self.mirror_tuple("user:*", document_id, relation)
         print(f"[FGA] Document {document_id} is now public ({relation})")
 
 
@@ -43,14 +101,20 @@ class FGAService:
         document_id is Document.id
         """
         try:
-            self.client.write(
-                ClientWriteRequest(
-                    writes=[ClientTuple(
-                        user=f"user:{user_id}",
-                        relation=relation,
-                        object=f"doc:{document_id}"
-                    )]
+            with metrics.stage("fga_write"):
+                self.client.write(
+                    ClientWriteRequest(
+                        writes=[ClientTuple(
+                            user=f"user:{user_id}",
+                            relation=relation,
+                            object=f"doc:{document_id}"
+                        )]
+                    )
                 )
+            self.invalidate_object(document_id)
+            self.mirror_tuple(f"user:{user_id}", document_id, relation)
+            self.decisions.set(
+                self._decision_key(f"user:{user_id}", relation, f"doc:{document_id}"), True
             )
             print(f"[FGA] Successfully added {relation} for user:{user_id}, doc:{document_id}")
         except Exception as e:
@@ -62,23 +126,160 @@ class FGAService:
                 print(f"[FGA] Unexpected error: {error_msg}")
             raise  
 
+    def remove_relation(self, user_id: str, document_id: str, relation="owner"):
+        """Deletes a relation in OpenFGA, its mirror row and the cached decisions about the document."""
+        with metrics.stage("fga_write"):
+            self.client.write(
+                ClientWriteRequest(
+                    deletes=[ClientTuple(
+                        user=f"user:{user_id}",
+                        relation=relation,
+                        object=f"doc:{document_id}"
+                    )]
+                )
+            )
+        self.invalidate_object(document_id)
+        DocumentAccess.objects.filter(
+            principal=f"user:{user_id}", document_id=document_id, relation=relation
+        ).delete()
+        print(f"[FGA] Removed {relation} for user:{user_id}, doc:{document_id}")
+
+    def add_document_tuples(self, tuples, batch_size=100):
+        """
+        Write (user, relation, document_id) tuples for freshly created documents
+        in batches of batch_size per request (OpenFGA's default per-write limit),
+        then mirror them with one bulk insert. No cached answer can cite a new
+        document, so only the decision caches are invalidated.
+        Raises on the first failed write; earlier batches stay written.
+        """
+        tuples = list(tuples)
+        for start in range(0, len(tuples), batch_size):
+            batch = tuples[start:start + batch_size]
+            with metrics.stage("fga_write"):
+                self.client.write(
+                    ClientWriteRequest(writes=[
+                        ClientTuple(user=user, relation=relation, object=f"doc:{document_id}")
+                        for user, relation, document_id in batch
+                    ])
+                )
+        for document_id in {document_id for _, _, document_id in tuples}:
+            self._bump_version(f"doc:{document_id}")
+        self._bump_version("listings")
+        try:
+            DocumentAccess.objects.bulk_create(
+                [
+                    DocumentAccess(principal=user, document_id=document_id, relation=relation)
+                    for user, relation, document_id in tuples
+                ],
+                ignore_conflicts=True,
+            )
+        except Exception as e:
+            print(f"[FGA] Failed to mirror {len(tuples)} tuples: {e}")
+        print(f"[FGA] Wrote {len(tuples)} tuples in {-(-len(tuples) // batch_size)} request(s)")
+
+    def list_accessible_documents(self, user_id: str, relation="viewer") -> list[str]:
+        """
+        Return the ids of every document the user has the relation with,
+        resolved by OpenFGA in a single ListObjects call. ListObjects stops at
+        FGA_LIST_OBJECTS_MAX_RESULTS (public documents count too), so a result
+        that size may be truncated: the DocumentAccess mirror answers instead.
+        Raises on failure so callers can choose a fallback.
+        """
+        key = f"list|user:{user_id}|{relation}|v{self._object_version('listings')}"
+        cached = self.decisions.get(key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        with metrics.stage("fga_list"):
+            response = self.client.list_objects(
+                ClientListObjectsRequest(user=f"user:{user_id}", relation=relation, type="doc")
+            )
+        with self._stats_lock:
+            self.remote_checks += 1
+            self.remote_check_seconds += time.perf_counter() - start
+
+        document_ids = [obj.split(":", 1)[1] for obj in response.objects]
+        if len(document_ids) >= settings.FGA_LIST_OBJECTS_MAX_RESULTS:
+            print(f"[FGA] ListObjects for user:{user_id} hit the {len(document_ids)} result cap; using the ACL mirror")
+            document_ids = self._mirrored_documents(user_id, relation)
+        self.decisions.set(key, document_ids)
+        print(f"[FGA] ListObjects → user:{user_id} relation:{relation} = {len(document_ids)} docs")
+        return document_ids
+
+    def _mirrored_documents(self, user_id, relation):
+        """Document ids the DocumentAccess mirror grants the relation to the user or to everyone."""
+        # owner implies viewer in openfga_model.json
+        relations = ["viewer", "owner"] if relation == "viewer" else [relation]
+        return list(
+            DocumentAccess.objects.filter(principal__in=[f"user:{user_id}", "user:*"], relation__in=relations)
+            .values_list("document_id", flat=True)
+            .distinct()
+        )
+
+    def read_document_tuples(self, page_size=100):
+        """
+        Yield (user, relation, document_id) for every document tuple in the store.
+        Read only accepts a type-only object ("doc:") together with a user, so
+        the whole store is read with an empty tuple key and filtered here.
+        """
+        continuation_token = None
+        while True:
+            options = {"page_size": page_size}
+            if continuation_token:
+                options["continuation_token"] = continuation_token
+            response = self.client.read(ReadRequestTupleKey(), options)
+            for item in response.tuples:
+                if item.key.object.startswith("doc:"):
+                    yield item.key.user, item.key.relation, item.key.object.split(":", 1)[1]
+            continuation_token = response.continuation_token
+            if not continuation_token:
+                break
+
+    def viewable_documents(self, user_id: str, document_ids, relation="viewer") -> set[str]:
+        """The subset of document_ids the user has the relation with: one (cached) Check per distinct id."""
+        return {
+            document_id for document_id in set(document_ids)
+            if document_id and self.check_relation(user_id, document_id, relation=relation)
+        }
+
     def check_relation(self, user_id: str, document_id: str, relation="viewer") -> bool:
         """
         Checks if the user has a specific relation (e.g. 'viewer' or 'owner') with a document.
         Returns True or False.
         """
+        key = self._decision_key(f"user:{user_id}", relation, f"doc:{document_id}")
+        cached = self.decisions.get(key)
+        if cached is not None:
+            return cached
+
         try:
-            response = self.client.check(
-                ClientCheckRequest(
-                    user=f"user:{user_id}",
-                    relation=relation,
-                    object=f"doc:{document_id}",
+            start = time.perf_counter()
+            with metrics.stage("fga_check"):
+                response = self.client.check(
+                    ClientCheckRequest(
+                        user=f"user:{user_id}",
+                        relation=relation,
+                        object=f"doc:{document_id}",
+                    )
                 )
-            )
+            with self._stats_lock:
+                self.remote_checks += 1
+                self.remote_check_seconds += time.perf_counter() - start
             allowed = response.allowed
+            # Denials are cached briefly so a fresh share is not hidden for long.
+            self.decisions.set(key, allowed, None if allowed else settings.FGA_CHECK_CACHE_NEGATIVE_TTL)
             print(f"[FGA] Check → user:{user_id} relation:{relation} doc:{document_id} = {allowed}")
             return allowed
         except Exception as e:
             print(f"[FGA] Error during relation check: {e}")
             return False
-fga_service = FGAService()
\ No newline at end of file
+fga_service = FGAService()
+
+
+@metrics.register_collector
+def _fga_metrics():
+    return metrics.cache_samples("fga_decision", fga_service.decisions.stats) + [
+        ("legalmind_fga_remote_calls_total", "Check and ListObjects calls sent to OpenFGA.", "counter",
+         {"": fga_service.remote_checks}),
+    ]
\ No newline at end of file
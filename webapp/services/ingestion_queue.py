@@ -0,0 +1,323 @@
+# webapp/services/ingestion_queue.py
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from webapp.models import Document, Embedding, IngestionJob
+from . import embedding_cache
+from .answer_cache import answer_cache
+from .embeddings import index_version, store_document_embeddings, sync_chunk_file_name
+
+Status = IngestionJob.Status
+
+
+class JobLost(Exception):
+    """The job was recovered as stale and may now belong to another worker."""
+
+
+def stage_upload(uploaded_file):
+    """
+    Copy an uploaded file into INGESTION_STAGING_DIR so a worker can parse it
+    from local disk instead of downloading it back from Cloudinary.
+    The directory must be shared between the web and worker processes.
+    """
+    path = stage_stream(uploaded_file.chunks())
+    uploaded_file.seek(0)
+    return path
+
+
+def stage_stream(chunks, max_bytes=None):
+    """
+    Write an iterable of byte chunks to a new file in INGESTION_STAGING_DIR.
+    Raises ValueError (and removes the partial file) past max_bytes.
+    """
+    os.makedirs(settings.INGESTION_STAGING_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=settings.INGESTION_STAGING_DIR)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as staged:
+            for chunk in chunks:
+                written += len(chunk)
+                if max_bytes and written > max_bytes:
+                    raise ValueError(f"File is larger than {max_bytes} bytes")
+                staged.write(chunk)
+    except Exception:
+        discard_staged_file(path)
+        raise
+    return path
+
+
+def discard_staged_file(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def enqueue_document(document, source_path="", force=False):
+    """
+    Queue a document for ingestion. There is at most one job per Document.id:
+    enqueueing again returns the existing job, and only requeues a finished
+    or failed one when force=True.
+    source_path points at a staged copy of the upload, if there is one.
+    """
+    job, created = IngestionJob.objects.get_or_create(
+        document=document,
+        defaults={"max_attempts": settings.INGESTION_MAX_ATTEMPTS, "source_path": source_path},
+    )
+    if not created and force and job.status in (Status.DONE, Status.FAILED):
+        job.source_path = source_path
+        job.status = Status.QUEUED
+        job.attempts = 0
+        job.chunks_done = 0
+        job.chunks_total = 0
+        job.last_error = ""
+        job.run_after = timezone.now()
+        job.save()
+    print(f"[INGEST] Job {job.id} for doc:{document.id} is {job.status}")
+    return job
+
+
+def enqueue_documents(documents, source_paths, batch_id=""):
+    """
+    Queue freshly created documents (e.g. from bulk_create, which skips the
+    post_save signal) with one insert. source_paths maps Document.id to its
+    staged copy; batch_id groups the jobs for batch_progress().
+    """
+    jobs = IngestionJob.objects.bulk_create([
+        IngestionJob(
+            document=document,
+            batch_id=batch_id,
+            source_path=source_paths.get(document.id, ""),
+            max_attempts=settings.INGESTION_MAX_ATTEMPTS,
+        )
+        for document in documents
+    ])
+    print(f"[INGEST] Queued {len(jobs)} job(s) for batch {batch_id or '-'}")
+    return jobs
+
+
+def batch_progress(jobs):
+    """
+    Aggregate progress of a set of jobs: counts per status and the mean of
+    their per-document progress, so large documents do not dominate.
+    """
+    counts = {status: 0 for status in Status.values}
+    progress = 0
+    for job in jobs.only("status", "chunks_done", "chunks_total"):
+        counts[job.status] += 1
+        progress += job.progress
+    total = sum(counts.values())
+    return {
+        "documents": total,
+        **counts,
+        "progress": int(progress / total) if total else 0,
+        "finished": counts[Status.DONE] + counts[Status.FAILED] == total,
+    }
+
+
+def default_worker_id(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically move the oldest due job from queued to running.
+    SKIP LOCKED lets several workers poll the table without blocking each other.
+    """
+    with transaction.atomic():
+        job = (
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(status=Status.QUEUED, run_after__lte=timezone.now())
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = Status.RUNNING
+        job.attempts += 1
+        job.worker_id = worker_id
+        job.heartbeat_at = timezone.now()
+        job.chunks_done = 0
+        job.chunks_total = 0
+        job.save(update_fields=[
+            "status", "attempts", "worker_id", "heartbeat_at",
+            "chunks_done", "chunks_total", "updated_at",
+        ])
+    return job
+
+
+def _owned(job):
+    """This attempt's job row: still running, on the worker and attempt that claimed it."""
+    return IngestionJob.objects.filter(
+        pk=job.pk, status=Status.RUNNING, worker_id=job.worker_id, attempts=job.attempts
+    )
+
+
+def check_ownership(job):
+    """
+    Raise JobLost unless this attempt still owns the job. Inside a
+    transaction the row stays locked until commit, so recover_stale_jobs()
+    cannot requeue the job halfway through the caller's write.
+    """
+    if not _owned(job).select_for_update().exists():
+        raise JobLost(f"Job {job.id} no longer belongs to {job.worker_id}")
+
+
+@contextmanager
+def heartbeat(job, interval=None):
+    """
+    Refresh the job's heartbeat every `interval` seconds from a background
+    thread, so slow parsing or embedding calls never make a live job look stale.
+    """
+    interval = interval or settings.INGESTION_HEARTBEAT_INTERVAL
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                _owned(job).update(heartbeat_at=timezone.now())
+        except Exception as e:
+            print(f"[INGEST] Heartbeat for job {job.id} failed: {e}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Ingest the job's document. Embeddings from an earlier partial attempt are
+    removed first, so a retry never leaves duplicate chunks behind. Every
+    write checks the job still belongs to this attempt; once it was recovered
+    as stale, this attempt stops and leaves the job to its new owner.
+    Returns True when the job finished.
+    """
+    document = job.document
+
+    def on_progress(done, total):
+        _owned(job).update(
+            chunks_done=done,
+            chunks_total=total,
+            heartbeat_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+
+    def guard():
+        check_ownership(job)
+
+    # Prefer the staged upload; fall back to downloading from storage,
+    # which is also the path taken when a document is re-indexed.
+    source = job.source_path if job.source_path and os.path.exists(job.source_path) else None
+
+    try:
+        with heartbeat(job):
+            with transaction.atomic():
+                check_ownership(job)
+                # Answers built from the previous content must not outlive it.
+                Document.objects.filter(pk=document.pk).update(content_version=F("content_version") + 1)
+                answer_cache.invalidate_document(document.pk)
+                Embedding.objects.filter(document=document).delete()
+            store_document_embeddings(document, source=source, on_progress=on_progress, guard=guard)
+            with transaction.atomic():
+                check_ownership(job)
+                Document.objects.filter(pk=document.pk).update(index_version=index_version())
+                # The upload may have finished under another name while this job ran.
+                sync_chunk_file_name(document.pk)
+                _owned(job).update(
+                    status=Status.DONE,
+                    chunks_total=F("chunks_done"),
+                    last_error="",
+                    heartbeat_at=timezone.now(),
+                    updated_at=timezone.now(),
+                )
+    except JobLost as e:
+        # The new owner retries with the staged file; leave both alone.
+        print(f"[INGEST] {e}; stopping this attempt")
+        return False
+    except Exception as e:
+        traceback.print_exc()
+        _record_failure(job, str(e))
+        return False
+
+    discard_staged_file(job.source_path)
+    print(f"[INGEST] Job {job.id} done for doc:{document.id} (embedding cache {embedding_cache.stats.as_dict()})")
+    return True
+
+
+def _record_failure(job, error):
+    """
+    Requeue with exponential backoff, or mark failed once attempts run out.
+    Does nothing if the attempt no longer owns the job.
+    """
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        delay = settings.INGESTION_RETRY_BACKOFF * (2 ** max(job.attempts - 1, 0))
+        job.status = Status.QUEUED
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        print(f"[INGEST] Job {job.id} attempt {job.attempts} failed, retrying in {delay}s: {error}")
+    else:
+        job.status = Status.FAILED
+        print(f"[INGEST] Job {job.id} failed after {job.attempts} attempts: {error}")
+    updated = _owned(job).update(
+        status=job.status, run_after=job.run_after, last_error=job.last_error, updated_at=timezone.now(),
+    )
+    if updated and job.status == Status.FAILED:
+        discard_staged_file(job.source_path)
+
+
+def recover_stale_jobs(stale_after=None):
+    """
+    Jobs left in running by a crashed worker stop sending heartbeats.
+    Treat them as a failed attempt so they are retried or marked failed.
+    """
+    stale_after = stale_after or settings.INGESTION_STALE_AFTER
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    recovered = 0
+    with transaction.atomic():
+        stale_jobs = IngestionJob.objects.select_for_update(skip_locked=True).filter(
+            status=Status.RUNNING, heartbeat_at__lt=cutoff
+        )
+        for job in stale_jobs:
+            _record_failure(job, f"Worker {job.worker_id} stopped responding")
+            recovered += 1
+    if recovered:
+        print(f"[INGEST] Recovered {recovered} stale job(s)")
+    return recovered
+
+
+def run_worker(worker_id, poll_interval=2.0, should_stop=None, once=False):
+    """
+    Poll for jobs until should_stop() returns True.
+    With once=True, drain the queue and return.
+    """
+    should_stop = should_stop or (lambda: False)
+    processed = 0
+    while not should_stop():
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
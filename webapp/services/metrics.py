@@ -0,0 +1,186 @@
+# webapp/services/metrics.py
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Read once: with metrics off, stage() hands back a shared no-op context manager.
+ENABLED = settings.METRICS_ENABLED
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage durations of the current request (or stream), for the Server-Timing header.
+current_timings = ContextVar("current_timings", default=None)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label value."""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_value, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_value in sorted(series):
+            counts, total, count = series[label_value]
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "legalmind_stage_seconds",
+    "Time spent in each pipeline stage (download, parse, embed, fga_check, vector_search, llm_answer, ...).",
+    "stage",
+)
+REQUEST_SECONDS = Histogram(
+    "legalmind_request_seconds",
+    "Time to produce a response, by URL name.",
+    "view",
+)
+
+# Callables returning [(metric_name, help_text, type, {label_str: value})] for /metrics,
+# registered by subsystems that keep their own counters.
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+    return collector
+
+
+class _NoopStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+@contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(name, elapsed)
+        timings = current_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def stage(name):
+    """
+    Time a block as pipeline stage `name`:
+
+        with metrics.stage("vector_search"):
+            rows = ...
+
+    Nested stages are recorded independently, so "retrieval" includes its
+    "vector_search".
+    """
+    if not ENABLED:
+        return _NOOP
+    return _timed_stage(name)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stage durations of everything run inside the block into a dict."""
+    timings = {}
+    token = current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_timings.reset(token)
+
+
+def server_timing_header(timings, total=None):
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def cache_samples(cache, stats):
+    """Hit/miss counters of a CacheStats, for a collector."""
+    return [
+        ("legalmind_cache_hits_total", "Cache hits, by cache.", "counter", {f'cache="{cache}"': stats.hits}),
+        ("legalmind_cache_misses_total", "Cache misses, by cache.", "counter", {f'cache="{cache}"': stats.misses}),
+    ]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+    # Several collectors may report samples of one metric (e.g. every cache's hits).
+    families = {}
+    for collector in _collectors:
+        try:
+            reported = collector()
+        except Exception as e:
+            print(f"[METRICS] Collector {collector.__name__} failed: {e}")
+            continue
+        for name, help_text, kind, samples in reported:
+            families.setdefault(name, (help_text, kind, {}))[2].update(samples)
+    for name, (help_text, kind, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples.items():
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """
+    Serve render() on a background thread, for processes outside Django's
+    request cycle (the ingestion workers).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    print(f"[METRICS] Serving on {host}:{port}")
+    return server
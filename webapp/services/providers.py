@@ -0,0 +1,91 @@
+# webapp/services/providers.py
+from django.conf import settings
+
+# Native output size of the default embedding models.
+FULL_DIMENSIONS = 1536
+
+
+def model_name_with_dimensions(name, dimensions):
+    """Shortened vectors are another vector space: "text-embedding-3-small@512"."""
+    if dimensions and dimensions != FULL_DIMENSIONS:
+        return f"{name}@{dimensions}"
+    return name
+
+
+def split_model_name(model_name):
+    """("text-embedding-3-small", 512) for "text-embedding-3-small@512"; no suffix means FULL_DIMENSIONS."""
+    name, _, dimensions = model_name.partition("@")
+    return name, int(dimensions) if dimensions else FULL_DIMENSIONS
+
+
+def configured_embedding_model_name():
+    """The model EMBEDDING_PROVIDER, EMBEDDING_MODEL_NAME and EMBEDDING_DIMENSIONS describe."""
+    if settings.EMBEDDING_PROVIDER == "fake":
+        from .fakes import FakeEmbeddings
+        name = FakeEmbeddings.model
+    else:
+        name = settings.EMBEDDING_MODEL_NAME
+    return model_name_with_dimensions(name, settings.EMBEDDING_DIMENSIONS)
+
+
+def get_embedding_model(model_name=None):
+    """
+    The embedding provider named by EMBEDDING_PROVIDER: "openai" or "fake".
+    model_name ("name" or "name@dimensions") selects another model of the
+    provider; by default it is configured_embedding_model_name().
+    """
+    name, dimensions = split_model_name(model_name or configured_embedding_model_name())
+    if settings.EMBEDDING_PROVIDER == "fake":
+        from .fakes import FakeEmbeddings
+        return FakeEmbeddings(dimensions=dimensions, latency=settings.FAKE_EMBEDDING_LATENCY)
+
+    from langchain_openai import OpenAIEmbeddings
+    # ada-002 has a fixed size and rejects the parameter; text-embedding-3-large needs it to fit the column.
+    if name == "text-embedding-ada-002":
+        dimensions = None
+    return OpenAIEmbeddings(model=name, dimensions=dimensions)
+
+
+def get_chat_model():
+    """The chat LLM named by LLM_PROVIDER: "openai" or "fake"."""
+    if settings.LLM_PROVIDER == "fake":
+        from .fakes import CannedChatModel
+        return CannedChatModel(latency=settings.FAKE_LLM_LATENCY, token_latency=settings.FAKE_LLM_TOKEN_LATENCY)
+
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=settings.CHAT_MODEL_NAME, temperature=0.1)
+
+
+def get_fga_client():
+    """
+    The OpenFGA client named by FGA_PROVIDER: "openfga" for the hosted store,
+    or "memory" for an in-process store evaluating FGA_MODEL_PATH.
+    """
+    if settings.FGA_PROVIDER == "memory":
+        from .fakes import InMemoryFGAClient
+        return InMemoryFGAClient.from_file(
+            settings.FGA_MODEL_PATH, list_objects_max_results=settings.FGA_LIST_OBJECTS_MAX_RESULTS
+        )
+
+    from openfga_sdk import ClientConfiguration
+    from openfga_sdk.credentials import CredentialConfiguration, Credentials
+    from openfga_sdk.sync import OpenFgaClient
+
+    return OpenFgaClient(ClientConfiguration(
+        api_url=settings.FGA_API_URL,
+        store_id=settings.FGA_STORE_ID,
+        authorization_model_id=settings.FGA_AUTHORIZATION_MODEL_ID,
+        credentials=Credentials(
+            method="client_credentials",
+            configuration=CredentialConfiguration(
+                api_issuer=settings.FGA_API_TOKEN_ISSUER,
+                api_audience=settings.FGA_API_AUDIENCE,
+                client_id=settings.FGA_CLIENT_ID,
+                client_secret=settings.FGA_CLIENT_SECRET,
+            ),
+        ),
+    ))
+
+
+def uses_remote_fga():
+    return settings.FGA_PROVIDER != "memory"
@@ -0,0 +1,250 @@
+# webapp/services/reembed.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from webapp.models import AnswerCacheEntry, Document, Embedding, EmbeddingVersion, IngestionJob
+from . import metrics
+from .embedding_cache import embed_documents_cached, embedding_model_name
+from .embedding_versions import Status, active_version, embedding_models, forget_active, index_version_for
+from .embeddings import iter_batches
+from .providers import configured_embedding_model_name, split_model_name
+
+
+def _versions():
+    return EmbeddingVersion.objects.filter(provider=settings.EMBEDDING_PROVIDER)
+
+
+def building_version():
+    return _versions().filter(status=Status.BUILDING).first()
+
+
+def start(model_name=None):
+    """
+    Register model_name (default: the configured EMBEDDING_MODEL_NAME and
+    EMBEDDING_DIMENSIONS) as the version to re-embed the corpus into. Its
+    vectors must fit the chunk column, e.g. "text-embedding-3-large@1536"
+    rather than the model's native size.
+    """
+    model_name = embedding_model_name(embedding_models(model_name or configured_embedding_model_name())[0])
+    base_name, dimensions = split_model_name(model_name)
+    if dimensions != settings.EMBEDDING_DIMENSIONS:
+        raise ValueError(
+            f"Chunks are stored with {settings.EMBEDDING_DIMENSIONS} dimensions, {model_name} has "
+            f"{dimensions}; use {base_name}@{settings.EMBEDDING_DIMENSIONS}"
+        )
+    if active_version().model == model_name:
+        raise ValueError(f"{model_name} is already the active embedding version")
+    building = building_version()
+    if building and building.model != model_name:
+        raise ValueError(f"Already re-embedding into {building.model}; `reembed abort` it first")
+
+    version, _ = EmbeddingVersion.objects.update_or_create(
+        provider=settings.EMBEDDING_PROVIDER, model=model_name, defaults={"status": Status.BUILDING},
+    )
+    return version
+
+
+def pending_documents(target):
+    """
+    Documents with chunks in some version but none in `target`, oldest first.
+    Documents being ingested are left out: ingestion replaces all their chunks.
+    """
+    return (
+        Document.objects.filter(Exists(Embedding.objects.filter(document=OuterRef("pk"))))
+        .exclude(Exists(Embedding.objects.filter(document=OuterRef("pk"), version=target)))
+        .exclude(Exists(IngestionJob.objects.filter(
+            document=OuterRef("pk"), status__in=[IngestionJob.Status.QUEUED, IngestionJob.Status.RUNNING],
+        )))
+        .order_by("created_at", "pk")
+    )
+
+
+def reembed_document(document, target, batch_size=None):
+    """
+    Copy the document's chunks into `target`, embedding their text with the
+    target model (through the embedding cache). The chunks are read from the
+    active version when it has them, so no PDF is downloaded or re-split.
+    The copy commits in one transaction, so a document is either complete in
+    `target` or absent from it. Returns the number of rows written.
+    """
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    embedding_model = embedding_models(target.model)[0]
+
+    with transaction.atomic():
+        # Reindex holds this lock while rewriting chunks, and ingestion's first
+        # write (content_version) waits for it and then deletes every version.
+        document = Document.objects.select_for_update().get(pk=document.pk)
+        if IngestionJob.objects.filter(document=document, status=IngestionJob.Status.RUNNING).exists():
+            return 0
+        rows = Embedding.objects.filter(document=document)
+        if rows.filter(version=target).exists():
+            return 0
+        sources = set(rows.values_list("version_id", flat=True).distinct())
+        if not sources:
+            return 0
+        active = active_version()
+        source = active.pk if active.pk in sources else max(sources)
+
+        written = 0
+        chunks = rows.filter(version_id=source).values_list("content", "metadata").iterator(chunk_size=2000)
+        for batch in iter_batches(chunks, batch_size):
+            vectors, hashes = embed_documents_cached([content for content, _ in batch], embedding_model)
+            with metrics.stage("db_insert"):
+                Embedding.objects.bulk_create([
+                    Embedding(
+                        document=document,
+                        version=target,
+                        content=content,
+                        embedding=vector,
+                        content_hash=text_hash,
+                        metadata=metadata,
+                    )
+                    for (content, metadata), vector, text_hash in zip(batch, vectors, hashes)
+                ])
+            written += len(batch)
+    return written
+
+
+def run(batch_size=None, max_rate=None, limit=None, on_document=None):
+    """
+    Re-embed pending documents into the version being built, or, with none
+    being built, into the active version (documents ingested by a process
+    that had not seen the last cutover yet). max_rate caps the chunks
+    embedded per second, leaving provider quota and database capacity for
+    live traffic. Runs until nothing is pending, so uploads made meanwhile
+    are included; an interrupted run resumes where it stopped.
+    on_document(document, chunks, error) is called after each document.
+    Returns (version, documents, chunks, failed).
+    """
+    target = building_version() or active_version()
+    documents = chunks = 0
+    failed = set()
+    started = time.monotonic()
+    while True:
+        batch = list(pending_documents(target).exclude(pk__in=failed)[:100])
+        if not batch:
+            break
+        for document in batch:
+            try:
+                written, error = reembed_document(document, target, batch_size), None
+            except Exception as e:
+                written, error = 0, e
+                failed.add(document.pk)
+                print(f"[REEMBED] doc:{document.pk} failed: {e}")
+            documents += 1
+            chunks += written
+            if on_document:
+                on_document(document, written, error)
+            if limit and documents >= limit:
+                return target, documents, chunks, len(failed)
+            if max_rate:
+                ahead = chunks / max_rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return target, documents, chunks, len(failed)
+
+
+def status():
+    """Chunks per embedding version of EMBEDDING_PROVIDER, and the documents still to re-embed."""
+    counts = dict(Embedding.objects.order_by().values_list("version").annotate(chunks=Count("id")))
+    building = building_version()
+    return {
+        "versions": [
+            {
+                "model": version.model,
+                "status": version.status,
+                "chunks": counts.get(version.pk, 0),
+                "activated_at": version.activated_at.isoformat() if version.activated_at else None,
+            }
+            for version in _versions().order_by("pk")
+        ],
+        "building": building.model if building else None,
+        "pending_documents": pending_documents(building or active_version()).count(),
+    }
+
+
+def cutover(force=False):
+    """
+    Make the version being built the active one, in one transaction. Every
+    process follows within EMBEDDING_VERSION_CACHE_TTL seconds, for both the
+    chunks it searches and the model it embeds questions with. Refuses while
+    documents still lack chunks in the new version, unless force.
+
+    The previous version is RETIRED but its chunks stay, so processes that
+    have not seen the switch yet keep answering from them; `cleanup` deletes
+    them later. Cached answers of the previous model are dropped and
+    documents are re-stamped with the new index version.
+    Returns (previous model, new model, documents re-stamped).
+    """
+    with transaction.atomic():
+        versions = {
+            version.status: version
+            for version in _versions().select_for_update().filter(status__in=[Status.ACTIVE, Status.BUILDING])
+        }
+        target, previous = versions.get(Status.BUILDING), versions.get(Status.ACTIVE)
+        if target is None:
+            raise ValueError("No embedding version is being built; run `reembed start` first")
+        missing = pending_documents(target).count()
+        if missing and not force:
+            raise ValueError(f"{missing} document(s) have no {target.model} chunks yet; run `reembed run` first")
+
+        stamped = 0
+        if previous:
+            # Retire first: at most one version per provider may be active.
+            EmbeddingVersion.objects.filter(pk=previous.pk).update(status=Status.RETIRED)
+            AnswerCacheEntry.objects.filter(model=previous.model).delete()
+            stamped = Document.objects.filter(index_version=index_version_for(previous.model)).update(
+                index_version=index_version_for(target.model)
+            )
+        EmbeddingVersion.objects.filter(pk=target.pk).update(status=Status.ACTIVE, activated_at=timezone.now())
+    forget_active()
+
+    previous_model = previous.model if previous else None
+    print(f"[REEMBED] Active embedding version {previous_model} → {target.model}; {stamped} documents re-stamped")
+    return previous_model, target.model, stamped
+
+
+def _delete_chunks(versions, batch_size, pause, on_batch):
+    deleted = 0
+    while True:
+        ids = list(Embedding.objects.filter(version__in=versions).values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Embedding.objects.filter(pk__in=ids).delete()[0]
+        if on_batch:
+            on_batch(deleted)
+        if pause:
+            time.sleep(pause)
+
+
+def cleanup(batch_size=5000, pause=0.0, on_batch=None):
+    """
+    Delete the chunks of RETIRED versions, batch_size rows per statement.
+    Refused until the active version has been live for twice
+    EMBEDDING_VERSION_CACHE_TTL, when no process reads retired chunks any more.
+    Returns the number of rows deleted.
+    """
+    active = _versions().get(status=Status.ACTIVE)
+    grace = timedelta(seconds=2 * settings.EMBEDDING_VERSION_CACHE_TTL)
+    if active.activated_at and timezone.now() - active.activated_at < grace:
+        raise ValueError(f"{active.model} was activated less than {grace} ago; processes may still read retired chunks")
+    retired = list(_versions().filter(status=Status.RETIRED))
+    return _delete_chunks(retired, batch_size, pause, on_batch)
+
+
+def abort(batch_size=5000, pause=0.0, on_batch=None):
+    """
+    Drop the version being built and its chunks. Stop `reembed run` first.
+    Returns the number of rows deleted.
+    """
+    building = building_version()
+    if building is None:
+        raise ValueError("No embedding version is being built")
+    deleted = _delete_chunks([building], batch_size, pause, on_batch)
+    building.delete()
+    return deleted
@@ -0,0 +1,152 @@
+# webapp/services/reindex.py
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from webapp.models import Document, Embedding
+from . import metrics
+from .answer_cache import answer_cache
+from .embedding_cache import content_hash, embed_documents_cached, embedding_model_name
+from .embedding_versions import Status, active_version, embedding_models, version_for
+from .embeddings import index_version, iter_batches, iter_document_chunks
+
+
+def stale_documents(embedding_model=None):
+    """Documents whose stored chunks were not produced by the current index version."""
+    return Document.objects.exclude(index_version=index_version(embedding_model))
+
+
+def reindex_document(document, source=None, embedding_model=None, batch_size=None):
+    """
+    Re-split the document with the current splitter and bring its Embedding
+    rows of embedding_model's version (by default the active one) in line,
+    diffing by content hash: rows whose chunk still exists are kept, new
+    chunks are embedded (through the embedding cache) and rows for chunks
+    that disappeared are deleted. When the active version's chunks change,
+    the document's chunks in other versions no longer match and are dropped;
+    `manage.py reembed run` re-embeds them from the new ones.
+
+    The PDF is downloaded, split and its new chunks embedded first, without
+    locks. The diff and the writes then happen in one transaction holding the
+    document row lock, so chat keeps seeing the previous chunks until the new
+    set is committed and two reindexers never write the same document.
+
+    Returns {"kept", "added", "removed", "version"}.
+    """
+    if embedding_model is None:
+        embedding_version = active_version()
+        embedding_model = embedding_models(embedding_version.model)[0]
+    else:
+        embedding_version = version_for(embedding_model_name(embedding_model))
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    version = index_version(embedding_model)
+
+    chunks = list(iter_document_chunks(document, source))
+    stored_hashes = set(
+        Embedding.objects.filter(document=document, version=embedding_version).values_list("content_hash", flat=True)
+    )
+    vectors = {}
+    for batch in iter_batches([chunk for chunk in chunks if content_hash(chunk.page_content) not in stored_hashes],
+                              batch_size):
+        batch_vectors, hashes = embed_documents_cached([chunk.page_content for chunk in batch], embedding_model)
+        vectors.update(zip(hashes, batch_vectors))
+
+    with transaction.atomic():
+        document = Document.objects.select_for_update().get(pk=document.pk)
+        rows = Embedding.objects.filter(document=document, version=embedding_version)
+
+        # Read again under the lock: ingestion may have replaced the chunks meanwhile.
+        reusable = defaultdict(list)
+        for pk, text_hash in rows.values_list("id", "content_hash").iterator(chunk_size=2000):
+            reusable[text_hash].append(pk)
+
+        kept = added = removed = 0
+        fresh = []
+        for chunk in chunks:
+            matches = reusable.get(content_hash(chunk.page_content))
+            if matches:
+                matches.pop()
+                kept += 1
+            else:
+                fresh.append(chunk)
+        for batch in iter_batches(fresh, batch_size):
+            added += _insert_chunks(document, batch, vectors, embedding_model, embedding_version)
+
+        leftover = [pk for pks in reusable.values() for pk in pks]
+        for ids in iter_batches(leftover, 1000):
+            removed += Embedding.objects.filter(pk__in=ids).delete()[0]
+        if (added or removed) and embedding_version.status == Status.ACTIVE:
+            Embedding.objects.filter(document=document).exclude(version=embedding_version).delete()
+
+        updates = {"index_version": version}
+        if added or removed:
+            # Answers built from the previous chunks must not outlive them.
+            updates["content_version"] = F("content_version") + 1
+            answer_cache.invalidate_document(document.pk)
+        Document.objects.filter(pk=document.pk).update(**updates)
+
+    print(f"[REINDEX] doc:{document.pk} → {version}: kept {kept}, added {added}, removed {removed}")
+    return {"kept": kept, "added": added, "removed": removed, "version": version}
+
+
+def _insert_chunks(document, chunks, vectors, embedding_model, embedding_version):
+    """
+    Insert chunks with the vectors embedded before the lock was taken. Chunks
+    that were stored then but are gone now are embedded here (usually from
+    the embedding cache).
+    """
+    hashes = [content_hash(chunk.page_content) for chunk in chunks]
+    missing = [chunk.page_content for chunk, text_hash in zip(chunks, hashes) if text_hash not in vectors]
+    if missing:
+        late_vectors, late_hashes = embed_documents_cached(missing, embedding_model)
+        vectors.update(zip(late_hashes, late_vectors))
+    metadata = {"document_id": str(document.id), "file_name": document.file.name}
+    with metrics.stage("db_insert"):
+        Embedding.objects.bulk_create([
+            Embedding(
+                document=document,
+                version=embedding_version,
+                content=chunk.page_content,
+                embedding=vectors[text_hash],
+                content_hash=text_hash,
+                metadata=dict(metadata),
+            )
+            for chunk, text_hash in zip(chunks, hashes)
+        ])
+    return len(chunks)
+
+
+def reindex_documents(documents, workers=1, embedding_model=None, on_result=None):
+    """
+    Reindex documents on a pool of threads (the work is mostly waiting on the
+    embedding provider and the database). Each document commits on its own,
+    so an interrupted run resumes by reindexing stale_documents() again.
+    on_result(document, result, error) is called as each document finishes.
+    Returns (succeeded, failed) counts.
+    """
+
+    def run(document):
+        try:
+            return reindex_document(document, embedding_model=embedding_model)
+        finally:
+            # Pool threads each hold their own connection.
+            connections.close_all()
+
+    succeeded = failed = 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="reindex") as pool:
+        futures = {pool.submit(run, document): document for document in documents}
+        for future in as_completed(futures):
+            document = futures[future]
+            try:
+                result, error = future.result(), None
+                succeeded += 1
+            except Exception as e:
+                result, error = None, e
+                failed += 1
+                print(f"[REINDEX] doc:{document.pk} failed: {e}")
+            if on_result:
+                on_result(document, result, error)
+    return succeeded, failed
@@ -0,0 +1,292 @@
+# webapp/services/retrieval.py
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from langchain_core.documents import Document as LCDocument
+from langchain_core.retrievers import BaseRetriever
+from django.conf import settings
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+
+from ..models import DocumentAccess, Embedding
+from . import metrics
+from .async_db import fetch_all
+from .embedding_versions import aactive_version, active_version, query_embeddings
+from .vector_index import aapply_search_params, apply_search_params
+
+# owner implies viewer in openfga_model.json
+VIEW_RELATIONS = ["viewer", "owner"]
+
+# Must match the config of Embedding.search_vector (migration 0009).
+TEXT_SEARCH_CONFIG = "english"
+
+# The user a shared, long-lived retriever is searching for in the current request.
+# ContextVars are per thread and per asyncio task, so concurrent requests never mix.
+current_user_email = ContextVar("current_user_email")
+
+
+@contextmanager
+def retrieval_user(email):
+    token = current_user_email.set(email)
+    try:
+        yield
+    finally:
+        current_user_email.reset(token)
+
+
+def resolve_email(email=None):
+    """The explicit email, else the request-scoped one. Raises LookupError if neither is set."""
+    return email or current_user_email.get()
+
+
+def viewable_document_ids(email):
+    """Subquery of document ids the user, or everyone, may view according to the ACL mirror."""
+    return DocumentAccess.objects.filter(
+        principal__in=[f"user:{email}", "user:*"],
+        relation__in=VIEW_RELATIONS,
+    ).values("document_id")
+
+
+class AuthorizedVectorRetriever(BaseRetriever):
+    """
+    Similarity search restricted to the user's documents in the same SQL
+    query, so k results are k authorized chunks however large the corpus is.
+    An HNSW scan filters after ranking and can come back short; without
+    iterative scan (pgvector < 0.8, or past its scan limit) the search is then
+    repeated as an exact one over the user's chunks. Only chunks of the active embedding version are searched, with a query
+    vector from the same model, even while another version is backfilled.
+    """
+
+    # None: use the request-scoped user from retrieval_user().
+    email: str | None = None
+    k: int = 4
+    # ANN knobs, applied to this query only; None keeps the server default.
+    ef_search: int | None = None
+    probes: int | None = None
+    iterative_scan: str | None = None
+
+    def _queryset(self, vector, version):
+        return (
+            Embedding.objects.filter(
+                version=version, document_id__in=viewable_document_ids(resolve_email(self.email))
+            )
+            .annotate(distance=CosineDistance("embedding", vector))
+            .order_by("distance")
+            .values("id", "content", "metadata", "document_id", "distance")[: self.k]
+        )
+
+    def _search_params(self, exact=False):
+        return {
+            "ef_search": self.ef_search, "probes": self.probes, "iterative_scan": self.iterative_scan,
+            "exact": exact,
+        }
+
+    def _short(self, rows):
+        """The ANN scan may have dropped authorized rows: fewer than k came back."""
+        return len(rows) < self.k
+
+    @staticmethod
+    def _to_documents(rows):
+        documents = []
+        for row in rows:
+            metadata = row["metadata"]
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            documents.append(LCDocument(
+                id=row["id"],
+                page_content=row["content"],
+                metadata={**metadata, "document_id": row["document_id"]},
+            ))
+        return documents
+
+    def _fetch(self, vector, query, version, exact=False):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                apply_search_params(cursor, **self._search_params(exact))
+            # Iterative scan in relaxed order may return neighbours slightly out of order.
+            return sorted(self._queryset(vector, version), key=lambda row: row["distance"])
+
+    async def _afetch(self, vector, query, version, exact=False):
+        sql, params = self._queryset(vector, version).query.sql_with_params()
+        rows = await fetch_all(
+            sql, params, setup=lambda conn: aapply_search_params(conn, **self._search_params(exact))
+        )
+        return sorted(rows, key=lambda row: row["distance"])
+
+    def _search(self, vector, query, version):
+        with metrics.stage("vector_search"):
+            rows = self._fetch(vector, query, version)
+            if self._short(rows):
+                rows = self._fetch(vector, query, version, exact=True)
+        return self._to_documents(rows)
+
+    async def _asearch(self, vector, query, version):
+        """
+        The same search on a native async connection, so concurrent chats
+        wait on the database without holding a thread each.
+        """
+        with metrics.stage("vector_search"):
+            rows = await self._afetch(vector, query, version)
+            if self._short(rows):
+                rows = await self._afetch(vector, query, version, exact=True)
+        return self._to_documents(rows)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        version = active_version()
+        return self._search(query_embeddings(version).embed_query(query), query, version)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        version = await aactive_version()
+        vector = await query_embeddings(version).aembed_query(query)
+        return await self._asearch(vector, query, version)
+
+
+def vector_literal(vector):
+    return "[" + ",".join(str(float(v)) for v in vector) + "]"
+
+
+def hybrid_search_sql(vector, text, k, candidates=20, rrf_k=60, table=Embedding._meta.db_table,
+                      where="TRUE", where_params=(), config=TEXT_SEARCH_CONFIG, vector_type=None):
+    """
+    One query that ranks the top `candidates` chunks by vector distance and by
+    full-text rank separately, then merges them with reciprocal rank fusion:
+    score = sum over both rankings of 1 / (rrf_k + rank).
+    Query terms are OR-ed, so a question only has to share its distinctive
+    terms (section numbers, party names) with a chunk to rank it.
+    Each row also carries semantic_rows, the size of the vector ranking.
+    `where` restricts both rankings, e.g. to the user's documents.
+    `vector_type` is the column's type, EMBEDDING_PRECISION by default.
+    Returns (sql, params).
+    """
+    vector_type = vector_type or settings.EMBEDDING_PRECISION
+    terms = "replace(plainto_tsquery(%s::regconfig, %s)::text, '&', '|')::tsquery"
+    sql = f"""
+        WITH semantic AS (
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank FROM (
+                SELECT e.id, e.embedding <=> %s::{vector_type} AS distance
+                FROM {table} e
+                WHERE {where}
+                ORDER BY distance
+                LIMIT %s
+            ) nearest
+        ),
+        lexical AS (
+            SELECT id, row_number() OVER (ORDER BY score DESC) AS rank FROM (
+                SELECT e.id, ts_rank_cd(e.search_vector, {terms}) AS score
+                FROM {table} e
+                WHERE e.search_vector @@ {terms} AND {where}
+                ORDER BY score DESC
+                LIMIT %s
+            ) matched
+        ),
+        fused AS (
+            SELECT id, sum(1.0 / (%s + rank)) AS score
+            FROM (SELECT id, rank FROM semantic UNION ALL SELECT id, rank FROM lexical) ranked
+            GROUP BY id
+            ORDER BY score DESC
+            LIMIT %s
+        )
+        SELECT e.id, e.content, e.metadata, e.document_id, fused.score,
+               (SELECT count(*) FROM semantic) AS semantic_rows
+        FROM fused JOIN {table} e ON e.id = fused.id
+        ORDER BY fused.score DESC
+    """
+    params = [
+        vector_literal(vector), *where_params, candidates,
+        config, text, config, text, *where_params, candidates,
+        rrf_k, k,
+    ]
+    return sql, params
+
+
+class HybridRetriever(AuthorizedVectorRetriever):
+    """
+    AuthorizedVectorRetriever that also ranks chunks by Postgres full-text
+    search and fuses both rankings, in a single round trip. Exact terms that
+    embeddings blur together, like "Section 14.3" or a party name, still
+    surface the chunk that contains them.
+    """
+
+    candidates: int = 20
+    rrf_k: int = 60
+
+    def _sql(self, vector, query, version):
+        acl_sql, acl_params = viewable_document_ids(resolve_email(self.email)).query.sql_with_params()
+        return hybrid_search_sql(
+            vector, query, self.k, candidates=self.candidates, rrf_k=self.rrf_k,
+            where=f"e.version_id = %s AND e.document_id IN ({acl_sql})",
+            where_params=(version.pk, *acl_params),
+        )
+
+    def _short(self, rows):
+        """The vector ranking came back with fewer than `candidates` chunks."""
+        return not rows or rows[0]["semantic_rows"] < self.candidates
+
+    def _fetch(self, vector, query, version, exact=False):
+        sql, params = self._sql(vector, query, version)
+        with transaction.atomic(), connection.cursor() as cursor:
+            apply_search_params(cursor, **self._search_params(exact))
+            cursor.execute(sql, params)
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    async def _afetch(self, vector, query, version, exact=False):
+        sql, params = self._sql(vector, query, version)
+        return await fetch_all(
+            sql, params, setup=lambda conn: aapply_search_params(conn, **self._search_params(exact))
+        )
+
+
+class CheckedRetriever(BaseRetriever):
+    """
+    Keeps only the chunks FGAService says the user may view, checking each
+    document once however many of its chunks came back. The async path runs
+    the checks off the event loop, since the OpenFGA client is synchronous.
+    """
+
+    retriever: BaseRetriever
+    email: str | None = None
+    # FGAService to check with; None uses the shared fga_service.
+    fga: Any = None
+
+    def _allowed(self, documents):
+        from .fga_client import fga_service  # fga_client imports this module indirectly
+
+        fga = self.fga or fga_service
+        email = resolve_email(self.email)
+        viewable = fga.viewable_documents(email, {doc.metadata.get("document_id") for doc in documents})
+        return [doc for doc in documents if doc.metadata.get("document_id") in viewable]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self._allowed(self.retriever.invoke(query))
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        documents = await self.retriever.ainvoke(query)
+        return await sync_to_async(self._allowed)(documents)
+
+
+def build_authorized_retriever(email=None, k=4, hybrid=None, fga=None, **search_params):
+    """
+    Pre-filtered vector search, with OpenFGA (through FGAService, or `fga`)
+    still making the final decision on every returned chunk. search_params are the
+    AuthorizedVectorRetriever ANN knobs (ef_search, probes, iterative_scan).
+    hybrid (default RETRIEVAL_HYBRID) adds full-text ranking via HybridRetriever.
+    With email=None the retriever can be built once and shared: it serves
+    whichever user is set with retrieval_user() at call time.
+    """
+    if hybrid is None:
+        hybrid = settings.RETRIEVAL_HYBRID
+    if hybrid:
+        retriever = HybridRetriever(
+            email=email, k=k,
+            candidates=settings.HYBRID_CANDIDATES, rrf_k=settings.HYBRID_RRF_K,
+            **search_params,
+        )
+    else:
+        retriever = AuthorizedVectorRetriever(email=email, k=k, **search_params)
+
+    # Not auth0's FGARetriever: its async filter keys a dict by Document and fails on any result.
+    return CheckedRetriever(retriever=retriever, email=email, fga=fga)
@@ -0,0 +1,114 @@
+# webapp/services/vector_index.py
+from django.conf import settings
+from django.db import connection
+
+TABLE = "webapp_embedding"
+COLUMN = "embedding"
+INDEX_NAMES = {
+    "hnsw": "embedding_vector_hnsw_idx",
+    "ivfflat": "embedding_vector_ivfflat_idx",
+}
+# PGVectorStore and the retrievers rank by cosine distance; halfvec columns need halfvec_cosine_ops.
+OPCLASS = f"{settings.EMBEDDING_PRECISION}_cosine_ops"
+
+
+def build_index_sql(kind, m=None, ef_construction=None, lists=None, concurrently=False, name=None,
+                    table=TABLE, column=COLUMN, opclass=OPCLASS):
+    if kind == "hnsw":
+        params = (
+            f"m = {int(m or settings.VECTOR_HNSW_M)}, "
+            f"ef_construction = {int(ef_construction or settings.VECTOR_HNSW_EF_CONSTRUCTION)}"
+        )
+    elif kind == "ivfflat":
+        params = f"lists = {int(lists or settings.VECTOR_IVFFLAT_LISTS)}"
+    else:
+        raise ValueError(f"Unknown vector index type: {kind}")
+
+    name = name or INDEX_NAMES[kind]
+    concurrently = "CONCURRENTLY " if concurrently else ""
+    return (
+        f"CREATE INDEX {concurrently}IF NOT EXISTS {name} "
+        f"ON {table} USING {kind} ({column} {opclass}) WITH ({params})"
+    )
+
+
+def create_index(kind, concurrently=False, **params):
+    with connection.cursor() as cursor:
+        cursor.execute(build_index_sql(kind, concurrently=concurrently, **params))
+
+
+def drop_index(kind, concurrently=False):
+    concurrently = "CONCURRENTLY " if concurrently else ""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX {concurrently}IF EXISTS {INDEX_NAMES[kind]}")
+
+
+def index_report():
+    """Size, definition and usage of every ANN index on the embedding table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT i.indexname,
+                   i.indexdef,
+                   pg_size_pretty(pg_relation_size(c.oid)),
+                   COALESCE(s.idx_scan, 0)
+            FROM pg_indexes i
+            JOIN pg_class c ON c.relname = i.indexname
+            LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = c.oid
+            WHERE i.tablename = %s AND i.indexdef ~* 'USING (hnsw|ivfflat)'
+            ORDER BY i.indexname
+            """,
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+        cursor.execute(
+            f"SELECT pg_size_pretty(pg_total_relation_size(%s)), (SELECT count(*) FROM {TABLE})",
+            [TABLE],
+        )
+        table_size, row_count = cursor.fetchone()
+    return {
+        "table_size": table_size,
+        "rows": row_count,
+        "indexes": [
+            {"name": name, "definition": definition, "size": size, "scans": scans}
+            for name, definition, size, scans in rows
+        ],
+    }
+
+
+def search_param_statements(ef_search=None, probes=None, iterative_scan=None, exact=False):
+    """
+    SQL that sets ANN search knobs for the current transaction only
+    (set_config with is_local=true). exact=True turns index scans off, so
+    the query is answered by exact search over the rows its filter allows.
+    """
+    statements = []
+    if ef_search:
+        statements.append(("SELECT set_config('hnsw.ef_search', %s, true)", [str(int(ef_search))]))
+    if probes:
+        statements.append(("SELECT set_config('ivfflat.probes', %s, true)", [str(int(probes))]))
+    if iterative_scan:
+        # Keep scanning the index until enough rows pass the ACL filter. The
+        # setting only exists from pgvector 0.8; older servers skip it.
+        statements.append((
+            "SELECT set_config('hnsw.iterative_scan', %s, true) FROM pg_extension "
+            "WHERE extname = 'vector' AND string_to_array(extversion, '.')::int[] >= '{0,8}'",
+            [iterative_scan],
+        ))
+    if exact:
+        statements.append(("SELECT set_config('enable_indexscan', 'off', true)", []))
+    return statements
+
+
+def apply_search_params(cursor, ef_search=None, probes=None, iterative_scan=None, exact=False):
+    """
+    Must run inside transaction.atomic() on the same connection as the search query.
+    """
+    for sql, params in search_param_statements(ef_search, probes, iterative_scan, exact):
+        cursor.execute(sql, params)
+
+
+async def aapply_search_params(conn, ef_search=None, probes=None, iterative_scan=None, exact=False):
+    """Async variant for a psycopg AsyncConnection inside a transaction."""
+    for sql, params in search_param_statements(ef_search, probes, iterative_scan, exact):
+        await conn.execute(sql, params)
@@ -0,0 +1,193 @@
+# webapp/services/vector_storage.py
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from webapp.models import AnswerCacheEntry, Document, Embedding, EmbeddingVersion
+from .embedding_versions import active_version, forget_active, index_version_for
+from .providers import model_name_with_dimensions, split_model_name
+from .vector_index import INDEX_NAMES, TABLE, build_index_sql
+
+PRECISIONS = ("vector", "halfvec")
+NEXT_COLUMN = "embedding_next"
+NEXT_INDEX = "embedding_next_hnsw_idx"
+ANSWER_CACHE_TABLE = AnswerCacheEntry._meta.db_table
+ANSWER_CACHE_INDEX = "answercache_vector_hnsw_idx"
+
+
+def storage_type(precision, dimensions):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown vector precision: {precision}")
+    return f"{precision}({int(dimensions)})"
+
+
+def column_type(table=TABLE, column="embedding"):
+    """The column's type as Postgres reports it, e.g. "vector(1536)", or None if absent."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            WHERE a.attrelid = %s::regclass AND a.attname = %s AND NOT a.attisdropped
+            """,
+            [table, column],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _dimensions(type_name):
+    return int(type_name.split("(", 1)[1].rstrip(")"))
+
+
+def _check_single_version():
+    """Only the active version's vectors are renamed, so no other version may hold chunks."""
+    active = active_version()
+    others = EmbeddingVersion.objects.exclude(pk=active.pk).filter(
+        Exists(Embedding.objects.filter(version=OuterRef("pk")))
+    )
+    names = [str(version) for version in others]
+    if names:
+        raise ValueError(
+            f"Chunks of other embedding versions exist ({', '.join(names)}); "
+            f"finish `reembed` (cutover and cleanup) or `reembed abort` first"
+        )
+    return active
+
+
+def _conversion(source, precision, dimensions):
+    """
+    SQL converting the `source` column to the target format. Shortened vectors
+    keep the leading dimensions (how text-embedding-3 models shorten) and are
+    re-normalised, as the provider's own shortened output is.
+    """
+    return f"l2_normalize(subvector({source}, 1, {int(dimensions)}))::{storage_type(precision, dimensions)}"
+
+
+def status():
+    """Current and in-progress storage formats, and how far a backfill has got."""
+    current = column_type()
+    pending = column_type(column=NEXT_COLUMN)
+    report = {"current": current, "configured": storage_type(settings.EMBEDDING_PRECISION, settings.EMBEDDING_DIMENSIONS)}
+    if pending:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*), count({NEXT_COLUMN}) FROM {TABLE}")
+            rows, converted = cursor.fetchone()
+        report.update({"pending": pending, "rows": rows, "converted": converted})
+    return report
+
+
+def backfill(precision, dimensions, batch_size=5000, pause=0.0, on_batch=None):
+    """
+    Write every chunk vector in the target format to a new nullable column,
+    batch_size rows per transaction. Safe to run while the app serves traffic
+    and resumable: only rows still NULL in the new column are converted.
+    Returns the number of rows converted.
+    """
+    target = storage_type(precision, dimensions)
+    current = column_type()
+    if dimensions > _dimensions(current):
+        raise ValueError(f"Cannot grow {current} to {target}; re-embed with `manage.py reindex` instead")
+    _check_single_version()
+
+    pending = column_type(column=NEXT_COLUMN)
+    if pending and pending != target:
+        raise ValueError(f"A conversion to {pending} is in progress; run `vector_storage abort` first")
+    if not pending:
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD COLUMN {NEXT_COLUMN} {target}")
+
+    converted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {TABLE} SET {NEXT_COLUMN} = {_conversion('embedding', precision, dimensions)}
+                WHERE id IN (
+                    SELECT id FROM {TABLE} WHERE {NEXT_COLUMN} IS NULL
+                    LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                """,
+                [batch_size],
+            )
+            updated = cursor.rowcount
+        if not updated:
+            return converted
+        converted += updated
+        if on_batch:
+            on_batch(converted)
+        if pause:
+            time.sleep(pause)
+
+
+def build_index(precision, concurrently=True):
+    """HNSW index on the new column, built before the cutover so search never goes without one."""
+    with connection.cursor() as cursor:
+        cursor.execute(build_index_sql(
+            "hnsw", concurrently=concurrently, name=NEXT_INDEX,
+            column=NEXT_COLUMN, opclass=f"{precision}_cosine_ops",
+        ))
+
+
+def cutover(precision, dimensions):
+    """
+    Swap the converted column in, in one transaction that blocks writes (not
+    reads) to the chunk table: convert rows written since the backfill, drop
+    the old column and its ANN indexes, and rename the new column and index.
+    The answer cache is emptied and retyped, the active embedding version is
+    renamed to the shortened model, and documents are stamped with the new
+    index version so `manage.py reindex` does not re-embed them.
+    Deploy EMBEDDING_PRECISION/EMBEDDING_DIMENSIONS right after.
+    """
+    target = storage_type(precision, dimensions)
+    if column_type(column=NEXT_COLUMN) != target:
+        raise ValueError(f"No backfilled {target} column; run `vector_storage convert` first")
+
+    active = _check_single_version()
+    new_model = model_name_with_dimensions(split_model_name(active.model)[0], dimensions)
+    old_version, new_version = index_version_for(active.model), index_version_for(new_model)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            f"UPDATE {TABLE} SET {NEXT_COLUMN} = {_conversion('embedding', precision, dimensions)} "
+            f"WHERE {NEXT_COLUMN} IS NULL"
+        )
+        for name in INDEX_NAMES.values():
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute(f"ALTER TABLE {TABLE} DROP COLUMN embedding")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME COLUMN {NEXT_COLUMN} TO embedding")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN embedding SET NOT NULL")
+        cursor.execute(f"ALTER INDEX IF EXISTS {NEXT_INDEX} RENAME TO {INDEX_NAMES['hnsw']}")
+
+        # Cached answers are cheap to rebuild; their question vectors are not convertible in place.
+        cursor.execute(f"DELETE FROM {ANSWER_CACHE_TABLE}")
+        cursor.execute(f"DROP INDEX IF EXISTS {ANSWER_CACHE_INDEX}")
+        cursor.execute(f"ALTER TABLE {ANSWER_CACHE_TABLE} ALTER COLUMN embedding TYPE {target}")
+        cursor.execute(build_index_sql(
+            "hnsw", name=ANSWER_CACHE_INDEX, table=ANSWER_CACHE_TABLE, opclass=f"{precision}_cosine_ops",
+        ))
+
+        EmbeddingVersion.objects.filter(pk=active.pk).update(model=new_model)
+        stamped = Document.objects.filter(index_version=old_version).update(index_version=new_version)
+    forget_active()
+    print(f"[VECTOR STORAGE] {TABLE}.embedding is now {target}; {stamped} documents at {new_version}")
+    return stamped
+
+
+def abort():
+    """Drop an unfinished conversion's column and index."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {NEXT_INDEX}")
+        cursor.execute(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS {NEXT_COLUMN}")
+
+
+def vacuum_full():
+    """
+    Rewrite the chunk table so the space of the dropped column and of the
+    backfill's dead rows is returned to the OS. Locks the table throughout.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"VACUUM (FULL, ANALYZE) {TABLE}")
@@ -72,6 +72,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'webapp.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'webapp.urls'
@@ -163,17 +164,148 @@ AUTH0_DOMAIN = env('AUTH0_DOMAIN')
 AUTH0_CLIENT_ID = env('AUTH0_CLIENT_ID')
 AUTH0_CLIENT_SECRET = env('AUTH0_CLIENT_SECRET')
 
-FGA_API_URL = env('FGA_API_URL')
-FGA_STORE_ID = env('FGA_STORE_ID')
-FGA_AUTHORIZATION_MODEL_ID = env('FGA_AUTHORIZATION_MODEL_ID')
-FGA_API_TOKEN_ISSUER = env('FGA_API_TOKEN_ISSUER')
-FGA_API_AUDIENCE = env('FGA_API_AUDIENCE')
-FGA_CLIENT_ID = env('FGA_CLIENT_ID')
-FGA_CLIENT_SECRET = env('FGA_CLIENT_SECRET')
+# Providers (webapp/services/providers.py). 'fake' / 'memory' are deterministic
+# offline stand-ins for benchmarks and local development.
+EMBEDDING_PROVIDER = env('EMBEDDING_PROVIDER', default='openai')
+EMBEDDING_MODEL_NAME = env('EMBEDDING_MODEL_NAME', default='text-embedding-3-small')
+LLM_PROVIDER = env('LLM_PROVIDER', default='openai')
+CHAT_MODEL_NAME = env('CHAT_MODEL_NAME', default='gpt-3.5-turbo')
+FGA_PROVIDER = env('FGA_PROVIDER', default='openfga')
+FGA_MODEL_PATH = env('FGA_MODEL_PATH', default=os.path.join(BASE_DIR, 'openfga_model.json'))
+FAKE_EMBEDDING_LATENCY = env.float('FAKE_EMBEDDING_LATENCY', default=0.0)
+FAKE_LLM_LATENCY = env.float('FAKE_LLM_LATENCY', default=0.0)
+FAKE_LLM_TOKEN_LATENCY = env.float('FAKE_LLM_TOKEN_LATENCY', default=0.0)
+
+# Storage format of chunk vectors. 'halfvec' (float16, pgvector >= 0.7) halves the
+# table and ANN index; fewer dimensions (text-embedding-3 models shorten natively)
+# shrink them further. Convert existing rows with `manage.py vector_storage`
+# before deploying a change here.
+EMBEDDING_PRECISION = env('EMBEDDING_PRECISION', default='vector')
+EMBEDDING_DIMENSIONS = env.int('EMBEDDING_DIMENSIONS', default=1536)
+
+# Stored chunks are tagged with the model that embedded them (EmbeddingVersion), and
+# chat reads the provider's active version only. EMBEDDING_MODEL_NAME seeds the first
+# version and is the default target of `manage.py reembed`; switching models is a
+# reembed backfill plus cutover, which processes pick up within this many seconds.
+EMBEDDING_VERSION_CACHE_TTL = env.int('EMBEDDING_VERSION_CACHE_TTL', default=10)
+
+# Only required with FGA_PROVIDER=openfga.
+FGA_API_URL = env('FGA_API_URL', default='')
+FGA_STORE_ID = env('FGA_STORE_ID', default='')
+FGA_AUTHORIZATION_MODEL_ID = env('FGA_AUTHORIZATION_MODEL_ID', default='')
+FGA_API_TOKEN_ISSUER = env('FGA_API_TOKEN_ISSUER', default='')
+FGA_API_AUDIENCE = env('FGA_API_AUDIENCE', default='')
+FGA_CLIENT_ID = env('FGA_CLIENT_ID', default='')
+FGA_CLIENT_SECRET = env('FGA_CLIENT_SECRET', default='')
+
+# Authorization decision cache in FGAService.check_relation.
+FGA_CHECK_CACHE_SIZE = env.int('FGA_CHECK_CACHE_SIZE', default=10000)
+FGA_CHECK_CACHE_TTL = env.int('FGA_CHECK_CACHE_TTL', default=30)
+FGA_CHECK_CACHE_NEGATIVE_TTL = env.int('FGA_CHECK_CACHE_NEGATIVE_TTL', default=5)
+FGA_CHECK_CACHE_BACKEND = env('FGA_CHECK_CACHE_BACKEND', default='')
+# OpenFGA's server-side cap on ListObjects results (OPENFGA_LIST_OBJECTS_MAX_RESULTS).
+# A listing that reaches it may be truncated, so the DocumentAccess mirror answers instead.
+FGA_LIST_OBJECTS_MAX_RESULTS = env.int('FGA_LIST_OBJECTS_MAX_RESULTS', default=1000)
+
+
+# Chunking of extracted PDF text. Changing either (or EMBEDDING_MODEL_NAME) changes
+# the index version; `manage.py reindex` brings stored documents up to date.
+CHUNK_SIZE = env.int('CHUNK_SIZE', default=500)
+CHUNK_OVERLAP = env.int('CHUNK_OVERLAP', default=100)
+
+# Bulk upload (many PDFs or a ZIP archive per request). Files are sent to storage
+# on BULK_UPLOAD_CONCURRENCY threads; ZIP entries larger than the limit are skipped.
+BULK_UPLOAD_MAX_FILES = env.int('BULK_UPLOAD_MAX_FILES', default=500)
+BULK_UPLOAD_MAX_FILE_SIZE = env.int('BULK_UPLOAD_MAX_FILE_SIZE', default=100 * 1024 * 1024)
+BULK_UPLOAD_CONCURRENCY = env.int('BULK_UPLOAD_CONCURRENCY', default=8)
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_UPLOAD_MAX_FILES
+
+# Number of chunks sent to the embedding provider (and bulk inserted) per round trip.
+EMBEDDING_BATCH_SIZE = env.int('EMBEDDING_BATCH_SIZE', default=100)
+
+# Content-addressed cache of chunk embeddings (see `manage.py embedding_cache`).
+EMBEDDING_CACHE_ENABLED = env.bool('EMBEDDING_CACHE_ENABLED', default=True)
+EMBEDDING_CACHE_GC_GRACE_HOURS = env.int('EMBEDDING_CACHE_GC_GRACE_HOURS', default=24)
+
+# LRU/TTL cache for question embeddings used by chat and search.
+# Set QUERY_EMBEDDING_CACHE_BACKEND to a CACHES alias to share it between processes.
+QUERY_EMBEDDING_CACHE_SIZE = env.int('QUERY_EMBEDDING_CACHE_SIZE', default=2048)
+QUERY_EMBEDDING_CACHE_TTL = env.int('QUERY_EMBEDDING_CACHE_TTL', default=3600)
+QUERY_EMBEDDING_CACHE_BACKEND = env('QUERY_EMBEDDING_CACHE_BACKEND', default='')
+
+# Semantic answer cache for first questions in a chat (webapp/services/answer_cache.py).
+# A cached answer is reused when the question's cosine similarity is at least
+# ANSWER_CACHE_THRESHOLD and the user can view all of its sources.
+ANSWER_CACHE_ENABLED = env.bool('ANSWER_CACHE_ENABLED', default=True)
+ANSWER_CACHE_THRESHOLD = env.float('ANSWER_CACHE_THRESHOLD', default=0.95)
+ANSWER_CACHE_TTL = env.int('ANSWER_CACHE_TTL', default=86400)
+
+# ANN index on webapp_embedding.embedding (see `manage.py vector_index`) and
+# per-query search knobs. A zero/empty value keeps the pgvector default.
+VECTOR_HNSW_M = env.int('VECTOR_HNSW_M', default=16)
+VECTOR_HNSW_EF_CONSTRUCTION = env.int('VECTOR_HNSW_EF_CONSTRUCTION', default=64)
+VECTOR_IVFFLAT_LISTS = env.int('VECTOR_IVFFLAT_LISTS', default=100)
+VECTOR_HNSW_EF_SEARCH = env.int('VECTOR_HNSW_EF_SEARCH', default=100)
+VECTOR_IVFFLAT_PROBES = env.int('VECTOR_IVFFLAT_PROBES', default=10)
+# 'relaxed_order' or 'strict_order' (pgvector >= 0.8) keeps scanning the HNSW
+# index until k rows pass the ACL filter. Whatever the setting, a search that
+# returns fewer than k rows is retried as an exact search.
+VECTOR_HNSW_ITERATIVE_SCAN = env('VECTOR_HNSW_ITERATIVE_SCAN', default='relaxed_order')
+
+# Hybrid retrieval: fuse full-text and vector rankings (reciprocal rank fusion).
+# Each ranking contributes its top HYBRID_CANDIDATES chunks.
+RETRIEVAL_HYBRID = env.bool('RETRIEVAL_HYBRID', default=True)
+HYBRID_CANDIDATES = env.int('HYBRID_CANDIDATES', default=20)
+HYBRID_RRF_K = env.int('HYBRID_RRF_K', default=60)
+
+# Follow-up handling in chat. 'auto' condenses a follow-up only when it refers
+# back to the conversation, retrieving in parallel, and folds older turns into
+# a rolling summary; 'always' condenses every follow-up before retrieval.
+CHAT_CONDENSE_MODE = env('CHAT_CONDENSE_MODE', default='auto')
+CHAT_RECENT_MESSAGES = env.int('CHAT_RECENT_MESSAGES', default=4)
+CHAT_SUMMARY_BATCH = env.int('CHAT_SUMMARY_BATCH', default=6)
+
+# Conversations live in webapp_conversation/webapp_chatmessage; the session only
+# holds the current conversation id. The LLM gets the newest unsummarised
+# messages that fit in CHAT_HISTORY_TOKEN_BUDGET tokens.
+CHAT_HISTORY_TOKEN_BUDGET = env.int('CHAT_HISTORY_TOKEN_BUDGET', default=2000)
+CHAT_DISPLAY_MESSAGES = env.int('CHAT_DISPLAY_MESSAGES', default=20)
+
+# Per-stage timings: Server-Timing headers and Prometheus histograms at /metrics.
+# Off by default; when off, instrumentation is a no-op. A non-empty METRICS_TOKEN
+# requires "Authorization: Bearer <token>" on /metrics.
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=False)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Connections per event loop for the async chat path (webapp/services/async_db.py).
+ASYNC_DB_POOL_SIZE = env.int('ASYNC_DB_POOL_SIZE', default=10)
+
+# Background ingestion queue (see `manage.py ingest_worker`).
+INGESTION_WORKERS = env.int('INGESTION_WORKERS', default=2)
+INGESTION_MAX_ATTEMPTS = env.int('INGESTION_MAX_ATTEMPTS', default=3)
+INGESTION_RETRY_BACKOFF = env.int('INGESTION_RETRY_BACKOFF', default=30)
+INGESTION_STALE_AFTER = env.int('INGESTION_STALE_AFTER', default=600)
+# Running jobs refresh heartbeat_at this often, on their own thread, whatever the batch pace.
+INGESTION_HEARTBEAT_INTERVAL = env.int('INGESTION_HEARTBEAT_INTERVAL', default=30)
+# Uploads are staged here for the workers to parse; must be shared with them.
+INGESTION_STAGING_DIR = env('INGESTION_STAGING_DIR', default=os.path.join(BASE_DIR, 'media', 'ingestion'))
+
+# Audit log writes (webapp/services/audit.py): 'sync' inserts per query,
+# 'buffered' batches them in memory, 'spill' also writes overflow to disk.
+AUDIT_LOG_MODE = env('AUDIT_LOG_MODE', default='buffered')
+AUDIT_FLUSH_SIZE = env.int('AUDIT_FLUSH_SIZE', default=100)
+AUDIT_FLUSH_INTERVAL = env.float('AUDIT_FLUSH_INTERVAL', default=2.0)
+AUDIT_BUFFER_LIMIT = env.int('AUDIT_BUFFER_LIMIT', default=10000)
+AUDIT_SPILL_PATH = env('AUDIT_SPILL_PATH', default=os.path.join(BASE_DIR, 'media', 'audit-spill.jsonl'))
+# Records the database rejects even one at a time, with the error; not retried.
+AUDIT_DEAD_LETTER_PATH = env('AUDIT_DEAD_LETTER_PATH', default=os.path.join(BASE_DIR, 'media', 'audit-dead-letter.jsonl'))
 
 
 LOGIN_URL = '/login'
 
+DOCUMENTS_PAGE_SIZE = env.int('DOCUMENTS_PAGE_SIZE', default=25)
+AUDIT_LOGS_PAGE_SIZE = env.int('AUDIT_LOGS_PAGE_SIZE', default=50)
+
 
 
 
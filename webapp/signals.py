@@ -4,7 +4,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from webapp.models import Document
 from webapp.services.fga_client import fga_service
-from .services.embeddings import store_document_embeddings
+from .services.ingestion_queue import enqueue_document
 
 @receiver(post_save, sender=Document)
 def on_document_created(sender, instance: Document, created, **kwargs):
@@ -19,8 +19,8 @@ def on_document_created(sender, instance: Document, created, **kwargs):
                 print("Error adding FGA tuple:", e)
 
         
+            # Parsing and embedding run in `manage.py ingest_worker`, not in the upload request.
             try:
-                store_document_embeddings(instance)
-                print(f"Stored embeddings for doc:{instance.id}")
+                enqueue_document(instance, source_path=getattr(instance, "staged_upload_path", ""))
             except Exception as e:
-                print("Error storing embeddings:", e)
+                print("Error queueing ingestion:", e)
@@ -12,14 +12,24 @@ urlpatterns = [
     path('callback', views.callback, name='callback'),
 
     path('chat/', views.chat_documents, name='chat_documents'),
+    path('chat/stream/', views.chat_stream, name='chat_stream'),
+    path('conversations/', views.conversation_list, name='conversation_list'),
+    path('conversations/<int:conversation_id>/', views.conversation_detail, name='conversation_detail'),
     path('public/', views.public_documents, name='public_documents'),
     path('documents/', views.documents, name='documents'),
     path('logs/', views.user_audit_logs, name='user_audit_logs'),
+    path('logs/export/', views.export_audit_logs, name='export_audit_logs'),
 
     path('documents/upload/', views.upload_document, name='upload_document'),
+    path('documents/upload/bulk/', views.bulk_upload_documents, name='bulk_upload_documents'),
+    path('documents/jobs/<int:job_id>/', views.ingestion_job_status, name='ingestion_job_status'),
+    path('documents/batches/<str:batch_id>/', views.ingestion_batch_status, name='ingestion_batch_status'),
     
     path('pdf-page/<str:doc_id>/', views.pdf_page, name='pdf_page'),
     path('documents/<str:doc_id>/share/', views.share_document, name='share_document'),
+    path('documents/<str:doc_id>/reindex/', views.reindex_document_view, name='reindex_document'),
+
+    path('metrics', views.metrics_view, name='metrics'),
 
     path('login', views.login, name='login'),
     path('signup', views.signup, name='signup'),
@@ -1,7 +1,11 @@
 # Standard library
+import asyncio
+import hmac
 import json
 import os
+import time
 import uuid
+import zipfile
 import traceback
 from urllib.parse import quote_plus, unquote, urlencode
 
@@ -10,7 +14,9 @@ from django.conf import settings
 from django.contrib import auth, messages
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import loader
 from django.urls import reverse
@@ -19,29 +25,62 @@ from django.views.decorators.http import require_http_methods
 
 # Third-party
 from authlib.integrations.django_client import OAuth
-from asgiref.sync import async_to_sync
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from auth0_ai_langchain import FGARetriever
-from openfga_sdk.client.models import ClientBatchCheckItem
+from asgiref.sync import async_to_sync, sync_to_async
 
 # Local app imports
-from .forms import DocumentUploadForm
-from .models import Document, AuditLog
+from .forms import BulkUploadForm, DocumentUploadForm
+from .models import Document, AuditLog, Conversation, IngestionJob
+from .pagination import keyset_page
+from .services import conversations, metrics
+from .services.answer_cache import answer_cache
+from .services.audit import export_logs, serialize_logs
 from .services.chat_service import ChatService
-from .services.embeddings import get_vector_store
+from .services.embeddings import get_vector_store, sync_chunk_file_name
 from .services.fga_client import fga_service
+from .services.bulk_upload import FGAWriteError, bulk_upload
+from .services.ingestion_queue import batch_progress, discard_staged_file, stage_upload
+from .services.reindex import reindex_document
 from .services.search_service import search_documents
 from webapp.helpers.read_documents import read_documents
 
 
-embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
-chat_service = ChatService()
+chat_service = ChatService(answer_cache=answer_cache if settings.ANSWER_CACHE_ENABLED else None)
 
-@csrf_exempt
-@require_http_methods(["GET", "POST"])
-def chat_documents(request):
-    email = request.user.email
-    chat_history = request.session.get("chat_history", [])
+# Summary updates still running; the event loop only keeps weak references to tasks.
+_compactions = set()
+
+
+async def compact(conversation):
+    try:
+        await conversations.acompact(conversation, chat_service.asummarize)
+    except Exception as e:
+        print(f"[CHAT] Compaction error for conversation {conversation.pk}: {e}")
+        traceback.print_exc()
+
+
+async def remember_turn(conversation, question, answer, sources):
+    """
+    Append the turn to the conversation. Folding old turns into its summary
+    may call the LLM, so that runs as a background task and the response
+    does not wait for it. If it is cut short (e.g. the loop of a WSGI
+    request closes), the next turn compacts instead.
+    """
+    await conversations.aappend_turn(conversation, question, answer, sources)
+    if chat_service.condense_mode != "always":
+        task = asyncio.create_task(compact(conversation))
+        _compactions.add(task)
+        task.add_done_callback(_compactions.discard)
+
+
+async def handle_chat(request, template):
+    """
+    Shared async body of the chat views. Session, user and rendering go
+    through their async or thread-wrapped APIs so no sync DB access happens
+    on the event loop. History lives in the conversation tables; the
+    session only remembers which conversation is current.
+    """
+    user = await request.auser()
+    email = user.email
 
     if request.method == "POST":
         
@@ -56,59 +95,72 @@ def chat_documents(request):
                 return JsonResponse({"answer": "No question provided—try again."}, status=400)
 
             try:
-           
-                answer, source_str, _ = chat_service.get_response(email, question, chat_history)
-
-               
-                chat_history.append({"role": "user", "content": question})
-                chat_history.append({"role": "assistant", "content": f"{answer} {source_str}"})
-                request.session["chat_history"] = chat_history[-20:]
-                request.session.modified = True
-
-                return JsonResponse({"answer": answer, "sources": source_str})
+                conversation = await conversations.aget_current(
+                    request.session, user, data.get("conversation_id"), create=True
+                )
+                # What the LLM sees: a rolling summary plus the recent turns within the token budget.
+                summary, history = await conversations.aload_history(conversation)
+                answer, source_str, sources = await chat_service.aget_response(
+                    email, question, history, user_id=user.id, summary=summary
+                )
+                await remember_turn(conversation, question, answer, sources)
+
+                return JsonResponse({"answer": answer, "sources": source_str, "conversation_id": conversation.pk})
 
             except Exception as e:
                 print(f"[CHAT] Error: {e}")
-                import traceback
                 traceback.print_exc()
                 return JsonResponse({"answer": "Sorry, something went wrong. Try rephrasing!", "sources": ""}, status=500)
 
         else:
            
             question = request.POST.get("q", "").strip()
+            conversation = await conversations.aget_current(request.session, user, create=bool(question))
             if not question:
+                chat_history = await conversations.arecent_messages(conversation)
                 chat_history.append({"role": "system", "content": "No question provided—try again."})
-                request.session["chat_history"] = chat_history
-                request.session.modified = True
-                return render(request, "documents/chat.html", {"chat_history": chat_history})
+                return await sync_to_async(render)(request, template, {"chat_history": chat_history})
 
-           
-            answer, source_str, _ = chat_service.get_response(email, question, chat_history)
-            chat_history.append({"role": "user", "content": question})
-            chat_history.append({"role": "assistant", "content": f"{answer} {source_str}"})
-            request.session["chat_history"] = chat_history[-20:]
-            request.session.modified = True
-            return render(request, "documents/chat.html", {"chat_history": chat_history})
+            summary, history = await conversations.aload_history(conversation)
+            answer, source_str, sources = await chat_service.aget_response(
+                email, question, history, user_id=user.id, summary=summary
+            )
+            await remember_turn(conversation, question, answer, sources)
+            chat_history = await conversations.arecent_messages(conversation)
+            return await sync_to_async(render)(request, template, {"chat_history": chat_history})
+
+    conversation = await conversations.aget_current(request.session, user)
+    chat_history = await conversations.arecent_messages(conversation)
+    return await sync_to_async(render)(request, template, {"chat_history": chat_history})
 
-   
-    return render(request, "documents/chat.html", {"chat_history": chat_history})
 
-# @login_required
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+async def chat_documents(request):
+    return await handle_chat(request, "documents/chat.html")
+
+@login_required
 def documents(request):
     """
-    Renders upload page (GET) and handles document upload (AJAX POST).
+    Renders the documents the user can view, newest first, one page at a time.
     """
-
-    # documents = Document.objects.filter(user=request.user).order_by('-created_at')
-    all_docs = Document.objects.all().order_by("-created_at")
-    accessible_docs = [
-        doc for doc in all_docs
-        if fga_service.check_relation(request.user.email, doc.id, relation="viewer")
-    ]
+    try:
+        accessible_ids = fga_service.list_accessible_documents(request.user.email, relation="viewer")
+        accessible = Document.objects.filter(id__in=accessible_ids)
+    except Exception as e:
+        # Without FGA we can still show what the database knows: own and public documents.
+        print(f"[FGA] ListObjects failed, falling back to owned/public documents: {e}")
+        accessible = Document.objects.filter(Q(user=request.user) | Q(shared=True))
+
+    page, next_cursor = keyset_page(
+        accessible, request.GET.get("cursor"), page_size=settings.DOCUMENTS_PAGE_SIZE
+    )
 
     return render(request, "documents/documents.html", {
       
-        "documents": accessible_docs
+        "documents": page,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
     })
 
 @login_required
@@ -140,10 +192,36 @@ def upload_document(request):
         try:
             form = DocumentUploadForm(request.POST, request.FILES)
             if form.is_valid():
+                upload = request.FILES["file"]
                 document = form.save(commit=False)
                 document.user = request.user
                 document.shared = form.cleaned_data.get("shared", False)
-                document.save()
+                # Keep a local copy so ingestion does not download the file back from Cloudinary.
+                document.staged_upload_path = stage_upload(upload)
+                try:
+                    # Insert the row (post_save queues the ingestion job) before the storage
+                    # upload, so a worker parses the staged copy while Cloudinary receives the file.
+                    name = document.file.field.generate_filename(document, upload.name)
+                    document.file = name
+                    with transaction.atomic():
+                        document.save()
+                    try:
+                        document.file.save(name, upload, save=False)
+                        # Storage may pick another name; chunks stored meanwhile recorded the provisional one.
+                        Document.objects.filter(pk=document.pk).update(file=document.file.name)
+                        sync_chunk_file_name(document.pk)
+                    except Exception:
+                        # post_save wrote the owner tuple; it goes with the document.
+                        try:
+                            fga_service.remove_relation(request.user.email, document.id, relation="owner")
+                        except Exception as fga_err:
+                            print(f"[FGA ERROR] {fga_err}")
+                        # Deleting the document also drops its job; a running worker stops on its next write.
+                        document.delete()
+                        raise
+                except Exception:
+                    discard_staged_file(document.staged_upload_path)
+                    raise
                 print(f"[UPLOAD] File URL: {document.file.url}")
 
                 # Add public access if shared
@@ -158,10 +236,13 @@ def upload_document(request):
                             'file_url': document.file_url
                         }, status=500)
 
+                job = IngestionJob.objects.filter(document=document).first()
                 return JsonResponse({
                     "success": True,
                     "message": "Document uploaded successfully!",
-                    'file_url': document.file_url
+                    'file_url': document.file_url,
+                    "job_id": job.id if job else None,
+                    "job_status_url": reverse("ingestion_job_status", args=[job.id]) if job else None,
                 })
 
             else:
@@ -185,10 +266,86 @@ def upload_document(request):
     form = DocumentUploadForm()
     return render(request, "documents/upload.html", {
         "form": form,
+        "bulk_form": BulkUploadForm(),
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def bulk_upload_documents(request):
+    """
+    Upload many PDFs, or a ZIP archive of them, in one request. Ingestion
+    runs in the worker pool; poll the returned batch_status_url for progress.
+    """
+    form = BulkUploadForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({
+            "success": False,
+            "message": "Invalid form submission.",
+            "errors": form.errors
+        }, status=400)
+
+    try:
+        result = bulk_upload(
+            request.user,
+            files=form.cleaned_data["files"],
+            archive=form.cleaned_data["archive"],
+            shared=form.cleaned_data["shared"],
+        )
+    except (ValueError, zipfile.BadZipFile) as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except FGAWriteError as e:
+        return JsonResponse({"success": False, "message": f"Failed to update FGA, nothing was uploaded: {e}"}, status=500)
+
+    documents = result["documents"]
+    return JsonResponse({
+        "success": bool(documents),
+        "message": f"Uploaded {len(documents)} document(s), skipped {len(result['skipped'])}.",
+        "documents": [{"id": document.id, "title": document.title} for document in documents],
+        "skipped": result["skipped"],
+        "batch_id": result["batch_id"],
+        "batch_status_url": reverse("ingestion_batch_status", args=[result["batch_id"]]),
     })
 
 
 
+@login_required
+def ingestion_job_status(request, job_id):
+    """
+    Poll the ingestion progress of an uploaded document.
+    """
+    job = get_object_or_404(IngestionJob, id=job_id, document__user=request.user)
+    return JsonResponse({
+        "job_id": job.id,
+        "document_id": job.document_id,
+        "status": job.status,
+        "progress": job.progress,
+        "chunks_done": job.chunks_done,
+        "chunks_total": job.chunks_total,
+        "attempts": job.attempts,
+        "error": job.last_error if job.status == IngestionJob.Status.FAILED else "",
+    })
+
+
+@login_required
+def ingestion_batch_status(request, batch_id):
+    """
+    Aggregate ingestion progress of a bulk upload, plus the jobs that failed.
+    """
+    jobs = IngestionJob.objects.filter(batch_id=batch_id, document__user=request.user)
+    if not jobs.exists():
+        raise Http404
+    failed = jobs.filter(status=IngestionJob.Status.FAILED).values("document_id", "document__title", "last_error")
+    return JsonResponse({
+        "batch_id": batch_id,
+        **batch_progress(jobs),
+        "errors": [
+            {"document_id": job["document_id"], "title": job["document__title"], "error": job["last_error"]}
+            for job in failed
+        ],
+    })
+
+
 @login_required
 def share_document(request, doc_id):
     if request.method == "POST":
@@ -206,6 +363,29 @@ def share_document(request, doc_id):
             return JsonResponse({"success": False, "message": str(e)}, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def reindex_document_view(request, doc_id):
+    """
+    Bring one of the user's documents up to the current index version,
+    re-embedding only the chunks that changed. Runs within the request, like
+    `manage.py reindex --documents <id>`; use the command for many documents.
+    """
+    document = get_object_or_404(Document, id=doc_id, user=request.user)
+    if IngestionJob.objects.filter(
+        document=document, status__in=[IngestionJob.Status.QUEUED, IngestionJob.Status.RUNNING]
+    ).exists():
+        return JsonResponse({"success": False, "message": "The document is still being ingested."}, status=409)
+
+    try:
+        result = reindex_document(document)
+    except Exception as e:
+        print(f"[REINDEX] doc:{document.pk} failed: {e}")
+        traceback.print_exc()
+        return JsonResponse({"success": False, "message": f"Reindex failed: {e}"}, status=500)
+    return JsonResponse({"success": True, **result})
+
+
 @login_required
 def serve_pdf(request, filepath):
     filepath = unquote(filepath)  # decode URL-encoded characters
@@ -284,90 +464,181 @@ def index(request):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
-def dashboard_chat(request):
-    email = request.user.email
-   
-   
-    chat_history = request.session.get("chat_history", [])
+async def dashboard_chat(request):
+    return await handle_chat(request, "dashboard/index.html")
 
-    if request.method == "POST":
-      
-        
-        if request.content_type == "application/json":
-            try:
-                data = json.loads(request.body)
-                question = data.get("question", "").strip()
-            except json.JSONDecodeError:
-                return JsonResponse({"answer": "Invalid JSON."}, status=400)
 
-            if not question:
-                return JsonResponse({"answer": "No question provided—try again."}, status=400)
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-            try:
-               
-                answer, source_str, _ = chat_service.get_response(email, question, chat_history)
 
-              
-                chat_history.append({"role": "user", "content": question})
-                chat_history.append({"role": "assistant", "content": f"{answer} {source_str}"})
-                request.session["chat_history"] = chat_history[-20:]
-                request.session.modified = True
+@login_required
+@require_http_methods(["POST"])
+async def chat_stream(request):
+    """
+    Stream the answer as Server-Sent Events: "token" events while the LLM
+    generates, then "sources" and "done". The turn and the audit log are
+    saved once the whole answer has been sent. Serve under webapp/asgi.py.
+    """
+    try:
+        data = json.loads(request.body)
+        question = data.get("question", "").strip()
+    except json.JSONDecodeError:
+        return JsonResponse({"answer": "Invalid JSON."}, status=400)
+
+    if not question:
+        return JsonResponse({"answer": "No question provided—try again."}, status=400)
 
-                return JsonResponse({"answer": answer, "sources": source_str})
+    user = await request.auser()
+    # Resolved before streaming, so the session cookie goes out with the headers.
+    conversation = await conversations.aget_current(
+        request.session, user, data.get("conversation_id"), create=True
+    )
+    summary, history = await conversations.aload_history(conversation)
 
+    async def events():
+        final = None
+        start = time.perf_counter()
+        # The response headers are gone by now, so the stage timings travel in "done".
+        with metrics.collect_timings() as timings:
+            try:
+                async for event in chat_service.astream_answer(user.email, question, history, summary=summary):
+                    if event["type"] == "token":
+                        yield sse_event("token", {"text": event["text"]})
+                    else:
+                        final = event
             except Exception as e:
-                print(f"[CHAT] Error: {e}")
-                import traceback
+                print(f"[CHAT] Stream error: {e}")
                 traceback.print_exc()
-                return JsonResponse({"answer": "Sorry, something went wrong. Try rephrasing!", "sources": ""}, status=500)
+                yield sse_event("error", {"answer": "Sorry, something went wrong. Try rephrasing!"})
+                return
 
-        else:
-           
-            question = request.POST.get("q", "").strip()
-            if not question:
-                chat_history.append({"role": "system", "content": "No question provided—try again."})
-                request.session["chat_history"] = chat_history
-                request.session.modified = True
-                return render(request, "dashboard/index.html", {"chat_history": chat_history})
+        yield sse_event("sources", {"sources": final["source_str"], "document_ids": final["sources"]})
+        done = {"conversation_id": conversation.pk}
+        if metrics.ENABLED:
+            done["server_timing"] = metrics.server_timing_header(timings, time.perf_counter() - start)
+        yield sse_event("done", done)
+
+        await chat_service.alog_query(user.id, question, final["sources"])
+        await remember_turn(conversation, question, final["answer"], final["sources"])
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
-           
-            answer, source_str, _ = chat_service.get_response(email, question, chat_history)
-            chat_history.append({"role": "user", "content": question})
-            chat_history.append({"role": "assistant", "content": f"{answer} {source_str}"})
-            request.session["chat_history"] = chat_history[-20:]
-            request.session.modified = True
-            return render(request, "dashboard/index.html", {"chat_history": chat_history})
 
-   
-    return render(request, "dashboard/index.html", {"chat_history": chat_history})
+def _conversation_dict(conversation):
+    return {
+        "id": conversation.pk,
+        "title": conversation.title or "Untitled",
+        "updated_at": conversation.updated_at,
+    }
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def conversation_list(request):
+    """
+    GET: the user's conversations, most recently used first, and the current one.
+    POST {"title"}: start a new conversation and make it current.
+    """
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body or "{}")
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Invalid JSON."}, status=400)
+        conversation = Conversation.objects.create(user=request.user, title=str(data.get("title", ""))[:255])
+        request.session[conversations.SESSION_KEY] = conversation.pk
+        return JsonResponse(_conversation_dict(conversation), status=201)
+
+    recent = Conversation.objects.filter(user=request.user).order_by("-updated_at")[:100]
+    return JsonResponse({
+        "current": request.session.get(conversations.SESSION_KEY),
+        "conversations": [_conversation_dict(conversation) for conversation in recent],
+    })
+
+
+@login_required
+@require_http_methods(["GET", "POST", "DELETE"])
+def conversation_detail(request, conversation_id):
+    """
+    GET: open the conversation (it becomes current) with its latest messages.
+    POST {"title"}: rename it. DELETE: remove it and its messages.
+    """
+    conversation = get_object_or_404(Conversation, pk=conversation_id, user=request.user)
+
+    if request.method == "DELETE":
+        conversation.delete()
+        if request.session.get(conversations.SESSION_KEY) == conversation_id:
+            del request.session[conversations.SESSION_KEY]
+        return JsonResponse({"success": True})
 
+    if request.method == "POST":
+        try:
+            title = str(json.loads(request.body).get("title", "")).strip()
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON."}, status=400)
+        Conversation.objects.filter(pk=conversation.pk).update(title=title[:255])
+        conversation.title = title[:255]
+        return JsonResponse(_conversation_dict(conversation))
+
+    request.session[conversations.SESSION_KEY] = conversation.pk
+    messages = list(
+        conversation.messages.order_by("-id")
+        .values("role", "content", "sources", "created_at")[:settings.CHAT_DISPLAY_MESSAGES]
+    )
+    messages.reverse()
+    return JsonResponse({**_conversation_dict(conversation), "messages": messages})
 
 
 @login_required
 def user_audit_logs(request):
     """
-    Render audit logs with document titles for the current user.
+    Render one page of the current user's audit log, newest first, with document titles.
     """
-    logs = AuditLog.objects.filter(user=request.user).order_by('-timestamp')
-    logs_data = []
+    logs, next_cursor = keyset_page(
+        AuditLog.objects.filter(user=request.user),
+        request.GET.get("cursor"),
+        page_size=settings.AUDIT_LOGS_PAGE_SIZE,
+        field="timestamp",
+    )
 
-    for log in logs:
-      
-        documents = Document.objects.filter(id__in=log.document_ids)
-        doc_info = [{"id": doc.id, "title": doc.title} for doc in documents]
+    return render(request, "Logs/index.html", {
+        "logs_data": serialize_logs(logs),
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
+    })
 
-        log_dict = {
-            "timestamp": log.timestamp.isoformat(),
-            "question": log.question,
-            "documents": doc_info,  
-            "agent_id": log.agent_id,
-        }
 
-        logs_data.append(log_dict)
+@login_required
+def export_audit_logs(request):
+    """
+    Stream the current user's whole audit log as CSV (default) or NDJSON (?format=ndjson).
+    """
+    fmt = request.GET.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return JsonResponse({"error": "format must be csv or ndjson"}, status=400)
+
+    logs = AuditLog.objects.filter(user=request.user).order_by("-timestamp", "-pk")
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(export_logs(logs, fmt), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="audit-log.{fmt}"'
+    return response
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. 404 unless METRICS_ENABLED; when METRICS_TOKEN
+    is set the scraper must send it as a bearer token.
+    """
+    if not metrics.ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    return render(request, "Logs/index.html", {"logs_data": logs_data})
 
 def page_not_found_view(request, *args, **kwargs):
     template = loader.get_template('404.html')